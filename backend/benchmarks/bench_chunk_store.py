@@ -0,0 +1,128 @@
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from kb_service.chunk_store import ChunkStoreBuilder
+from kb_service.splitter import FastTextSplitter
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+WORDS = ["болт", "гайка", "шайба", "ГОСТ", "7798-70", "сталь", "Ст3", "допуск", "резьба", "М12х1.5",
+         "чертеж", "спецификация", "материал", "покрытие", "давление", "PN16", "DN50", "фланец"]
+
+
+def generate_text(n_chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))) + ". "
+        if rng.random() < 0.1:
+            sentence += "\n"
+        if rng.random() < 0.03:
+            sentence += "\n"
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def time_split(splitter, text: str):
+    start = time.perf_counter()
+    chunks = splitter.split_text(text)
+    return time.perf_counter() - start, chunks
+
+
+def measure(build):
+    gc.collect()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare dict-list chunk storage and langchain splitting with ChunkStore and FastTextSplitter.")
+    parser.add_argument("--chars", type=int, default=20_000_000, help="Size of the synthetic document in characters.")
+    parser.add_argument("--files", type=int, default=200, help="Number of files the chunks are spread across.")
+    args = parser.parse_args()
+
+    text = generate_text(args.chars)
+    separators = ["\n\n", "\n", ". ", " "]
+    langchain_time, langchain_chunks = time_split(RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=300, separators=separators + [""]), text)
+    fast_splitter = FastTextSplitter(chunk_size=1500, chunk_overlap=300, separators=separators)
+    fast_time, fast_chunks = time_split(fast_splitter, text)
+
+    chunks = fast_chunks
+    file_names = [f"Спецификация_изделия_{i:04d}_ревизия_final2.pdf" for i in range(args.files)]
+    # Split the corpus into per-file segments so both layouts see the same files.
+    segment_size = len(text) // args.files + 1
+    segments = [text[i:i + segment_size] for i in range(0, len(text), segment_size)]
+
+    def build_dicts():
+        chunk_dicts = []
+        for i, segment in enumerate(segments):
+            file_id = f"/disk/specs/{file_names[i]}"
+            for chunk_text in fast_splitter.split_text(segment):
+                chunk_dicts.append({'text': chunk_text, 'file_id': file_id, 'file_name': file_names[i]})
+        return chunk_dicts
+
+    def build_store():
+        builder = ChunkStoreBuilder()
+        for i, segment in enumerate(segments):
+            builder.add_spans(f"/disk/specs/{file_names[i]}", file_names[i], segment, fast_splitter.split_spans(segment))
+        return builder.build()
+
+    # Rebuilds copy the rows of unchanged files from the previous store.
+    def reuse_rows(store):
+        builder = ChunkStoreBuilder()
+        for i in range(len(segments)):
+            file_id = f"/disk/specs/{file_names[i]}"
+            builder.add_rows(store, file_id, file_names[i], store.rows_for_file(file_id))
+        return builder.build()
+
+    del langchain_chunks, chunks
+    chunk_dicts, dict_time, dict_current, dict_peak = measure(build_dicts)
+    chunk_count = len(chunk_dicts)
+    del chunk_dicts
+    store, store_time, store_current, store_peak = measure(build_store)
+    # Any UTF-8 arena has to encode the text once; this is the floor of the store build.
+    start = time.perf_counter()
+    for segment in segments:
+        segment.encode('utf-8')
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    reuse_rows(store)
+    reuse_time = time.perf_counter() - start
+
+    results = {
+        "document_chars": len(text),
+        "chunks": chunk_count,
+        "split_seconds": {"langchain_recursive": round(langchain_time, 3), "fast_text_splitter": round(fast_time, 3)},
+        "split_speedup": round(langchain_time / fast_time, 1) if fast_time else None,
+        "split_and_store_seconds": {"dict_list": round(dict_time, 3), "chunk_store": round(store_time, 3)},
+        "utf8_encode_seconds": round(encode_time, 3),
+        "reuse_rows_seconds": round(reuse_time, 3),
+        "retained_bytes": {"dict_list": dict_current, "chunk_store": store_current},
+        "peak_bytes": {"dict_list": dict_peak, "chunk_store": store_peak},
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.codec import JsonCodec, OrjsonCodec, ZlibCompressor, ZstdCompressor, decompress_text, orjson, zstandard
+
+WORDS = ["болт", "гайка", "шайба", "ГОСТ", "7798-70", "сталь", "Ст3", "допуск", "резьба", "М12х1.5",
+         "чертеж", "спецификация", "материал", "покрытие", "давление", "PN16", "DN50", "фланец"]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+
+def make_samples(rng: random.Random, history_messages: int, answer_chars: int) -> dict:
+    request = {"message": sentence(rng, 25), "conversation_id": "0b6f9f7e-4f7c-4c55-9d0e-4b8e4c3a1f10", "file_id": None, "use_agent_mode": True}
+    thoughts = [{"type": "log", "content": sentence(rng, rng.randint(5, 30))} for _ in range(40)]
+    answer = ""
+    while len(answer) < answer_chars:
+        answer += sentence(rng, rng.randint(8, 25)) + (" " if rng.random() < 0.8 else "\n\n")
+    history = []
+    for i in range(history_messages):
+        if i % 2 == 0:
+            history.append({"role": "user", "parts": [sentence(rng, 20)]})
+        else:
+            history.append({"role": "model", "parts": [answer[:rng.randint(500, 4000)]], "thinking_steps": thoughts[:rng.randint(5, 40)]})
+    return {"request": request, "thoughts": thoughts, "history": history, "answer": answer}
+
+
+def best_of(fn, repeat: int, number: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def measure(encode, decode, value, repeat: int, number: int) -> dict:
+    encoded = encode(value)
+    return {
+        "bytes": len(encoded.encode('utf-8')),
+        "encode_us": round(best_of(lambda: encode(value), repeat, number) * 1e6, 1),
+        "decode_us": round(best_of(lambda: decode(encoded), repeat, number) * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare stdlib json as used before with the codec layer for job payloads, thoughts, history files and compressed answers.")
+    parser.add_argument("--history-messages", type=int, default=60, help="Messages in the synthetic chat history.")
+    parser.add_argument("--answer-chars", type=int, default=20_000, help="Size of the synthetic final answer.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    samples = make_samples(random.Random(0), args.history_messages, args.answer_chars)
+    codecs = {"json": JsonCodec()}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec()
+    repeat, number = args.repeat, args.number
+
+    # Before: the request was dumped to a JSON string and embedded in the queued JSON entry.
+    def legacy_job_encode(request):
+        return json.dumps({"job_id": "job:1", "trace_id": "abc", "payload": json.dumps(request), "enqueued_at": 1.0})
+
+    def legacy_job_decode(raw):
+        job = json.loads(raw)
+        return json.loads(job["payload"])
+
+    results = {
+        "job_queue_entry": {"legacy_json": measure(legacy_job_encode, legacy_job_decode, samples["request"], repeat, number)},
+        "thoughts": {"legacy_json": measure(json.dumps, json.loads, samples["thoughts"], repeat, number)},
+        "history_file": {"legacy_json_indent2": measure(lambda value: json.dumps(value, indent=2, ensure_ascii=False), json.loads, samples["history"], repeat, max(1, number // 10))},
+    }
+    for name, codec in codecs.items():
+        results["job_queue_entry"][name] = measure(
+            lambda request: codec.dumps({"job_id": "job:1", "trace_id": "abc", "payload": request, "enqueued_at": 1.0}),
+            lambda raw: codec.loads(raw)["payload"], samples["request"], repeat, number)
+        results["thoughts"][name] = measure(codec.dumps, codec.loads, samples["thoughts"], repeat, number)
+        results["history_file"][name] = measure(codec.dumps, codec.loads, samples["history"], repeat, max(1, number // 10))
+
+    compressors = {"zlib": ZlibCompressor()}
+    if zstandard is not None:
+        compressors["zstd"] = ZstdCompressor()
+    answer = samples["answer"]
+    results["final_answer"] = {"raw_bytes": len(answer.encode('utf-8'))}
+    for name, compressor in compressors.items():
+        results["final_answer"][name] = measure(compressor.compress, decompress_text, answer, repeat, max(1, number // 10))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
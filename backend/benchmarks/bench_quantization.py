@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from kb_service.bm25 import BM25Index
+from kb_service.chunk_store import ChunkStore
+from kb_service.generation import VECTOR_STORAGES, IndexGeneration, build_vector_index
+
+
+# Embeddings of real chunks are clustered by topic; queries land near existing chunks.
+def make_vectors(rng: np.random.Generator, count: int, dim: int, clusters: int) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def make_generation(embeddings: np.ndarray, storage: str) -> IndexGeneration:
+    row_vector = np.arange(len(embeddings), dtype=np.int64)
+    return IndexGeneration(0, {}, ChunkStore.empty(), BM25Index(), embeddings, build_vector_index(embeddings, storage), row_vector=row_vector)
+
+
+def recall(results, truth, top_k: int) -> float:
+    found = sum(len({row for row, _ in hits} & set(expected[:top_k].tolist())) for hits, expected in zip(results, truth))
+    return found / (len(truth) * top_k)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare recall, latency and memory of float32, float16 and int8 vector storage with exact re-ranking.")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Number of synthetic chunk embeddings.")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (models/embedding-001 returns 768).")
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20, help="Vector hits fetched per query, as in hybrid search with MMR.")
+    parser.add_argument("--rerank-factors", default="0,1,2,4,8", help="Candidates per result re-scored exactly; 0 keeps the quantized distances.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = make_vectors(rng, args.vectors, args.dim, args.clusters)
+    queries = embeddings[rng.integers(0, args.vectors, args.queries)] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    rerank_factors = [int(factor) for factor in args.rerank_factors.split(',')]
+
+    exact = make_generation(embeddings, "float32")
+    truth = [np.array([row for row, _ in hits]) for hits in exact.vector_search_many(queries, args.top_k, None)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "embeddings.npy")
+        np.save(path, embeddings)
+        mapped = np.load(path, mmap_mode='r')
+        results = {"vectors": args.vectors, "dim": args.dim, "top_k": args.top_k, "storages": {}}
+        for storage in VECTOR_STORAGES:
+            generation = make_generation(mapped if storage != "float32" else embeddings, storage)
+            entry = {"bytes_per_million_vectors": round(generation.vector_bytes / args.vectors * 1_000_000)}
+            for factor in rerank_factors if generation.is_quantized else [1]:
+                start = time.perf_counter()
+                hits = [generation.vector_search_many(query[None, :], args.top_k, None, factor)[0] for query in queries]
+                elapsed = time.perf_counter() - start
+                entry[f"rerank_{factor}" if generation.is_quantized else "exact"] = {
+                    "recall": round(recall(hits, truth, args.top_k), 4),
+                    "query_ms": round(elapsed / len(queries) * 1000, 3),
+                }
+            results["storages"][storage] = entry
+            del generation
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
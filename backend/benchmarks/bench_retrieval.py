@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import faiss
+import google.generativeai as genai
+import numpy as np
+
+from benchmarks.corpus import STANDARDS, WORDS, generate_corpus, make_document, make_text
+from kb_service.bm25 import BM25Index
+from kb_service.chunk_store import ChunkStoreBuilder
+from kb_service.connector import MockConnector
+from kb_service.generation import IndexGeneration
+from kb_service.indexer import KnowledgeBaseIndexer
+from kb_service.parser import parse_document
+from kb_service.splitter import FastTextSplitter
+
+logger = logging.getLogger("bench_retrieval")
+
+PARSE_MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "zip": "application/zip",
+    "txt": "text/plain",
+    "csv": "text/csv",
+}
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+BM25_BYTES_PER_POSTING = 100
+
+
+def fake_vector(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def install_fake_embeddings(dim: int) -> None:
+    def embed_content(model, content, task_type=None, **kwargs):
+        if isinstance(content, str):
+            return {'embedding': fake_vector(content, dim).tolist()}
+        return {'embedding': [fake_vector(text, dim).tolist() for text in content]}
+    genai.embed_content = embed_content
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def available_memory_bytes() -> int:
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    data = np.asarray(samples) * 1000
+    return {
+        "count": int(data.size),
+        "p50_ms": round(float(np.percentile(data, 50)), 3),
+        "p95_ms": round(float(np.percentile(data, 95)), 3),
+        "p99_ms": round(float(np.percentile(data, 99)), 3),
+        "mean_ms": round(float(data.mean()), 3),
+    }
+
+
+def _child(target: Callable, args: tuple, queue: multiprocessing.Queue) -> None:
+    try:
+        result = target(*args)
+        result["peak_rss_bytes"] = peak_rss_bytes()
+        queue.put(result)
+    except BaseException as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+# Every scenario runs in a fresh forked process so peak RSS belongs to that scenario alone
+# and an out-of-memory kill at the largest scales does not take the whole run down.
+def run_isolated(target: Callable, *args) -> Dict:
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(target, args, queue))
+    process.start()
+    process.join()
+    if not queue.empty():
+        return queue.get()
+    return {"error": f"process exited with code {process.exitcode}"}
+
+
+def bench_parse(docs_per_kind: int, doc_kb: int, seed: int) -> Dict:
+    rng = random.Random(seed)
+    results = {}
+    for kind, mime_type in PARSE_MIME_TYPES.items():
+        documents = [make_document(kind, rng, doc_kb * 1024) for _ in range(docs_per_kind)]
+        total_bytes = sum(len(d) for d in documents)
+        start = time.perf_counter()
+        total_chars = sum(len(parse_document(f"bench_{i}.{kind}", content, mime_type)) for i, content in enumerate(documents))
+        elapsed = time.perf_counter() - start
+        results[mime_type] = {
+            "documents": docs_per_kind,
+            "input_bytes": total_bytes,
+            "extracted_chars": total_chars,
+            "seconds": round(elapsed, 4),
+            "docs_per_second": round(docs_per_kind / elapsed, 2),
+            "mb_per_second": round(total_bytes / elapsed / 1e6, 3),
+        }
+    return results
+
+
+def bench_split(chars: int, seed: int) -> Dict:
+    text = make_text(random.Random(seed), chars)
+    splitter = FastTextSplitter(chunk_size=1500, chunk_overlap=300, separators=["\n\n", "\n", ". ", " "])
+    start = time.perf_counter()
+    spans = list(splitter.split_spans(text))
+    elapsed = time.perf_counter() - start
+    return {
+        "chars": len(text),
+        "chunks": len(spans),
+        "seconds": round(elapsed, 4),
+        "mchars_per_second": round(len(text) / elapsed / 1e6, 3),
+    }
+
+
+def bench_build(files: int, size_kb: int, dim: int, seed: int) -> Dict:
+    install_fake_embeddings(dim)
+    with tempfile.TemporaryDirectory() as corpus_dir, tempfile.TemporaryDirectory() as index_dir:
+        generate_corpus(corpus_dir, files=files, size_kb=size_kb, seed=seed)
+        os.environ["MOCK_DISK_PATH"] = corpus_dir
+        os.environ["KB_INDEX_DIR"] = index_dir
+        indexer = KnowledgeBaseIndexer(connector=MockConnector())
+        baseline_rss = peak_rss_bytes()
+        start = time.perf_counter()
+        indexer.build_index()
+        cold_seconds = time.perf_counter() - start
+        cold_peak_rss = peak_rss_bytes()
+        start = time.perf_counter()
+        indexer.build_index()
+        warm_seconds = time.perf_counter() - start
+        return {
+            "files": len(indexer.files),
+            "chunks": len(indexer.chunks),
+            "cold_seconds": round(cold_seconds, 3),
+            "warm_parse_cache_seconds": round(warm_seconds, 3),
+            "rss_before_build_bytes": baseline_rss,
+            "cold_build_peak_rss_bytes": cold_peak_rss,
+        }
+
+
+def estimate_search_bytes(chunks: int, dim: int, chunk_chars: int) -> int:
+    vectors = 2 * chunks * dim * 4
+    arena = chunks * chunk_chars * 2
+    bm25 = chunks * min(len(set(WORDS)), chunk_chars // 8) * BM25_BYTES_PER_POSTING
+    return vectors + arena + bm25
+
+
+def build_synthetic_generation(chunks: int, dim: int, chunk_chars: int, chunks_per_file: int, seed: int) -> IndexGeneration:
+    rng = random.Random(seed)
+    pool = [make_text(rng, chunk_chars) for _ in range(min(chunks, 5000))]
+    builder = ChunkStoreBuilder()
+    bm25 = BM25Index()
+    files = {}
+    for row in range(chunks):
+        file_idx = row // chunks_per_file
+        file_id = f"synthetic/file_{file_idx:07d}.pdf"
+        if file_id not in files:
+            files[file_id] = {"id": file_id, "name": os.path.basename(file_id), "mime_type": "application/pdf"}
+        text = f"{pool[row % len(pool)]} Поз. {row}"
+        bm25.add_document(row, text)
+        builder.add(file_id, files[file_id]["name"], text, f"стр. {row % chunks_per_file + 1}")
+    embeddings = np.random.default_rng(seed).standard_normal((chunks, dim), dtype=np.float32)
+    index = faiss.IndexFlatL2(dim)
+    index.add(embeddings)
+    return IndexGeneration(1, files, builder.build(), bm25, embeddings, index)
+
+
+def bench_search(chunks: int, dim: int, chunk_chars: int, chunks_per_file: int, queries: int, seed: int) -> Dict:
+    install_fake_embeddings(dim)
+    start = time.perf_counter()
+    generation = build_synthetic_generation(chunks, dim, chunk_chars, chunks_per_file, seed)
+    setup_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as index_dir:
+        os.environ["MOCK_DISK_PATH"] = index_dir
+        os.environ["KB_INDEX_DIR"] = index_dir
+        indexer = KnowledgeBaseIndexer(connector=MockConnector())
+    indexer.generation = generation
+
+    rng = random.Random(seed)
+    query_texts = [rng.choice(STANDARDS) if i % 4 == 0 else " ".join(rng.sample(WORDS, 3)) for i in range(queries)]
+    file_ids = list(generation.files)
+    result = {"chunks": chunks, "files": len(file_ids), "setup_seconds": round(setup_seconds, 3), "chunk_store_bytes": generation.chunks.nbytes}
+    for mode in SEARCH_MODES:
+        for scope in ("global", "file"):
+            samples = []
+            for query in query_texts:
+                file_id = rng.choice(file_ids) if scope == "file" else None
+                start = time.perf_counter()
+                indexer.search(query, top_k=5, file_id=file_id, mode=mode)
+                samples.append(time.perf_counter() - start)
+            result[f"{mode}_{scope}"] = latency_stats(samples)
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline kb_service benchmark: parsing, splitting, build_index and search latency at scale.")
+    parser.add_argument("--scales", default="10000,100000,1000000", help="Chunk counts for the search benchmark.")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (embedding-001 is 768).")
+    parser.add_argument("--chunk-chars", type=int, default=1500)
+    parser.add_argument("--chunks-per-file", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--parse-docs", type=int, default=10, help="Documents per MIME type for the parse benchmark.")
+    parser.add_argument("--parse-doc-kb", type=int, default=64)
+    parser.add_argument("--split-chars", type=int, default=20_000_000)
+    parser.add_argument("--build-files", type=int, default=120)
+    parser.add_argument("--build-size-kb", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Run search scales even when they are estimated not to fit in memory.")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "dim": args.dim,
+            "chunk_chars": args.chunk_chars,
+        },
+    }
+    logger.info("Benchmarking parse_document per MIME type...")
+    results["parse"] = run_isolated(bench_parse, args.parse_docs, args.parse_doc_kb, args.seed)
+    logger.info("Benchmarking FastTextSplitter...")
+    results["split"] = run_isolated(bench_split, args.split_chars, args.seed)
+    logger.info("Benchmarking build_index...")
+    results["build_index"] = run_isolated(bench_build, args.build_files, args.build_size_kb, args.dim, args.seed)
+
+    results["search"] = {}
+    for chunks in [int(scale) for scale in args.scales.split(",") if scale]:
+        estimate = estimate_search_bytes(chunks, args.dim, args.chunk_chars)
+        available = available_memory_bytes()
+        if estimate > available and not args.force:
+            logger.warning(f"Skipping {chunks} chunks: estimated {estimate / 1e9:.1f} GB needed, {available / 1e9:.1f} GB available.")
+            results["search"][str(chunks)] = {"skipped": "insufficient memory", "estimated_bytes": estimate, "available_bytes": available}
+            continue
+        logger.info(f"Benchmarking search over {chunks} chunks...")
+        results["search"][str(chunks)] = {"estimated_bytes": estimate, **run_isolated(bench_search, chunks, args.dim, args.chunk_chars, args.chunks_per_file, args.queries, args.seed)}
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import random
+import zipfile
+from typing import Dict, List, Sequence
+
+from docx import Document
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KINDS = ("txt", "csv", "docx", "xlsx", "pdf", "zip")
+MANIFEST_NAME = "manifest.json"
+
+WORDS = (
+    "проект здание фундамент перекрытие колонна балка армирование бетон класс прочности нагрузка "
+    "расчёт узел сопряжение стена кровля фасад лестница отметка ось пролёт шаг монтаж сварка "
+    "болт анкер спецификация ведомость чертёж лист изменение согласование заказчик подрядчик "
+    "трубопровод вентиляция отопление водоснабжение канализация электроснабжение кабель щит "
+    "уклон гидроизоляция утеплитель толщина марка сталь профиль допуск испытание приёмка"
+).split()
+LATIN_WORDS = (
+    "project building foundation slab column beam reinforcement concrete strength class load "
+    "calculation joint wall roof facade stair level axis span pitch assembly welding bolt anchor "
+    "specification sheet drawing revision approval customer contractor pipeline ventilation heating "
+    "water supply sewage power cable panel slope waterproofing insulation thickness grade steel"
+).split()
+STANDARDS = ("ГОСТ 2.301-68", "ГОСТ 21.501-2018", "СП 63.13330.2018", "СНиП 2.01.07-85", "ГОСТ 27751-2014", "СП 20.13330.2016")
+LATIN_STANDARDS = ("GOST 2.301-68", "GOST 21.501-2018", "SP 63.13330.2018", "SNiP 2.01.07-85", "GOST 27751-2014", "SP 20.13330.2016")
+
+
+def make_text(rng: random.Random, chars: int, words: Sequence[str] = WORDS, standards: Sequence[str] = STANDARDS) -> str:
+    paragraphs: List[str] = []
+    total = 0
+    while total < chars:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 16)))
+            if rng.random() < 0.2:
+                sentence += f" ({rng.choice(standards)})"
+            sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+def make_docx(text: str) -> bytes:
+    document = Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_xlsx(sheets: Dict[str, List[List]]) -> bytes:
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def make_csv(rows: List[List]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Minimal single-font PDF writer. Standard Type1 fonts only cover Latin-1, so PDF pages are
+# generated from the Latin vocabulary; that is enough for pypdf to extract real text.
+def make_pdf(pages: List[str], line_chars: int = 90, lines_per_page: int = 60) -> bytes:
+    page_streams = []
+    for page_text in pages:
+        lines: List[str] = []
+        for paragraph in page_text.split("\n\n"):
+            words, current = paragraph.split(), ""
+            for word in words:
+                if current and len(current) + len(word) + 1 > line_chars:
+                    lines.append(current)
+                    current = word
+                else:
+                    current = f"{current} {word}" if current else word
+            if current:
+                lines.append(current)
+            lines.append("")
+        body = " Tj T* ".join(f"({_pdf_escape(line)})" for line in lines[:lines_per_page])
+        page_streams.append(f"BT /F1 10 Tf 12 TL 40 800 Td {body} Tj ET".encode('latin-1', 'replace'))
+
+    page_count = len(page_streams)
+    font_obj = 3 + 2 * page_count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(page_count))}] /Count {page_count} >>".encode(),
+    ]
+    for i, stream in enumerate(page_streams):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 {font_obj} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode())
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_zip(entries: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _table_rows(rng: random.Random, rows: int) -> List[List]:
+    header = ["Позиция", "Обозначение", "Наименование", "Кол-во", "Масса, кг"]
+    return [header] + [
+        [i + 1, f"{rng.choice(['КЖ', 'КМ', 'АР', 'ОВ'])}-{rng.randint(1, 99)}", " ".join(rng.choice(WORDS) for _ in range(4)), rng.randint(1, 200), round(rng.uniform(0.5, 900), 2)]
+        for i in range(rows)
+    ]
+
+
+def make_document(kind: str, rng: random.Random, size_bytes: int) -> bytes:
+    if kind == "txt":
+        return make_text(rng, size_bytes // 2).encode('utf-8')
+    if kind == "csv":
+        return make_csv(_table_rows(rng, max(1, size_bytes // 120)))
+    if kind == "docx":
+        return make_docx(make_text(rng, size_bytes // 2))
+    if kind == "xlsx":
+        rows = max(1, size_bytes // 120)
+        return make_xlsx({f"Лист{i + 1}": _table_rows(rng, rows // 2 or 1) for i in range(2)})
+    if kind == "pdf":
+        pages = max(1, size_bytes // 4000)
+        return make_pdf([make_text(rng, 4000, LATIN_WORDS, LATIN_STANDARDS) for _ in range(pages)])
+    if kind == "zip":
+        inner_kinds = ["txt", "docx", "xlsx", "pdf"]
+        return make_zip({f"вложение_{i + 1}.{inner}": make_document(inner, rng, size_bytes // len(inner_kinds)) for i, inner in enumerate(inner_kinds)})
+    raise ValueError(f"Unknown document kind: {kind}")
+
+
+def generate_corpus(out_dir: str, files: int = 50, size_kb: int = 32, kinds: Sequence[str] = DEFAULT_KINDS, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"seed": seed, "files": [], "queries": []}
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        section = rng.choice(["КЖ", "КМ", "АР", "ОВ", "ВК", "ЭОМ"])
+        name = f"{section}/документ_{i + 1:05d}.{kind}"
+        path = os.path.join(out_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = make_document(kind, rng, size_kb * 1024)
+        with open(path, 'wb') as f:
+            f.write(content)
+        manifest["files"].append({"id": name, "kind": kind, "bytes": len(content)})
+
+    for standard in STANDARDS:
+        manifest["queries"].append(f"Какие требования {standard} применяются в проекте?")
+    for _ in range(20):
+        manifest["queries"].append(f"Найди информацию про {' '.join(rng.sample(WORDS, 3))}")
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"Generated {files} documents ({sum(f['bytes'] for f in manifest['files'])} bytes) in {out_dir}.")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic document corpus for MockConnector (point MOCK_DISK_PATH at the output directory).")
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=32, help="Approximate amount of text per document.")
+    parser.add_argument("--kinds", default=",".join(DEFAULT_KINDS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    generate_corpus(args.out_dir, args.files, args.size_kb, [kind for kind in args.kinds.split(",") if kind], args.seed)
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import datetime
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import grpc
+import numpy as np
+import uvicorn
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from google.ai.generativelanguage_v1beta.types import generative_service as gs
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+GENERATIVE_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+FILLER_WORDS = "ответ согласно документации проекта требования нормативы расчёт узел конструкция указано в разделе".split()
+FINISH_REASON_STOP = 1
+
+
+class FakeSettings:
+    def __init__(self) -> None:
+        self.generate_latency_ms = float(os.getenv("FAKE_GENERATE_LATENCY_MS", 400))
+        self.embed_latency_ms = float(os.getenv("FAKE_EMBED_LATENCY_MS", 60))
+        self.embed_item_latency_ms = float(os.getenv("FAKE_EMBED_ITEM_LATENCY_MS", 0.5))
+        self.controller_latency_ms = float(os.getenv("FAKE_CONTROLLER_LATENCY_MS", 300))
+        self.jitter = float(os.getenv("FAKE_LATENCY_JITTER", 0.2))
+        self.tokens_per_second = float(os.getenv("FAKE_TOKENS_PER_SECOND", 150))
+        self.output_tokens = int(os.getenv("FAKE_OUTPUT_TOKENS", 200))
+        self.tool_call_rate = float(os.getenv("FAKE_TOOL_CALL_RATE", 0.7))
+        self.approve_rate = float(os.getenv("FAKE_CONTROLLER_APPROVE_RATE", 0.8))
+        self.embedding_dim = int(os.getenv("FAKE_EMBEDDING_DIM", 768))
+        self.error_rate = float(os.getenv("FAKE_ERROR_RATE", 0.0))
+
+
+settings = FakeSettings()
+stats: Dict[str, int] = {"generate": 0, "tool_calls": 0, "embed_requests": 0, "embed_texts": 0, "controller": 0, "errors": 0}
+app = FastAPI()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def jittered(ms: float) -> float:
+    return max(0.0, ms * random.uniform(1 - settings.jitter, 1 + settings.jitter)) / 1000
+
+
+async def simulate_generation(base_latency_ms: float, output_tokens: int) -> None:
+    await asyncio.sleep(jittered(base_latency_ms) + output_tokens / settings.tokens_per_second)
+
+
+def should_fail() -> bool:
+    if settings.error_rate and random.random() < settings.error_rate:
+        stats["errors"] += 1
+        return True
+    return False
+
+
+def fake_embedding(text: str) -> List[float]:
+    seed = int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(settings.embedding_dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def filler_text(tokens: int) -> str:
+    text = " ".join(random.choice(FILLER_WORDS) for _ in range(max(1, int(tokens * 0.75))))
+    return text[0].upper() + text[1:] + "."
+
+
+def _parts_text(parts: List[Dict]) -> str:
+    return " ".join(part.get("text", "") for part in parts)
+
+
+def _tool_call(name: str, query: str) -> Dict:
+    if name == "search_knowledge_base_many":
+        args = {"queries": [query, query[: len(query) // 2] or query]}
+    elif name == "analyze_document":
+        args = {"file_id": "", "query": query}
+    elif name == "list_all_files_summary":
+        args = {}
+    else:
+        args = {"query": query}
+    return {"function_call": {"name": name, "args": args}}
+
+
+# The Python SDK only has an asyncio transport for gRPC, so the Gemini side is served over
+# gRPC with a self-signed certificate; clients trust it via GRPC_DEFAULT_SSL_ROOTS_FILE_PATH.
+async def generate_content(request: gs.GenerateContentRequest, context: grpc.aio.ServicerContext) -> gs.GenerateContentResponse:
+    if should_fail():
+        await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Resource has been exhausted (fake).")
+    stats["generate"] += 1
+    body = gs.GenerateContentRequest.to_dict(request)
+    contents = body.get("contents", [])
+    prompt_tokens = sum(estimate_tokens(_parts_text(c.get("parts", []))) for c in contents)
+    last_parts = contents[-1].get("parts", []) if contents else []
+    answering_tool = any("function_response" in part for part in last_parts)
+    function_names = [d["name"] for tool in body.get("tools", []) for d in tool.get("function_declarations", [])]
+
+    if function_names and not answering_tool and random.random() < settings.tool_call_rate:
+        stats["tool_calls"] += 1
+        part = _tool_call(random.choice(function_names), _parts_text(last_parts)[:200] or "документация")
+        output_tokens = 20
+    else:
+        output_tokens = max(1, int(settings.output_tokens * random.uniform(1 - settings.jitter, 1 + settings.jitter)))
+        part = {"text": filler_text(output_tokens)}
+
+    await simulate_generation(settings.generate_latency_ms, output_tokens)
+    return gs.GenerateContentResponse({
+        "candidates": [{"content": {"role": "model", "parts": [part]}, "finish_reason": FINISH_REASON_STOP, "index": 0}],
+        "usage_metadata": {"prompt_token_count": prompt_tokens, "candidates_token_count": output_tokens, "total_token_count": prompt_tokens + output_tokens},
+    })
+
+
+async def embed_content(request: gs.EmbedContentRequest, context: grpc.aio.ServicerContext) -> gs.EmbedContentResponse:
+    if should_fail():
+        await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Resource has been exhausted (fake).")
+    stats["embed_requests"] += 1
+    stats["embed_texts"] += 1
+    await asyncio.sleep(jittered(settings.embed_latency_ms + settings.embed_item_latency_ms))
+    return gs.EmbedContentResponse({"embedding": {"values": fake_embedding(" ".join(p.text for p in request.content.parts))}})
+
+
+async def batch_embed_contents(request: gs.BatchEmbedContentsRequest, context: grpc.aio.ServicerContext) -> gs.BatchEmbedContentsResponse:
+    if should_fail():
+        await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Resource has been exhausted (fake).")
+    stats["embed_requests"] += 1
+    stats["embed_texts"] += len(request.requests)
+    await asyncio.sleep(jittered(settings.embed_latency_ms + settings.embed_item_latency_ms * len(request.requests)))
+    return gs.BatchEmbedContentsResponse({"embeddings": [{"values": fake_embedding(" ".join(p.text for p in r.content.parts))} for r in request.requests]})
+
+
+async def count_tokens(request: gs.CountTokensRequest, context: grpc.aio.ServicerContext) -> gs.CountTokensResponse:
+    return gs.CountTokensResponse({"total_tokens": sum(estimate_tokens(" ".join(p.text for p in c.parts)) for c in request.contents)})
+
+
+def _unary(handler, request_type, response_type):
+    return grpc.unary_unary_rpc_method_handler(handler, request_deserializer=request_type.deserialize, response_serializer=response_type.serialize)
+
+
+def make_self_signed_certificate(hostnames: List[str]) -> Tuple[bytes, bytes]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostnames[0])])
+    alt_names: List[x509.GeneralName] = []
+    for host in hostnames:
+        try:
+            alt_names.append(x509.IPAddress(ipaddress.ip_address(host)))
+        except ValueError:
+            alt_names.append(x509.DNSName(host))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName(alt_names), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return key_pem, certificate.public_bytes(serialization.Encoding.PEM)
+
+
+async def serve_gemini(host: str, port: int, cert_dir: str, hostnames: List[str]) -> grpc.aio.Server:
+    cert_path = os.path.join(cert_dir, "fake_llm_ca.pem")
+    key_path = os.path.join(cert_dir, "fake_llm_key.pem")
+    if os.path.exists(cert_path) and os.path.exists(key_path):
+        with open(key_path, 'rb') as f:
+            key_pem = f.read()
+        with open(cert_path, 'rb') as f:
+            cert_pem = f.read()
+    else:
+        key_pem, cert_pem = make_self_signed_certificate(hostnames)
+        os.makedirs(cert_dir, exist_ok=True)
+        with open(key_path, 'wb') as f:
+            f.write(key_pem)
+        with open(cert_path, 'wb') as f:
+            f.write(cert_pem)
+
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(GENERATIVE_SERVICE, {
+        "GenerateContent": _unary(generate_content, gs.GenerateContentRequest, gs.GenerateContentResponse),
+        "EmbedContent": _unary(embed_content, gs.EmbedContentRequest, gs.EmbedContentResponse),
+        "BatchEmbedContents": _unary(batch_embed_contents, gs.BatchEmbedContentsRequest, gs.BatchEmbedContentsResponse),
+        "CountTokens": _unary(count_tokens, gs.CountTokensRequest, gs.CountTokensResponse),
+    }),))
+    server.add_secure_port(f"{host}:{port}", grpc.ssl_server_credentials([(key_pem, cert_pem)]))
+    await server.start()
+    logger.info(f"Fake Gemini gRPC service listening on {host}:{port}; clients must trust {cert_path}.")
+    return server
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if should_fail():
+        return JSONResponse(status_code=429, content={"error": {"message": "Rate limit reached (fake).", "type": "rate_limit_exceeded"}})
+    stats["controller"] += 1
+    prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in body.get("messages", []))
+    approved = random.random() < settings.approve_rate
+    content = json.dumps({"is_approved": approved, "feedback": "" if approved else filler_text(30)}, ensure_ascii=False)
+    completion_tokens = estimate_tokens(content)
+    await simulate_generation(settings.controller_latency_ms, completion_tokens)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "settings": vars(settings)}
+
+
+async def main(args: argparse.Namespace) -> None:
+    grpc_server = await serve_gemini(args.host, args.grpc_port, args.cert_dir, args.hostnames.split(","))
+    http_server = uvicorn.Server(uvicorn.Config(app, host=args.host, port=args.http_port, log_level="warning"))
+    logger.info(f"Fake OpenAI-compatible controller listening on {args.host}:{args.http_port}/v1.")
+    try:
+        await http_server.serve()
+    finally:
+        await grpc_server.stop(grace=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in for the Gemini generate/embed API (gRPC) and an OpenAI-compatible controller (HTTP).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--grpc-port", type=int, default=int(os.getenv("FAKE_GEMINI_PORT", 50051)))
+    parser.add_argument("--http-port", type=int, default=int(os.getenv("FAKE_CONTROLLER_PORT", 8090)))
+    parser.add_argument("--cert-dir", default=os.getenv("FAKE_LLM_CERT_DIR", "fake_llm_certs"))
+    parser.add_argument("--hostnames", default="fake-llm,localhost,127.0.0.1", help="Names the self-signed certificate is valid for.")
+    parser.add_argument("--generate-latency-ms", type=float, default=settings.generate_latency_ms)
+    parser.add_argument("--embed-latency-ms", type=float, default=settings.embed_latency_ms)
+    parser.add_argument("--controller-latency-ms", type=float, default=settings.controller_latency_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=settings.tokens_per_second)
+    parser.add_argument("--output-tokens", type=int, default=settings.output_tokens)
+    parser.add_argument("--tool-call-rate", type=float, default=settings.tool_call_rate)
+    parser.add_argument("--approve-rate", type=float, default=settings.approve_rate)
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate)
+    args = parser.parse_args()
+    settings.generate_latency_ms = args.generate_latency_ms
+    settings.embed_latency_ms = args.embed_latency_ms
+    settings.controller_latency_ms = args.controller_latency_ms
+    settings.tokens_per_second = args.tokens_per_second
+    settings.output_tokens = args.output_tokens
+    settings.tool_call_rate = args.tool_call_rate
+    settings.approve_rate = args.approve_rate
+    settings.error_rate = args.error_rate
+    logger.info(f"Fake LLM server settings: {vars(settings)}")
+    asyncio.run(main(args))
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+TERMINAL_STATUSES = {"complete", "failed", "cancelled"}
+DEFAULT_MESSAGES = [
+    "Какие требования ГОСТ 2.301-68 применяются в проекте?",
+    "Найди спецификацию армирования фундамента.",
+    "Какая толщина утеплителя указана для кровли?",
+    "Перечисли изменения по разделу КЖ.",
+]
+REGRESSION_METRICS = ("p50", "p95", "p99")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(data.size),
+        "mean": round(float(data.mean()), 1),
+        "p50": round(float(np.percentile(data, 50)), 1),
+        "p95": round(float(np.percentile(data, 95)), 1),
+        "p99": round(float(np.percentile(data, 99)), 1),
+        "max": round(float(data.max()), 1),
+    }
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/api/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run_job(client: httpx.AsyncClient, conversation_id: str, message: str, args: argparse.Namespace) -> Dict:
+    submitted_at = time.time()
+    response = await client.post("/api/v1/jobs", json={"message": message, "conversation_id": conversation_id, "use_agent_mode": args.agent_mode})
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+
+    status = "queued"
+    deadline = time.monotonic() + args.job_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(args.poll_interval)
+        status_response = await client.get(f"/api/v1/jobs/{job_id}/status")
+        status_response.raise_for_status()
+        status = status_response.json().get("status", status)
+        if status in TERMINAL_STATUSES:
+            break
+    finished_at = time.time()
+    if status not in TERMINAL_STATUSES:
+        return {"job_id": job_id, "status": "timeout", "e2e_ms": (finished_at - submitted_at) * 1000}
+
+    job = (await client.get(f"/api/v1/jobs/{job_id}")).json()
+    trace = job.get("trace") or {}
+    result = {"job_id": job_id, "status": status, "e2e_ms": (finished_at - submitted_at) * 1000, "spans": trace.get("spans", [])}
+    if trace:
+        result["worker_ms"] = trace.get("duration_ms")
+        result["queue_wait_ms"] = max(0.0, (trace["started_at"] - submitted_at) * 1000)
+    return result
+
+
+async def create_conversation(client: httpx.AsyncClient, user_index: int) -> str:
+    response = await client.post("/api/v1/chats", json={"title": f"loadtest-{user_index}"})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def virtual_user(client: httpx.AsyncClient, conversation_id: str, rng: random.Random, jobs: asyncio.Queue, results: List[Dict], messages: List[str], args: argparse.Namespace) -> None:
+    while True:
+        try:
+            job_number = jobs.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        try:
+            result = await run_job(client, conversation_id, rng.choice(messages), args)
+        except httpx.HTTPError as e:
+            logger.error(f"Job #{job_number} failed to submit or poll: {e}")
+            result = {"status": "error", "error": str(e)}
+        results.append(result)
+        if len(results) % 10 == 0:
+            logger.info(f"{len(results)} jobs finished.")
+
+
+async def run_phase(client: httpx.AsyncClient, conversation_ids: List[str], rngs: List[random.Random], job_count: int, messages: List[str], args: argparse.Namespace) -> List[Dict]:
+    jobs: asyncio.Queue = asyncio.Queue()
+    for job_number in range(job_count):
+        jobs.put_nowait(job_number)
+    results: List[Dict] = []
+    await asyncio.gather(*(virtual_user(client, conversation_id, rng, jobs, results, messages, args) for conversation_id, rng in zip(conversation_ids, rngs)))
+    return results
+
+
+def build_report(results: List[Dict], wall_seconds: float, args: argparse.Namespace, fake_llm_stats: Optional[Dict]) -> Dict:
+    completed = [r for r in results if r["status"] == "complete"]
+    stage_durations: Dict[str, List[float]] = defaultdict(list)
+    for result in completed:
+        for record in result.get("spans", []):
+            stage_durations[record["name"]].append(record["duration_ms"])
+    statuses: Dict[str, int] = defaultdict(int)
+    for result in results:
+        statuses[result["status"]] += 1
+    return {
+        "config": {"base_url": args.base_url, "jobs": args.jobs, "warmup": args.warmup, "concurrency": args.concurrency, "agent_mode": args.agent_mode},
+        "statuses": dict(statuses),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_jobs_per_s": round(len(completed) / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_ms": {
+            "end_to_end": percentiles([r["e2e_ms"] for r in completed]),
+            "queue_wait": percentiles([r["queue_wait_ms"] for r in completed if "queue_wait_ms" in r]),
+            "worker": percentiles([r["worker_ms"] for r in completed if r.get("worker_ms") is not None]),
+        },
+        "stages_ms": {name: percentiles(values) for name, values in sorted(stage_durations.items())},
+        "fake_llm": fake_llm_stats,
+    }
+
+
+def find_regressions(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    regressions = []
+    sections = [(f"latency_ms.{name}", report["latency_ms"].get(name, {}), baseline.get("latency_ms", {}).get(name, {})) for name in report["latency_ms"]]
+    sections += [(f"stages_ms.{name}", stats, baseline.get("stages_ms", {}).get(name, {})) for name, stats in report["stages_ms"].items()]
+    for label, current, previous in sections:
+        for metric in REGRESSION_METRICS:
+            if previous.get(metric) and current.get(metric) and current[metric] > previous[metric] * (1 + max_regression):
+                regressions.append(f"{label}.{metric}: {previous[metric]} -> {current[metric]} ms")
+    baseline_throughput = baseline.get("throughput_jobs_per_s")
+    if baseline_throughput and report["throughput_jobs_per_s"] < baseline_throughput * (1 - max_regression):
+        regressions.append(f"throughput_jobs_per_s: {baseline_throughput} -> {report['throughput_jobs_per_s']}")
+    return regressions
+
+
+async def fetch_fake_llm_stats(url: Optional[str]) -> Optional[Dict]:
+    if not url:
+        return None
+    async with httpx.AsyncClient(timeout=5.0, trust_env=False) as client:
+        return (await client.get(f"{url.rstrip('/')}/stats")).json()
+
+
+async def main(args: argparse.Namespace) -> int:
+    messages = DEFAULT_MESSAGES
+    if args.corpus_manifest:
+        with open(args.corpus_manifest, 'r', encoding='utf-8') as f:
+            messages = json.load(f)["queries"] or messages
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30.0, trust_env=False) as client:
+        token = await login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        conversation_ids = await asyncio.gather(*(create_conversation(client, i) for i in range(args.concurrency)))
+        rngs = [random.Random(args.seed + i) for i in range(args.concurrency)]
+        if args.warmup:
+            logger.info(f"Running {args.warmup} warm-up jobs.")
+            await run_phase(client, conversation_ids, rngs, args.warmup, messages, args)
+        stats_before = await fetch_fake_llm_stats(args.fake_llm_url)
+        start = time.perf_counter()
+        results = await run_phase(client, conversation_ids, rngs, args.jobs, messages, args)
+        wall_seconds = time.perf_counter() - start
+        stats_after = await fetch_fake_llm_stats(args.fake_llm_url)
+
+    fake_llm_stats = None
+    if stats_before and stats_after:
+        fake_llm_stats = {key: value - stats_before.get(key, 0) if isinstance(value, int) else value for key, value in stats_after.items()}
+
+    report = build_report(results, wall_seconds, args, fake_llm_stats)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f), args.max_regression)
+        if regressions:
+            logger.error("Performance regressions against baseline:\n" + "\n".join(regressions))
+            return 1
+        logger.info(f"No regressions beyond {args.max_regression:.0%} against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit chat jobs through /api/v1/jobs and report throughput, end-to-end and per-stage latency.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", default=os.getenv("LOADTEST_USERNAME", "loadtest"))
+    parser.add_argument("--password", default=os.getenv("LOADTEST_PASSWORD", "loadtest"))
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=2, help="Jobs run first and left out of the report.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Virtual users, each with its own conversation.")
+    parser.add_argument("--agent-mode", action="store_true")
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--job-timeout", type=float, default=300.0)
+    parser.add_argument("--corpus-manifest", help="manifest.json written by corpus.py; its queries are used as messages.")
+    parser.add_argument("--fake-llm-url", help="HTTP address of fake_llm_server.py, to include its call counters in the report.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--baseline", help="Previous report; exit with status 1 if latency or throughput regressed.")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,83 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from common.codec import dumps, loads
+from common.job_store import JOB_STALE_TTL_SECONDS, JOB_TTL_SECONDS, TERMINAL_STATUSES
+
+BULK_TASK_QUEUE = "bulk_task_queue"
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))
+BULK_RESULT_STATUSES = ("found", "empty", "error")
+
+
+def results_key(job_id: str) -> str:
+    return f"bulk_results:{job_id}"
+
+
+def _normalize_path(path: str) -> str:
+    return path.split(':', 1)[-1].strip('/')
+
+
+# File ids are relative paths for the mock disk and "disk:/..." paths for Yandex.Disk, so
+# a folder matches by path prefix in both.
+def select_files(files: List[Dict], folder: Optional[str] = None, file_ids: Optional[List[str]] = None) -> List[Dict]:
+    if file_ids:
+        by_id = {file['id']: file for file in files}
+        return [by_id[file_id] for file_id in dict.fromkeys(file_ids) if file_id in by_id]
+    prefix = _normalize_path(folder or "")
+    return sorted((file for file in files if not prefix or _normalize_path(file['id']).startswith(f"{prefix}/")), key=lambda file: file['id'])
+
+
+# Redis state of a bulk job. The job hash counts files in bulk_total/bulk_done and per
+# result status; the per-file results are checkpointed in a separate hash as each map task
+# finishes. A result is written with HSETNX and only its first write bumps bulk_done, so a
+# task delivered twice is counted once and exactly one worker sees the last file finish and
+# runs the reduce step. Results of a job that never completes expire with the stale jobs.
+class BulkJobStore:
+    def __init__(self, client: redis.Redis) -> None:
+        self.client = client
+
+    def start(self, job_id: str, files: List[Dict], task: Dict) -> None:
+        pipe = self.client.pipeline()
+        pipe.hset(job_id, mapping={"bulk_total": len(files), "bulk_done": 0, **{f"bulk_{status}": 0 for status in BULK_RESULT_STATUSES}})
+        pipe.lpush(BULK_TASK_QUEUE, *(dumps({**task, "job_id": job_id, "file_id": file['id'], "file_name": file['name'], "index": i}) for i, file in enumerate(files)))
+        pipe.execute()
+
+    def record_result(self, job_id: str, file_id: str, result: Dict) -> Optional[Tuple[int, int]]:
+        if not self.client.hsetnx(results_key(job_id), file_id, dumps(result)):
+            return None
+        pipe = self.client.pipeline()
+        pipe.expire(results_key(job_id), JOB_STALE_TTL_SECONDS)
+        pipe.hincrby(job_id, f"bulk_{result['status']}", 1)
+        pipe.hincrby(job_id, "bulk_done", 1)
+        pipe.hget(job_id, "bulk_total")
+        _, _, done, total = pipe.execute()
+        return int(done), int(total or 0)
+
+    def results(self, job_id: str) -> List[Dict]:
+        results = [loads(value) for value in self.client.hgetall(results_key(job_id)).values()]
+        return sorted(results, key=lambda result: result['index'])
+
+    def expire(self, job_id: str) -> None:
+        self.client.expire(results_key(job_id), JOB_TTL_SECONDS)
+
+    # A cancelled job has no reduce step; only the first task to see the cancel wraps it up.
+    def claim_cancelled(self, job_id: str) -> bool:
+        return bool(self.client.hsetnx(job_id, "bulk_cancel_handled", 1))
+
+    # Map tasks of one job finish on several workers at once, so the thoughts list is
+    # appended under WATCH instead of the read-modify-write of update_job_status. A job in a
+    # terminal state may already be finalized with its thoughts compressed, so progress that
+    # arrives after a cancel is dropped.
+    def append_thought(self, job_id: str, content: str) -> None:
+        def append(pipe: redis.client.Pipeline) -> None:
+            status, raw = pipe.hmget(job_id, "status", "thoughts")
+            if status in TERMINAL_STATUSES:
+                return
+            thoughts = loads(raw) if raw else []
+            thoughts.append({"type": "log", "content": content})
+            pipe.multi()
+            pipe.hset(job_id, "thoughts", dumps(thoughts))
+
+        self.client.transaction(append, job_id)
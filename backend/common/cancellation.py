@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import redis
+
+from common.metrics import JOB_CANCEL_LATENCY_SECONDS, JOB_CANCELLATIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+CANCEL_CHANNEL = "job_cancel"
+CANCEL_LISTENER_RETRY_SECONDS = 1.0
+
+
+def request_cancel(client: redis.Redis, job_id: str) -> int:
+    requested_at = time.time()
+    pipe = client.pipeline()
+    pipe.hset(job_id, mapping={"status": "cancelled", "cancel_requested_at": requested_at})
+    pipe.publish(CANCEL_CHANNEL, json.dumps({"job_id": job_id, "requested_at": requested_at}))
+    return pipe.execute()[1]
+
+
+# Running jobs register their asyncio tasks here; a bulk job has one per map task in flight. Cancel requests arrive over Redis pub/sub on
+# a listener thread and are handed to the owning event loop, so the job's task is cancelled
+# at whatever await it is in, including an in-flight model or controller request. Workers
+# that do not own the job ignore the message. Pub/sub does not buffer, so a request sent while
+# the listener is reconnecting is only seen by the status check at pickup.
+class CancellationRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[asyncio.Task, asyncio.AbstractEventLoop]] = {}
+        self._requested: Dict[str, float] = {}
+
+    def register(self, job_id: str, task: asyncio.Task) -> None:
+        with self._lock:
+            self._tasks.setdefault(job_id, {})[task] = asyncio.get_running_loop()
+
+    def unregister(self, job_id: str, task: asyncio.Task) -> None:
+        with self._lock:
+            tasks = self._tasks.get(job_id, {})
+            tasks.pop(task, None)
+            if not tasks:
+                self._tasks.pop(job_id, None)
+                self._requested.pop(job_id, None)
+
+    def requested_at(self, job_id: str) -> Optional[float]:
+        with self._lock:
+            return self._requested.get(job_id)
+
+    def cancel(self, job_id: str, requested_at: float) -> bool:
+        with self._lock:
+            tasks = self._tasks.get(job_id)
+            if not tasks or job_id in self._requested:
+                return False
+            self._requested[job_id] = requested_at
+            entries = list(tasks.items())
+        for task, loop in entries:
+            loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def observe(self, job_id: str, state: str, requested_at: Optional[float] = None) -> None:
+        requested_at = requested_at or self.requested_at(job_id)
+        JOB_CANCELLATIONS_TOTAL.labels(state=state).inc()
+        if requested_at is not None:
+            JOB_CANCEL_LATENCY_SECONDS.labels(state=state).observe(max(0.0, time.time() - requested_at))
+
+    def _on_message(self, message: Dict) -> None:
+        try:
+            data = json.loads(message["data"])
+            job_id = data["job_id"]
+            requested_at = float(data.get("requested_at") or time.time())
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed cancel message {message.get('data')!r}: {e}")
+            return
+        if self.cancel(job_id, requested_at):
+            logger.info(f"Cancelling running job {job_id}.")
+
+    def _listen(self, client: redis.Redis) -> None:
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CANCEL_CHANNEL)
+                logger.info(f"Listening for job cancellations on '{CANCEL_CHANNEL}'.")
+                for message in pubsub.listen():
+                    self._on_message(message)
+            except redis.RedisError as e:
+                logger.warning(f"Cancel listener lost its Redis connection, resubscribing: {e}")
+                time.sleep(CANCEL_LISTENER_RETRY_SECONDS)
+
+    def listen(self, client: redis.Redis) -> threading.Thread:
+        thread = threading.Thread(target=self._listen, args=(client,), name="cancel-listener", daemon=True)
+        thread.start()
+        return thread
+
+
+cancellations = CancellationRegistry()
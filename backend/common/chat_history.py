@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from common.codec import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "30"))
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "32"))
+
+
+def history_version(path: str) -> Optional[str]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def make_etag(version: str, *parts) -> str:
+    return 'W/"' + "-".join([version, *map(str, parts)]) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+def read_history(path: str) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    history = loads(content) if content else []
+    return history if isinstance(history, list) else []
+
+
+# History files used to be written with indent=2; both layouts read the same.
+def write_history(path: str, history: List[Dict]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(dumps(history))
+
+
+def message_summary(index: int, message: Dict) -> Dict:
+    return {
+        "index": index,
+        "role": message.get("role"),
+        "content": "\n".join(message.get("parts") or []),
+        "thinking_steps_count": len(message.get("thinking_steps") or []),
+    }
+
+
+# History files are append-only JSON lists that the backend and the worker rewrite as a whole.
+# Parsed lists are kept per (mtime, size) so paging through a long chat parses the file once,
+# and message indexes serve as stable cursors: "before=N" returns the messages preceding N.
+class ChatHistoryReader:
+    def __init__(self, history_dir: str) -> None:
+        self.history_dir = history_dir
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[str, List[Dict]]]" = OrderedDict()
+
+    def path(self, conversation_id: str) -> str:
+        return os.path.join(self.history_dir, f"{conversation_id}.json")
+
+    def version(self, conversation_id: str) -> Optional[str]:
+        return history_version(self.path(conversation_id))
+
+    def load(self, conversation_id: str) -> Tuple[Optional[str], List[Dict]]:
+        path = self.path(conversation_id)
+        version = history_version(path)
+        if version is None:
+            return None, []
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(path)
+                return cached
+        try:
+            history = read_history(path)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Could not read history for {conversation_id}: {e}")
+            return version, []
+        with self._lock:
+            self._cache[path] = (version, history)
+            self._cache.move_to_end(path)
+            while len(self._cache) > HISTORY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return version, history
+
+    def page(self, conversation_id: str, before: Optional[int], limit: int) -> Dict:
+        _, history = self.load(conversation_id)
+        end = len(history) if before is None else max(0, min(before, len(history)))
+        start = max(0, end - limit)
+        return {
+            "messages": [message_summary(index, history[index]) for index in range(start, end)],
+            "next_cursor": str(start) if start > 0 else None,
+            "total": len(history),
+        }
+
+    def thinking_steps(self, conversation_id: str, index: int) -> Optional[List[Dict]]:
+        _, history = self.load(conversation_id)
+        if not 0 <= index < len(history):
+            return None
+        return history[index].get("thinking_steps") or []
+
+    def forget(self, conversation_id: str) -> None:
+        with self._lock:
+            self._cache.pop(self.path(conversation_id), None)
@@ -0,0 +1,75 @@
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import google.generativeai as genai
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "300"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "120"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes") and importlib.util.find_spec("h2") is not None
+
+
+# Long-lived model objects and HTTP pools shared by all jobs of a process. Building a
+# GenerativeModel with tools introspects every tool function, and a fresh httpx client
+# pays the proxy CONNECT and TLS handshake again, so both are created once per key.
+class ClientRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple, genai.GenerativeModel] = {}
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+
+    def model(self, model_name: str, tools: Sequence[Callable] = (), system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+        key = (model_name, tuple(tools), system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name=model_name, tools=list(tools) or None, system_instruction=system_instruction)
+                self._models[key] = model
+                logger.info(f"Created model client for {model_name} ({len(tools)} tools).")
+            return model
+
+    def http_client(self, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        key = proxy or ""
+        with self._lock:
+            client = self._http_clients.get(key)
+            if client is None:
+                client = httpx.AsyncClient(
+                    proxy=proxy or None,
+                    http2=HTTP2_ENABLED,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                    ),
+                    timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0),
+                )
+                self._http_clients[key] = client
+            return client
+
+    # Opens the gRPC channel and the HTTP connections before the first job needs them. Any
+    # response, including an error status, means the handshakes are done.
+    async def warm_up(self, model_names: Iterable[str], http_targets: Iterable[Tuple[str, Optional[str]]] = ()) -> None:
+        start = time.perf_counter()
+        for model_name in dict.fromkeys(model_names):
+            try:
+                await self.model(model_name).count_tokens_async("ping")
+            except Exception as e:
+                logger.warning(f"Warm-up call to {model_name} failed: {e}")
+        for url, proxy in http_targets:
+            try:
+                response = await self.http_client(proxy).get(url)
+                logger.info(f"Warmed connection to {url} ({response.http_version}, status {response.status_code}).")
+            except httpx.HTTPError as e:
+                logger.warning(f"Warm-up request to {url} failed: {e}")
+        logger.info(f"Client warm-up finished in {time.perf_counter() - start:.2f}s.")
+
+
+client_registry = ClientRegistry()
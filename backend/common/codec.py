@@ -0,0 +1,102 @@
+import base64
+import json
+import logging
+import os
+import zlib
+from typing import Any, Dict, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_PREFIX = "zstd:"
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+
+# Serialization of everything the backend and the worker exchange through Redis or the
+# history directory. The format stays JSON text in every codec: Redis clients decode
+# responses to str, and queued jobs, hashes, archives and history files written earlier
+# must stay readable. Codecs differ in speed and in not escaping non-ASCII text.
+class JsonCodec:
+    name = "json"
+
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def dumps(self, value: Any) -> str:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+# Large text fields (final answers, thoughts, traces) are compressed and base64-encoded so
+# they fit the str-decoding Redis clients. zstd values carry a prefix; unprefixed values
+# are zlib, as written before zstd was available, and stay readable.
+class ZlibCompressor:
+    name = "zlib"
+
+    def compress(self, value: str) -> str:
+        return base64.b64encode(zlib.compress(value.encode('utf-8'), ZLIB_LEVEL)).decode('ascii')
+
+
+class ZstdCompressor:
+    name = "zstd"
+
+    def compress(self, value: str) -> str:
+        packed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(value.encode('utf-8'))
+        return ZSTD_PREFIX + base64.b64encode(packed).decode('ascii')
+
+
+JSON_CODECS: Dict[str, type] = {"json": JsonCodec, "orjson": OrjsonCodec}
+COMPRESSORS: Dict[str, type] = {"zlib": ZlibCompressor, "zstd": ZstdCompressor}
+_AVAILABLE = {"orjson": orjson is not None, "zstd": zstandard is not None}
+
+
+def _select(options: Dict[str, type], name: str, fallback: str) -> Any:
+    if name not in options:
+        raise ValueError(f"Unknown codec '{name}'. Expected one of {tuple(options)}.")
+    if not _AVAILABLE.get(name, True):
+        logger.warning(f"Codec '{name}' is not installed, falling back to '{fallback}'.")
+        name = fallback
+    return options[name]()
+
+
+json_codec = _select(JSON_CODECS, os.getenv("JSON_CODEC", "orjson"), "json")
+compressor = _select(COMPRESSORS, os.getenv("COMPRESSION_CODEC", "zstd"), "zlib")
+
+
+def dumps(value: Any) -> str:
+    return json_codec.dumps(value)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return json_codec.loads(data)
+
+
+def compress_text(value: str) -> str:
+    return compressor.compress(value)
+
+
+def decompress_text(value: str) -> str:
+    if value.startswith(ZSTD_PREFIX):
+        if zstandard is None:
+            raise RuntimeError("A value is zstd-compressed but zstandard is not installed.")
+        return zstandard.ZstdDecompressor().decompress(base64.b64decode(value[len(ZSTD_PREFIX):])).decode('utf-8')
+    return zlib.decompress(base64.b64decode(value)).decode('utf-8')
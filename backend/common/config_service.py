@@ -0,0 +1,130 @@
+import errno
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import redis
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = os.getenv("APP_CONFIG_FILE", "/app_config/config.json")
+CONFIG_CHANNEL = "config_changed"
+CONFIG_VERSION_KEY = "config:version"
+CONFIG_LISTENER_RETRY_SECONDS = 1.0
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+class AgentSettings(BaseModel):
+    model_name: str
+    system_prompt: str
+
+
+class AppConfig(BaseModel):
+    executor: AgentSettings
+    controller: AgentSettings
+
+
+def default_config() -> AppConfig:
+    return AppConfig(
+        executor=AgentSettings(model_name='gemini-2.5-pro', system_prompt=DEFAULT_SYSTEM_PROMPT),
+        controller=AgentSettings(model_name='o4-mini', system_prompt=DEFAULT_SYSTEM_PROMPT),
+    )
+
+
+# Keeps the validated configuration in memory so jobs never touch the disk. Saving writes the
+# file atomically and bumps a version in Redis; every process listens on CONFIG_CHANNEL and
+# re-reads the file once per bump. An unreadable or invalid file leaves the last good
+# configuration in place and is never deleted.
+class ConfigService:
+    def __init__(self, path: str = CONFIG_FILE) -> None:
+        self.path = path
+        self.version = 0
+        self.redis_client: Optional[redis.Redis] = None
+        self._lock = threading.Lock()
+        self._config: Optional[AppConfig] = None
+
+    def get(self) -> AppConfig:
+        config = self._config
+        if config is None:
+            config = self.reload()
+        return config
+
+    def reload(self) -> AppConfig:
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._config = AppConfig.model_validate(json.load(f))
+                logger.info(f"Loaded configuration from {self.path} (version {self.version}).")
+            except FileNotFoundError:
+                if self._config is None:
+                    self._config = default_config()
+            except (OSError, ValueError, ValidationError) as e:
+                logger.error(f"Invalid configuration in {self.path}, keeping the {'previous' if self._config else 'default'} one: {e}")
+                if self._config is None:
+                    self._config = default_config()
+            return self._config
+
+    def _write(self, payload: str) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # docker-compose bind-mounts config.json as a single file, which cannot be renamed over.
+            if e.errno not in (errno.EBUSY, errno.EXDEV):
+                raise
+            os.remove(tmp_path)
+            with open(self.path, 'r+', encoding='utf-8') as f:
+                f.write(payload)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+    def save(self, config: AppConfig) -> int:
+        with self._lock:
+            self._write(json.dumps(config.model_dump(), indent=2, ensure_ascii=False))
+            self._config = config
+        if self.redis_client is not None:
+            try:
+                self.version = int(self.redis_client.incr(CONFIG_VERSION_KEY))
+                self.redis_client.publish(CONFIG_CHANNEL, str(self.version))
+            except redis.RedisError as e:
+                logger.error(f"Configuration saved but the change could not be announced: {e}")
+        logger.info(f"Configuration saved (version {self.version}).")
+        return self.version
+
+    def _sync(self, version: Optional[str]) -> None:
+        version = int(version or 0)
+        if version != self.version:
+            self.version = version
+            self.reload()
+
+    def _listen(self, client: redis.Redis) -> None:
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CONFIG_CHANNEL)
+                self._sync(client.get(CONFIG_VERSION_KEY))
+                for message in pubsub.listen():
+                    self._sync(message["data"])
+            except (redis.RedisError, ValueError) as e:
+                logger.warning(f"Config listener lost its Redis connection, resubscribing: {e}")
+                time.sleep(CONFIG_LISTENER_RETRY_SECONDS)
+
+    def listen(self, client: redis.Redis) -> threading.Thread:
+        self.redis_client = client
+        thread = threading.Thread(target=self._listen, args=(client,), name="config-listener", daemon=True)
+        thread.start()
+        return thread
+
+
+config_service = ConfigService()
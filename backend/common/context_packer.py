@@ -0,0 +1,203 @@
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Set
+
+from common.metrics import CONTEXT_TOKENS_SAVED_TOTAL
+from common.rate_limit import CHARS_PER_TOKEN, estimate_tokens
+
+TOOL_CONTEXT_TOKEN_BUDGET = int(os.getenv("TOOL_CONTEXT_TOKEN_BUDGET", "1500"))
+CONTROLLER_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTROLLER_CONTEXT_TOKEN_BUDGET", "2000"))
+MIN_REDUNDANT_SENTENCE_CHARS = 40
+MIN_TRIMMED_PASSAGE_CHARS = 200
+MIN_TRUNCATED_TOKENS = 50
+CONTROLLER_NOTE_TOKENS = 100
+SENTENCE_SPLIT_RE = re.compile(r"((?<=[.!?…])\s+|\n+)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _sentence_key(sentence: str) -> str:
+    return WHITESPACE_RE.sub(" ", sentence).strip().lower()
+
+
+def _union(a: Dict, b: Dict, key: str) -> Optional[List]:
+    if key not in a and key not in b:
+        return None
+    return list(dict.fromkeys([*a.get(key, []), *b.get(key, [])]))
+
+
+# Chunks of one segment share a byte range of the chunk store arena, so their spans tell
+# whether two search hits overlap or touch. The overlapping bytes are compared before
+# joining, which keeps hits from different index generations apart.
+def _join(a: Dict, b: Dict) -> Optional[Dict]:
+    a_start, a_end = a['span']
+    b_start, b_end = b['span']
+    a_bytes, b_bytes = a['text'].encode('utf-8'), b['text'].encode('utf-8')
+    if b_start > a_end or len(a_bytes) != a_end - a_start or len(b_bytes) != b_end - b_start:
+        return None
+    if b_end <= a_end:
+        offset = b_start - a_start
+        if a_bytes[offset:offset + len(b_bytes)] != b_bytes:
+            return None
+        text = a['text']
+    else:
+        overlap = a_end - b_start
+        if a_bytes[len(a_bytes) - overlap:] != b_bytes[:overlap]:
+            return None
+        text = (a_bytes + b_bytes[overlap:]).decode('utf-8')
+    merged = {**a, 'text': text, 'span': (a_start, max(a_end, b_end)), 'score': max(a['score'], b['score'])}
+    for key in ('queries', 'sources'):
+        values = _union(a, b, key)
+        if values is not None:
+            merged[key] = values
+    return merged
+
+
+def merge_chunks(chunks: Sequence[Dict]) -> List[Dict]:
+    groups: Dict[tuple, List[Dict]] = {}
+    merged: List[Dict] = []
+    for rank, chunk in enumerate(chunks):
+        passage = {**chunk, 'score': chunk.get('score', 1.0 / (rank + 1))}
+        if passage.get('span') is None:
+            merged.append(passage)
+        else:
+            groups.setdefault((passage['file_id'], passage.get('location')), []).append(passage)
+    for group in groups.values():
+        group.sort(key=lambda passage: passage['span'][0])
+        current = group[0]
+        for passage in group[1:]:
+            joined = _join(current, passage)
+            if joined is None:
+                merged.append(current)
+                current = passage
+            else:
+                current = joined
+        merged.append(current)
+    merged.sort(key=lambda passage: passage['score'], reverse=True)
+    return merged
+
+
+def sentence_keys(text: str) -> Set[str]:
+    keys = {_sentence_key(part) for part in SENTENCE_SPLIT_RE.split(text)[::2]}
+    return {key for key in keys if len(key) >= MIN_REDUNDANT_SENTENCE_CHARS}
+
+
+def drop_redundant(text: str, seen: Set[str]) -> str:
+    parts = SENTENCE_SPLIT_RE.split(text)
+    kept: List[str] = []
+    for i in range(0, len(parts), 2):
+        key = _sentence_key(parts[i])
+        if len(key) >= MIN_REDUNDANT_SENTENCE_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(parts[i] + (parts[i + 1] if i + 1 < len(parts) else ""))
+    return "".join(kept).strip()
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + "…"
+
+
+def fill_budget(passages: Sequence[Dict], budget: int) -> List[Dict]:
+    packed: List[Dict] = []
+    used = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage['text'])
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining < MIN_TRUNCATED_TOKENS:
+                continue
+            passage = {**passage, 'text': truncate_to_tokens(passage['text'], remaining)}
+            tokens = estimate_tokens(passage['text'])
+        packed.append(passage)
+        used += tokens
+    return packed
+
+
+# Retrieval state of one job. Tool calls of the job share the set of sentences already
+# returned, so a later search does not repeat them, and the controller reviews the packed
+# passages of all calls instead of every raw tool result. Savings are estimated against
+# pasting the retrieved chunks verbatim.
+class JobContext:
+    def __init__(self) -> None:
+        self.seen: Set[str] = set()
+        self.passages: List[Dict] = []
+        self.calls: List[str] = []
+        self.notes: List[str] = []
+        self.raw_tokens = 0
+        self.tokens_saved: Dict[str, int] = {"tool": 0, "controller": 0}
+        self._passages_at_last_call = 0
+
+    def record_saved(self, stage: str, raw_tokens: int, packed_tokens: int) -> None:
+        saved = max(0, raw_tokens - packed_tokens)
+        self.tokens_saved[stage] += saved
+        CONTEXT_TOKENS_SAVED_TOTAL.labels(stage=stage).inc(saved)
+
+    # Results that were not packed (file lists, errors, "nothing found") reach the controller
+    # as a short note.
+    def record_call(self, name: str, args: Dict, result: str) -> None:
+        args_repr = ', '.join(f"{key}={value if isinstance(value, (str, int, float)) else list(value)!r}" for key, value in args.items())
+        self.calls.append(f"{name}({args_repr})")
+        if len(self.passages) == self._passages_at_last_call:
+            self.notes.append(f"{name}: {truncate_to_tokens(result, CONTROLLER_NOTE_TOKENS)}")
+        self._passages_at_last_call = len(self.passages)
+
+    # Sentences count as seen only once they are packed, so text cut by the budget can still
+    # come back in a later call. Passages trimmed down to fragments are dropped.
+    def pack(self, chunks: Sequence[Dict], budget: int = TOOL_CONTEXT_TOKEN_BUDGET) -> List[Dict]:
+        seen = set(self.seen)
+        passages = []
+        for passage in merge_chunks(chunks):
+            text = drop_redundant(passage['text'], seen)
+            if text and (text == passage['text'].strip() or len(text) >= MIN_TRIMMED_PASSAGE_CHARS):
+                passages.append({**passage, 'text': text})
+        packed = fill_budget(passages, budget)
+        for passage in packed:
+            self.seen |= sentence_keys(passage['text'])
+        raw_tokens = sum(estimate_tokens(chunk['text']) for chunk in chunks)
+        self.raw_tokens += raw_tokens
+        self.record_saved("tool", raw_tokens, sum(estimate_tokens(passage['text']) for passage in packed))
+        self.passages.extend(packed)
+        return packed
+
+    def controller_view(self, budget: int = CONTROLLER_CONTEXT_TOKEN_BUDGET) -> str:
+        if not self.calls and not self.passages:
+            return "None"
+        lines = [f"Tool calls: {'; '.join(self.calls)}"] if self.calls else []
+        lines += self.notes
+        packed = fill_budget(sorted(self.passages, key=lambda passage: passage['score'], reverse=True), budget)
+        for passage in packed:
+            source = passage['file_name'] + (f", {passage['location']}" if passage.get('location') else "")
+            lines.append(f"[{source}]\n{passage['text']}")
+        self.record_saved("controller", self.raw_tokens, sum(estimate_tokens(passage['text']) for passage in packed))
+        return "\n\n".join(lines)
+
+    @property
+    def total_saved(self) -> int:
+        return sum(self.tokens_saved.values())
+
+
+_current_context: ContextVar[Optional[JobContext]] = ContextVar("current_job_context", default=None)
+
+
+@contextmanager
+def job_context() -> Iterator[JobContext]:
+    context = JobContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+# Tools run in worker threads started with asyncio.to_thread, which copies the job's
+# context, so they pack into the running job's context. Outside a job each call is packed
+# on its own.
+def pack_chunks(chunks: Sequence[Dict], budget: int = TOOL_CONTEXT_TOKEN_BUDGET) -> List[Dict]:
+    return (_current_context.get() or JobContext()).pack(chunks, budget)
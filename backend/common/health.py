@@ -0,0 +1,37 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+ReadinessCheck = Callable[[], Tuple[int, Dict]]
+
+
+def start_health_server(port: int, readiness: ReadinessCheck) -> ThreadingHTTPServer:
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/health/live":
+                code, body = 200, {"status": "alive"}
+            elif self.path == "/health/ready":
+                try:
+                    code, body = readiness()
+                except Exception as e:
+                    code, body = 503, {"status": "unavailable", "error": str(e)}
+            else:
+                code, body = 404, {"detail": "Not Found"}
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("", port), HealthHandler)
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    logger.info(f"Health endpoints listening on port {port}.")
+    return server
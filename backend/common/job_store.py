@@ -0,0 +1,127 @@
+import gzip
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import redis
+
+from common.codec import compress_text, decompress_text, dumps, loads
+from common.metrics import JOB_STORE_ARCHIVED_TOTAL, JOB_STORE_RECLAIMED_BYTES, REDIS_USED_MEMORY_BYTES
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("complete", "failed", "cancelled")
+COMPRESSIBLE_FIELDS = ("thoughts", "final_answer", "trace")
+COMPRESSED_MARKER = "compressed"
+JOB_KEY_PATTERN = "job:*"
+
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_STALE_TTL_SECONDS = int(os.getenv("JOB_STALE_TTL_SECONDS", str(7 * 24 * 3600)))
+JOB_COMPACTION_GRACE_SECONDS = int(os.getenv("JOB_COMPACTION_GRACE_SECONDS", "600"))
+JOB_COMPRESS_MIN_BYTES = int(os.getenv("JOB_COMPRESS_MIN_BYTES", "2048"))
+
+
+def decode_job(raw: Dict[str, str]) -> Dict[str, str]:
+    job = dict(raw)
+    for field in filter(None, job.pop(COMPRESSED_MARKER, "").split(",")):
+        if field in job:
+            job[field] = decompress_text(job[field])
+    return job
+
+
+# Lifecycle of job hashes in Redis. Finished jobs are written to the history store, their
+# large fields are compressed in place and the hash gets a TTL; reads fall back to the
+# archive once Redis has expired the key.
+class JobStore:
+    def __init__(self, client: redis.Redis, history_dir: str) -> None:
+        self.client = client
+        self.archive_dir = os.path.join(history_dir, "jobs")
+        self._expired_keys_seen: Optional[int] = None
+
+    def _archive_path(self, job_id: str) -> str:
+        return os.path.join(self.archive_dir, f"{job_id.split(':', 1)[-1]}.json.gz")
+
+    def get(self, job_id: str) -> Optional[Dict[str, str]]:
+        raw = self.client.hgetall(job_id)
+        if raw:
+            return decode_job(raw)
+        path = self._archive_path(job_id)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return loads(f.read())
+
+    def archive(self, job_id: str, job: Dict[str, str]) -> None:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self._archive_path(job_id)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write(dumps(job))
+        os.replace(tmp_path, path)
+
+    def finalize(self, job_id: str, source: str = "worker") -> int:
+        raw = self.client.hgetall(job_id)
+        if not raw or raw.get("status") not in TERMINAL_STATUSES:
+            return 0
+        job = decode_job(raw)
+        self.archive(job_id, job)
+
+        before = self.client.memory_usage(job_id) or 0
+        compressed = set(filter(None, raw.get(COMPRESSED_MARKER, "").split(",")))
+        updates = {}
+        for field in COMPRESSIBLE_FIELDS:
+            value = raw.get(field)
+            if field in compressed or not value or len(value.encode('utf-8')) < JOB_COMPRESS_MIN_BYTES:
+                continue
+            packed = compress_text(value)
+            if len(packed) < len(value.encode('utf-8')):
+                updates[field] = packed
+                compressed.add(field)
+        pipe = self.client.pipeline()
+        if updates:
+            pipe.hset(job_id, mapping={**updates, COMPRESSED_MARKER: ",".join(sorted(compressed))})
+        pipe.expire(job_id, JOB_TTL_SECONDS)
+        pipe.execute()
+        reclaimed = max(0, before - (self.client.memory_usage(job_id) or 0))
+
+        JOB_STORE_ARCHIVED_TOTAL.labels(source=source).inc()
+        JOB_STORE_RECLAIMED_BYTES.labels(source=source).inc(reclaimed)
+        logger.info(f"Job {job_id} archived; compressed {sorted(updates)} ({reclaimed} bytes reclaimed), expires in {JOB_TTL_SECONDS}s.")
+        return reclaimed
+
+    # Catches what the worker did not finalize: jobs cancelled while queued, jobs written
+    # before TTLs existed and jobs orphaned by a crashed worker.
+    def compact(self) -> Dict:
+        start = time.perf_counter()
+        memory_before = self.client.info("memory")["used_memory"]
+        report = {"scanned": 0, "finalized": 0, "stale_ttl_set": 0, "reclaimed_bytes": 0}
+        now = time.time()
+        for key in self.client.scan_iter(match=JOB_KEY_PATTERN, count=500):
+            if self.client.type(key) != "hash":
+                continue
+            report["scanned"] += 1
+            if self.client.ttl(key) != -1:
+                continue
+            status, created_at = self.client.hmget(key, "status", "created_at")
+            if status in TERMINAL_STATUSES:
+                if created_at and now - float(created_at) < JOB_COMPACTION_GRACE_SECONDS:
+                    continue
+                report["reclaimed_bytes"] += self.finalize(key, source="compaction")
+                report["finalized"] += 1
+            else:
+                self.client.expire(key, JOB_STALE_TTL_SECONDS)
+                report["stale_ttl_set"] += 1
+
+        memory_after = self.client.info("memory")["used_memory"]
+        REDIS_USED_MEMORY_BYTES.set(memory_after)
+        expired_keys = self.client.info("stats")["expired_keys"]
+        report.update({
+            "expired_keys_since_last_run": expired_keys - self._expired_keys_seen if self._expired_keys_seen is not None else None,
+            "used_memory_before": memory_before,
+            "used_memory_after": memory_after,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+        self._expired_keys_seen = expired_keys
+        logger.info(f"Job store compaction: {report}")
+        return report
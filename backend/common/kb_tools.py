@@ -0,0 +1,104 @@
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+
+from common.context_packer import pack_chunks
+
+if TYPE_CHECKING:
+    from kb_service.indexer import KnowledgeBaseIndexer
+    from kb_service.remote import RemoteKnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+
+def format_chunk_source(chunk: Dict) -> str:
+    source = f"из файла: {chunk['file_name']}"
+    if chunk.get('location'):
+        source += f", {chunk['location']}"
+    others = [name for name in chunk.get('sources', []) if name != chunk['file_name']]
+    if others:
+        source += f"; также в: {', '.join(others[:5])}" + (f" и ещё {len(others) - 5}" if len(others) > 5 else "")
+    return source
+
+
+def format_search_results(results: List[Dict]) -> str:
+    passages = pack_chunks(results)
+    if not passages:
+        return "Найденные фрагменты уже приведены в предыдущих результатах поиска."
+    formatted_results = []
+    for i, chunk in enumerate(passages):
+        queries = f"; запросы: {', '.join(chunk['queries'])}" if chunk.get('queries') else ""
+        formatted_results.append(f"--- Результат поиска №{i+1} ({format_chunk_source(chunk)}{queries}) ---\n{chunk['text']}\n")
+    return "\n".join(formatted_results)
+
+
+# Knowledge base tools of the executor model. Gemini declares each tool from the bound
+# method's name, signature and type hints, so those are part of the model's contract.
+class KnowledgeBaseTools:
+    def __init__(self, kb: Union["KnowledgeBaseIndexer", "RemoteKnowledgeBase"]) -> None:
+        self.kb = kb
+
+    @property
+    def tools(self) -> Tuple[Callable[..., str], ...]:
+        return (self.analyze_document, self.search_knowledge_base, self.search_knowledge_base_many, self.list_all_files_summary)
+
+    def warming_up_message(self) -> Optional[str]:
+        if not self.kb.is_warming_up:
+            return None
+        progress = self.kb.get_status().get("progress") or {}
+        if progress.get("files_total"):
+            return f"База знаний ещё загружается (обработано файлов: {progress['files_done']} из {progress['files_total']}). Повторите поиск позже."
+        return "База знаний ещё загружается. Повторите поиск позже."
+
+    def analyze_document(self, file_id: str, query: str) -> str:
+        logger.info(f"TOOL CALL: analyze_document for file_id: {file_id} with query: '{query}'")
+        warming_up = self.warming_up_message()
+        if warming_up:
+            return warming_up
+        try:
+            results = self.kb.search(query=query, file_id=file_id)
+            if not results:
+                file_info = self.kb.get_file_by_id(file_id)
+                file_name = file_info['name'] if file_info else file_id
+                return f"Внутри файла '{file_name}' по вашему запросу '{query}' ничего не найдено."
+            return format_search_results(results)
+        except Exception as e:
+            logger.error(f"Error in analyze_document tool for file_id {file_id}: {e}", exc_info=True)
+            return f"ОШИБКА: Произошла внутренняя ошибка при поиске по файлу: {e}"
+
+    def search_knowledge_base(self, query: str) -> str:
+        logger.info(f"TOOL CALL: search_knowledge_base with query: '{query}'")
+        warming_up = self.warming_up_message()
+        if warming_up:
+            return warming_up
+        results = self.kb.search(query)
+        if not results:
+            return "По вашему запросу в базе знаний ничего не найдено."
+        return format_search_results(results)
+
+    def search_knowledge_base_many(self, queries: List[str]) -> str:
+        logger.info(f"TOOL CALL: search_knowledge_base_many with {len(queries)} queries: {list(queries)}")
+        warming_up = self.warming_up_message()
+        if warming_up:
+            return warming_up
+        try:
+            results = self.kb.search_many(list(queries))
+            if not results:
+                return "По вашим запросам в базе знаний ничего не найдено."
+            return format_search_results(results)
+        except Exception as e:
+            logger.error(f"Error in search_knowledge_base_many tool: {e}", exc_info=True)
+            return f"ОШИБКА: Произошла внутренняя ошибка при пакетном поиске: {e}"
+
+    def list_all_files_summary(self) -> str:
+        logger.info("TOOL CALL: list_all_files_summary")
+        warming_up = self.warming_up_message()
+        if warming_up:
+            return warming_up
+        try:
+            all_files = self.kb.get_all_files()
+            if not all_files: return "В базе знаний нет доступных файлов."
+            summary = "Доступные файлы в базе знаний:\n" + "\n".join([f"- Имя файла: '{f.get('name', 'N/A')}', ID: '{f.get('id', 'N/A')}'" for f in all_files])
+            return summary.strip()
+        except Exception as e:
+            logger.error(f"Error in list_all_files_summary tool: {e}", exc_info=True)
+            return f"ОШИБКА: Не удалось получить список файлов: {e}"
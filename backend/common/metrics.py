@@ -0,0 +1,82 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+REBUILD_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Number of jobs waiting in the Redis job queue.")
+JOB_QUEUE_WAIT_SECONDS = Histogram("job_queue_wait_seconds", "Time from enqueue to worker pickup.", buckets=LATENCY_BUCKETS)
+JOBS_TOTAL = Counter("jobs_total", "Jobs processed by the worker.", ["mode", "status"])
+JOB_DURATION_SECONDS = Histogram("job_duration_seconds", "End-to-end job processing time in the worker.", ["mode"], buckets=LATENCY_BUCKETS)
+STAGE_LATENCY_SECONDS = Histogram("job_stage_latency_seconds", "Latency of individual job stages.", ["stage"], buckets=LATENCY_BUCKETS)
+JOB_CANCELLATIONS_TOTAL = Counter("job_cancellations_total", "Cancelled jobs seen by the worker, by whether they were queued or running.", ["state"])
+JOB_CANCEL_LATENCY_SECONDS = Histogram("job_cancel_latency_seconds", "Time from a cancel request to the worker releasing the job.", ["state"], buckets=LATENCY_BUCKETS)
+BULK_TASK_QUEUE_DEPTH = Gauge("bulk_task_queue_depth", "Per-file map tasks of bulk jobs waiting in Redis.")
+BULK_FILES_TOTAL = Counter("bulk_files_total", "Files processed by bulk job map tasks, by whether relevant information was found.", ["status"])
+
+LLM_TOKENS_TOTAL = Counter("llm_tokens_total", "Tokens reported by model responses.", ["model", "kind"])
+CONTEXT_TOKENS_SAVED_TOTAL = Counter("context_tokens_saved_total", "Estimated prompt tokens saved by packing retrieved context, by whether it went to the executor or the controller.", ["stage"])
+LLM_RETRIES_TOTAL = Counter("llm_retries_total", "Retries performed by run_with_retry.", ["function"])
+RATE_LIMIT_WAIT_SECONDS = Histogram("rate_limit_wait_seconds", "Time callers queued for rate-limit capacity.", ["provider", "model"], buckets=LATENCY_BUCKETS)
+RATE_LIMIT_THROTTLED_TOTAL = Counter("rate_limit_throttled_total", "Calls that had to wait for rate-limit capacity.", ["provider", "model"])
+RATE_LIMIT_WAITERS = Gauge("rate_limit_waiters", "Callers in this process currently waiting for rate-limit capacity.", ["provider", "model"])
+RATE_LIMIT_AVAILABLE = Gauge("rate_limit_available", "Capacity left in the shared bucket at the last acquire.", ["provider", "model", "bucket"])
+SINGLEFLIGHT_CALLS_TOTAL = Counter("singleflight_calls_total", "Calls through the single-flight layer; follower and remote calls were coalesced into a leader's request.", ["name", "role"])
+
+EMBEDDING_BATCH_SECONDS = Histogram("embedding_batch_seconds", "Latency of embed_content calls.", ["task_type"], buckets=LATENCY_BUCKETS)
+EMBEDDING_BATCH_SIZE = Histogram("embedding_batch_size", "Number of texts per embed_content call.", ["task_type"], buckets=(1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000))
+FAISS_SEARCH_SECONDS = Histogram("faiss_search_seconds", "Latency of FAISS searches.", ["scope"], buckets=LATENCY_BUCKETS)
+RETRIEVAL_SHARD_SECONDS = Histogram("retrieval_shard_seconds", "Latency of requests to retrieval service shards, including replica retries.", ["shard"], buckets=LATENCY_BUCKETS)
+RETRIEVAL_SHARD_ERRORS_TOTAL = Counter("retrieval_shard_errors_total", "Failed requests to retrieval service replicas.", ["shard"])
+
+KB_INDEX_FILES = Gauge("kb_index_files", "Files in the published knowledge base index generation.")
+KB_INDEX_CHUNKS = Gauge("kb_index_chunks", "Chunks in the published knowledge base index generation.")
+KB_INDEX_VECTORS = Gauge("kb_index_vectors", "Distinct vectors in the published generation after near-duplicate chunks were collapsed.")
+KB_INDEX_VECTOR_BYTES = Gauge("kb_index_vector_bytes", "Memory held by the vector index and in-memory embeddings of the published generation; memory-mapped embeddings are not counted.")
+KB_INDEX_GENERATION = Gauge("kb_index_generation", "Number of the published knowledge base index generation.")
+KB_INDEX_REBUILD_SECONDS = Histogram("kb_index_rebuild_seconds", "Wall time of knowledge base index rebuilds.", buckets=REBUILD_BUCKETS)
+KB_INDEX_CHUNKS_BUILT_TOTAL = Counter("kb_index_chunks_built_total", "Chunks placed into new index generations: reused unchanged, embedded as new vectors, or collapsed into a near-duplicate's vector.", ["source"])
+KB_INDEX_CHANGES_TOTAL = Counter("kb_index_changes_total", "File changes applied incrementally from connector change feeds.")
+KB_INDEX_FRESHNESS_SECONDS = Histogram("kb_index_freshness_seconds", "Time from the first change notification of a batch to its generation being published.", buckets=LATENCY_BUCKETS)
+
+JOB_STORE_ARCHIVED_TOTAL = Counter("job_store_archived_total", "Finished jobs archived to the history store and given a TTL.", ["source"])
+JOB_STORE_RECLAIMED_BYTES = Counter("job_store_reclaimed_bytes_total", "Redis memory saved by compressing finished job hashes.", ["source"])
+REDIS_USED_MEMORY_BYTES = Gauge("redis_used_memory_bytes", "used_memory reported by Redis at the last job store compaction.")
+
+
+@contextmanager
+def observe_seconds(histogram: Histogram, **labels: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        target = histogram.labels(**labels) if labels else histogram
+        target.observe(time.perf_counter() - start)
+
+
+def record_gemini_usage(model_name: str, response: Any) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    LLM_TOKENS_TOTAL.labels(model=model_name, kind="prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+    LLM_TOKENS_TOTAL.labels(model=model_name, kind="completion").inc(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def record_openai_usage(model_name: str, response: Any) -> None:
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return
+    LLM_TOKENS_TOTAL.labels(model=model_name, kind="prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS_TOTAL.labels(model=model_name, kind="completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_retry(retry_state: Any) -> None:
+    function_name = getattr(retry_state.args[0], "__qualname__", "unknown") if retry_state.args else "unknown"
+    LLM_RETRIES_TOTAL.labels(function=function_name).inc()
+    logger.warning(f"Retrying {function_name} after attempt {retry_state.attempt_number}: {retry_state.outcome.exception()}")
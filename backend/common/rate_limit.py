@@ -0,0 +1,184 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import redis
+
+from common.metrics import (
+    RATE_LIMIT_AVAILABLE, RATE_LIMIT_THROTTLED_TOTAL, RATE_LIMIT_WAIT_SECONDS, RATE_LIMIT_WAITERS,
+)
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "300"))
+RATE_LIMIT_MAX_SLEEP_SECONDS = 1.0
+CHARS_PER_TOKEN = 4
+
+# Two token buckets (requests and tokens per minute) refilled continuously from Redis server
+# time. Capacity is taken from both or from neither; when it is short the script returns how
+# long to wait instead. A request larger than a bucket waits for a full bucket and drains it.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2 - 1])
+    local need = math.min(tonumber(ARGV[i * 2]), limit)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or limit
+    local ts = tonumber(state[2]) or now
+    level = math.min(limit, level + (now - ts) * limit / 60)
+    levels[i] = level
+    if level < need then
+        wait = math.max(wait, (need - level) * 60 / limit)
+    end
+end
+if wait == 0 then
+    for i, key in ipairs(KEYS) do
+        levels[i] = levels[i] - math.min(tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 - 1]))
+        redis.call('HSET', key, 'level', tostring(levels[i]), 'ts', tostring(now))
+        redis.call('EXPIRE', key, 120)
+    end
+end
+local result = {tostring(wait)}
+for i = 1, #levels do
+    result[i + 1] = tostring(levels[i])
+end
+return result
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def response_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        return getattr(usage, "total_token_count", None)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return getattr(usage, "total_tokens", None)
+    return None
+
+
+def load_limits() -> Dict[str, Dict[str, int]]:
+    raw = os.getenv("RATE_LIMITS", "")
+    if not raw:
+        return {}
+    try:
+        return {key: {"rpm": int(value.get("rpm", 0)), "tpm": int(value.get("tpm", 0))} for key, value in json.loads(raw).items()}
+    except (ValueError, AttributeError) as e:
+        logger.error(f"Ignoring invalid RATE_LIMITS: {e}")
+        return {}
+
+
+# Limits come from RATE_LIMITS, a JSON object keyed by "provider:model" (or "provider:*")
+# with "rpm" and "tpm" values, e.g. {"gemini:gemini-2.5-pro": {"rpm": 150, "tpm": 2000000}}.
+# Models without limits, or a limiter without Redis, are not throttled.
+class RateLimiter:
+    def __init__(self) -> None:
+        self.redis_client: Optional[redis.Redis] = None
+        self.limits = load_limits()
+        self._script = None
+
+    def attach(self, client: redis.Redis) -> None:
+        self.redis_client = client
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        if self.limits:
+            logger.info(f"Rate limits shared through Redis: {self.limits}")
+
+    def limits_for(self, provider: str, model: str) -> Optional[Dict[str, int]]:
+        return self.limits.get(f"{provider}:{model}") or self.limits.get(f"{provider}:*")
+
+    def _try_acquire(self, provider: str, model: str, limits: Dict[str, int], tokens: int) -> float:
+        keys, args, buckets = [], [], []
+        for bucket, need in (("rpm", 1), ("tpm", tokens)):
+            if limits.get(bucket):
+                keys.append(f"ratelimit:{provider}:{model}:{bucket}")
+                args += [limits[bucket], need]
+                buckets.append(bucket)
+        if not keys:
+            return 0.0
+        try:
+            result = self._script(keys=keys, args=args)
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, not throttling {provider}:{model}: {e}")
+            return 0.0
+        for bucket, level in zip(buckets, result[1:]):
+            RATE_LIMIT_AVAILABLE.labels(provider=provider, model=model, bucket=bucket).set(float(level))
+        return float(result[0])
+
+    def _should_wait(self, provider: str, model: str, tokens: int, started: float) -> Optional[float]:
+        limits = self.limits_for(provider, model)
+        if self.redis_client is None or not limits:
+            return None
+        wait = self._try_acquire(provider, model, limits, tokens)
+        if wait <= 0:
+            return None
+        if time.monotonic() - started > RATE_LIMIT_MAX_WAIT_SECONDS:
+            logger.warning(f"Waited over {RATE_LIMIT_MAX_WAIT_SECONDS}s for {provider}:{model} capacity; sending the request anyway.")
+            return None
+        return min(wait, RATE_LIMIT_MAX_SLEEP_SECONDS) * random.uniform(1.0, 1.2)
+
+    def acquire(self, provider: str, model: str, tokens: int = 0) -> None:
+        started = time.monotonic()
+        sleep = self._should_wait(provider, model, tokens, started)
+        if sleep is None:
+            return
+        RATE_LIMIT_THROTTLED_TOTAL.labels(provider=provider, model=model).inc()
+        RATE_LIMIT_WAITERS.labels(provider=provider, model=model).inc()
+        try:
+            while sleep is not None:
+                time.sleep(sleep)
+                sleep = self._should_wait(provider, model, tokens, started)
+        finally:
+            RATE_LIMIT_WAITERS.labels(provider=provider, model=model).dec()
+            RATE_LIMIT_WAIT_SECONDS.labels(provider=provider, model=model).observe(time.monotonic() - started)
+
+    async def acquire_async(self, provider: str, model: str, tokens: int = 0) -> None:
+        started = time.monotonic()
+        sleep = self._should_wait(provider, model, tokens, started)
+        if sleep is None:
+            return
+        RATE_LIMIT_THROTTLED_TOTAL.labels(provider=provider, model=model).inc()
+        RATE_LIMIT_WAITERS.labels(provider=provider, model=model).inc()
+        try:
+            while sleep is not None:
+                await asyncio.sleep(sleep)
+                sleep = self._should_wait(provider, model, tokens, started)
+        finally:
+            RATE_LIMIT_WAITERS.labels(provider=provider, model=model).dec()
+            RATE_LIMIT_WAIT_SECONDS.labels(provider=provider, model=model).observe(time.monotonic() - started)
+
+    # Token counts are only known after the response; the estimate taken up front is
+    # corrected here so the shared bucket reflects what the provider actually counted.
+    def settle(self, provider: str, model: str, estimated: int, actual: Optional[int]) -> None:
+        limits = self.limits_for(provider, model)
+        if self.redis_client is None or not limits or not limits.get("tpm") or actual is None or actual == estimated:
+            return
+        key = f"ratelimit:{provider}:{model}:tpm"
+        try:
+            if self.redis_client.exists(key):
+                self.redis_client.hincrbyfloat(key, "level", estimated - actual)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to settle token usage for {provider}:{model}: {e}")
+
+
+def rate_limited(provider: str, model: str, estimated_tokens: int, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    @functools.wraps(func)
+    async def call(*args, **kwargs):
+        await rate_limiter.acquire_async(provider, model, estimated_tokens)
+        response = await func(*args, **kwargs)
+        rate_limiter.settle(provider, model, estimated_tokens, response_tokens(response))
+        return response
+    return call
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import redis
+
+from common.codec import dumps, loads
+from common.metrics import SINGLEFLIGHT_CALLS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_LOCK_TTL_MS = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_MS", "120000"))
+SINGLEFLIGHT_RESULT_TTL_MS = int(os.getenv("SINGLEFLIGHT_RESULT_TTL_MS", "1000"))
+SINGLEFLIGHT_POLL_SECONDS = 0.05
+
+
+def make_key(name: str, *parts: Any) -> str:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+    return f"{name}:{digest}"
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# Deduplicates identical calls that are in flight at the same time: the first caller for a
+# key runs the function, later callers wait for its result instead of repeating the request.
+# With a Redis client attached, leaders in different processes coordinate through a lock key
+# and hand their JSON-serialisable result over in a short-lived result key; a process that
+# finds the lock released without a result takes over as leader.
+class SingleFlight:
+    def __init__(self) -> None:
+        self.redis_client: Optional[redis.Redis] = None
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    def enable_redis(self, client: redis.Redis) -> None:
+        self.redis_client = client
+        logger.info("Single-flight coalescing across processes enabled via Redis.")
+
+    def run(self, name: str, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+        if not is_leader:
+            SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="follower").inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._lead(name, key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    # A leader whose job is cancelled cancels the shared future; followers that were not
+    # cancelled themselves then retry, and the first of them becomes the new leader.
+    async def run_async(self, name: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future = self._futures.get(key)
+            if future is None:
+                break
+            SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="follower").inc()
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        future = self._futures[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._lead_async(name, key, fn)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._futures.pop(key, None)
+
+    def _lead(self, name: str, key: str, fn: Callable[[], Any]) -> Any:
+        if self.redis_client is None:
+            SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="leader").inc()
+            return fn()
+        while True:
+            found, result = self._remote_result(key)
+            if found:
+                SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="remote").inc()
+                return result
+            token = self._try_lock(key)
+            if token:
+                SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="leader").inc()
+                try:
+                    result = fn()
+                    self._publish(key, result)
+                    return result
+                finally:
+                    self._unlock(key, token)
+            time.sleep(SINGLEFLIGHT_POLL_SECONDS)
+
+    async def _lead_async(self, name: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.redis_client is None:
+            SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="leader").inc()
+            return await fn()
+        while True:
+            found, result = self._remote_result(key)
+            if found:
+                SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="remote").inc()
+                return result
+            token = self._try_lock(key)
+            if token:
+                SINGLEFLIGHT_CALLS_TOTAL.labels(name=name, role="leader").inc()
+                try:
+                    result = await fn()
+                    self._publish(key, result)
+                    return result
+                finally:
+                    self._unlock(key, token)
+            await asyncio.sleep(SINGLEFLIGHT_POLL_SECONDS)
+
+    def _try_lock(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            if self.redis_client.set(f"singleflight:lock:{key}", token, nx=True, px=SINGLEFLIGHT_LOCK_TTL_MS):
+                return token
+            return None
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight lock unavailable, running {key} locally: {e}")
+            return token
+
+    def _unlock(self, key: str, token: str) -> None:
+        try:
+            lock_key = f"singleflight:lock:{key}"
+            if self.redis_client.get(lock_key) == token:
+                self.redis_client.delete(lock_key)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release single-flight lock for {key}: {e}")
+
+    def _publish(self, key: str, result: Any) -> None:
+        try:
+            self.redis_client.set(f"singleflight:result:{key}", dumps(result), px=SINGLEFLIGHT_RESULT_TTL_MS)
+        except (TypeError, ValueError, redis.RedisError) as e:
+            logger.warning(f"Failed to publish single-flight result for {key}: {e}")
+
+    def _remote_result(self, key: str) -> Tuple[bool, Any]:
+        try:
+            raw = self.redis_client.get(f"singleflight:result:{key}")
+        except redis.RedisError:
+            return False, None
+        if raw is None:
+            return False, None
+        return True, loads(raw)
+
+
+singleflight = SingleFlight()
@@ -0,0 +1,126 @@
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+
+_otel_tracer = None
+
+
+class JobTrace:
+    def __init__(self, trace_id: str, job_id: str) -> None:
+        self.trace_id = trace_id
+        self.job_id = job_id
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+
+    def offset_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 3)
+
+    def finish(self) -> None:
+        self.duration_ms = self.offset_ms()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "job_id": self.job_id,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms if self.duration_ms is not None else self.offset_ms(),
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+
+_current_trace: ContextVar[Optional[JobTrace]] = ContextVar("current_trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("current_span_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace() -> Optional[JobTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(trace_id: str, job_id: str) -> Iterator[JobTrace]:
+    trace = JobTrace(trace_id, job_id)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span_id.set(None)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_span_id.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    record: Dict[str, Any] = {
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": _current_span_id.get(),
+        "name": name,
+        "start_ms": trace.offset_ms(),
+        "attributes": attributes,
+    }
+    token = _current_span_id.set(record["span_id"])
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration_ms"] = round(trace.offset_ms() - record["start_ms"], 3)
+        _current_span_id.reset(token)
+        trace.spans.append(record)
+
+
+def export_otlp(trace: JobTrace) -> None:
+    if not OTLP_ENDPOINT:
+        return
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk is not installed. Skipping OTLP export.")
+        return
+
+    global _otel_tracer
+    if _otel_tracer is None:
+        provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "engineering-hub-worker")}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces")))
+        _otel_tracer = provider.get_tracer(__name__)
+
+    start_ns = int(trace.started_at * 1e9)
+    root = _otel_tracer.start_span("job", start_time=start_ns, attributes={"job.id": trace.job_id, "job.trace_id": trace.trace_id})
+    otel_spans = {None: root}
+    for record in sorted(trace.spans, key=lambda s: s["start_ms"]):
+        parent = otel_spans.get(record["parent_id"], root)
+        attributes = {key: str(value) for key, value in record["attributes"].items()}
+        if "error" in record:
+            attributes["error"] = record["error"]
+        otel_spans[record["span_id"]] = _otel_tracer.start_span(
+            record["name"],
+            context=otel_trace.set_span_in_context(parent),
+            start_time=start_ns + int(record["start_ms"] * 1e6),
+            attributes=attributes,
+        )
+    for record in trace.spans:
+        otel_spans[record["span_id"]].end(end_time=start_ns + int((record["start_ms"] + record["duration_ms"]) * 1e6))
+    root.end(end_time=start_ns + int((trace.duration_ms or trace.offset_ms()) * 1e6))
@@ -0,0 +1,170 @@
+import io
+import logging
+import os
+import sys
+import tempfile
+import zipfile
+from typing import BinaryIO, Callable, Collection, Iterator, Optional
+
+import magic
+
+logger = logging.getLogger(__name__)
+
+ZIP_TYPES = ['application/zip', 'application/x-zip-compressed']
+RAR_TYPES = ['application/x-rar-compressed', 'application/x-rar']
+ARCHIVE_TYPES = ZIP_TYPES + RAR_TYPES
+
+# libmagic only sees the first block of an entry, which is often not enough to tell
+# an OOXML document from a plain ZIP archive.
+EXTENSION_MIME_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+SNIFF_BYTES = 64 * 1024
+READ_CHUNK_BYTES = 1024 * 1024
+SPOOL_MAX_MEMORY_BYTES = 8 * 1024 * 1024
+RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+
+class ArchiveLimitExceeded(Exception):
+    pass
+
+
+class ArchiveLimits:
+    def __init__(
+        self,
+        max_total_bytes: Optional[int] = None,
+        max_ratio: Optional[float] = None,
+        max_depth: Optional[int] = None,
+        max_entries: Optional[int] = None,
+    ) -> None:
+        self.max_total_bytes = max_total_bytes if max_total_bytes is not None else int(os.getenv("KB_ARCHIVE_MAX_TOTAL_BYTES", 512 * 1024 * 1024))
+        self.max_ratio = max_ratio if max_ratio is not None else float(os.getenv("KB_ARCHIVE_MAX_RATIO", 100))
+        self.max_depth = max_depth if max_depth is not None else int(os.getenv("KB_ARCHIVE_MAX_DEPTH", 3))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("KB_ARCHIVE_MAX_ENTRIES", 10000))
+
+
+class ArchiveEntry:
+    def __init__(self, path: str, key: str, mime_type: Optional[str], content: Optional[bytes]) -> None:
+        self.path = path
+        self.key = key
+        self.mime_type = mime_type
+        self.content = content
+
+    @property
+    def skipped(self) -> bool:
+        return self.content is None
+
+
+class _ExtractionBudget:
+    def __init__(self, limits: ArchiveLimits) -> None:
+        self.limits = limits
+        self.total_bytes = 0
+        self.entries = 0
+
+    def take_entry(self, path: str) -> None:
+        self.entries += 1
+        if self.entries > self.limits.max_entries:
+            raise ArchiveLimitExceeded(f"entry count limit of {self.limits.max_entries} exceeded at '{path}'")
+
+    def take_bytes(self, path: str, count: int) -> None:
+        self.total_bytes += count
+        if self.total_bytes > self.limits.max_total_bytes:
+            raise ArchiveLimitExceeded(f"total uncompressed size limit of {self.limits.max_total_bytes} bytes exceeded at '{path}'")
+
+
+def sniff_mime_type(entry_name: str, head: bytes) -> str:
+    mime_type = magic.from_buffer(head, mime=True)
+    if mime_type in ZIP_TYPES + ['application/octet-stream']:
+        mime_type = EXTENSION_MIME_TYPES.get(os.path.splitext(entry_name)[1].lower(), mime_type)
+    return mime_type
+
+
+def _open_archive(stream: BinaryIO, mime_type: str):
+    if mime_type in RAR_TYPES:
+        import rarfile
+
+        return rarfile.RarFile(stream)
+    return zipfile.ZipFile(stream)
+
+
+def is_archive_error(error: BaseException) -> bool:
+    if isinstance(error, zipfile.BadZipFile):
+        return True
+    rarfile = sys.modules.get("rarfile")
+    return rarfile is not None and isinstance(error, rarfile.Error)
+
+
+def _read_entry(stream: BinaryIO, path: str, compressed_size: int, head: bytes, sink: BinaryIO,
+                budget: _ExtractionBudget) -> None:
+    written = len(head)
+    sink.write(head)
+    max_ratio = budget.limits.max_ratio
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        budget.take_bytes(path, len(chunk))
+        written += len(chunk)
+        if written > RATIO_CHECK_MIN_BYTES and written > max(compressed_size, 1) * max_ratio:
+            raise ArchiveLimitExceeded(f"compression ratio limit of {max_ratio} exceeded by '{path}'")
+        sink.write(chunk)
+
+
+def walk_archive(
+    file_name: str,
+    stream: BinaryIO,
+    mime_type: str,
+    supported_types: Collection[str],
+    limits: Optional[ArchiveLimits] = None,
+    skip: Optional[Callable[[str], bool]] = None,
+    _depth: int = 0,
+    _budget: Optional[_ExtractionBudget] = None,
+) -> Iterator[ArchiveEntry]:
+    limits = limits or ArchiveLimits()
+    budget = _budget or _ExtractionBudget(limits)
+    try:
+        with _open_archive(stream, mime_type) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+            logger.info(f"[{file_name}] Archive opened at depth {_depth}. Found {len(infos)} files inside.")
+            for info in infos:
+                path = f"{file_name}/{info.filename}" if _depth > 0 else info.filename
+                key = f"archive-entry:{path}:{info.file_size}:{info.CRC}"
+                budget.take_entry(path)
+                if skip is not None and skip(key):
+                    yield ArchiveEntry(path, key, None, None)
+                    continue
+                # One oversized entry says nothing about the others; only running out of the
+                # cumulative budgets stops the whole archive.
+                if info.file_size > limits.max_total_bytes - budget.total_bytes:
+                    logger.warning(f"[{file_name}] -> Skipping '{info.filename}': declared size of {info.file_size} bytes exceeds the remaining extraction budget of {limits.max_total_bytes - budget.total_bytes} bytes.")
+                    continue
+
+                with archive.open(info) as entry_stream:
+                    head = entry_stream.read(SNIFF_BYTES)
+                    budget.take_bytes(path, len(head))
+                    entry_mime_type = sniff_mime_type(info.filename, head)
+
+                    if entry_mime_type in ARCHIVE_TYPES:
+                        if _depth + 1 > limits.max_depth:
+                            logger.warning(f"[{file_name}] -> Skipping nested archive '{info.filename}': depth limit of {limits.max_depth} reached.")
+                            continue
+                        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES) as spool:
+                            _read_entry(entry_stream, path, info.compress_size, head, spool, budget)
+                            spool.seek(0)
+                            yield from walk_archive(path, spool, entry_mime_type, supported_types, limits, skip, _depth + 1, budget)
+                        continue
+
+                    if entry_mime_type not in supported_types:
+                        logger.info(f"[{file_name}] -> Skipping '{info.filename}' with unsupported MIME type {entry_mime_type}.")
+                        continue
+
+                    buffer = io.BytesIO()
+                    _read_entry(entry_stream, path, info.compress_size, head, buffer, budget)
+                logger.info(f"[{file_name}] -> Extracted '{info.filename}' ({entry_mime_type}, {buffer.tell()} bytes).")
+                yield ArchiveEntry(path, key, entry_mime_type, buffer.getvalue())
+    except ArchiveLimitExceeded as e:
+        if _depth > 0:
+            raise
+        logger.warning(f"[{file_name}] Archive extraction stopped after {budget.entries} entries and {budget.total_bytes} bytes: {e}")
@@ -0,0 +1,111 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Identifiers such as "ГОСТ 2.301-68", "М12х1.5" or "DN-50/PN16" are kept as one
+# token and additionally split into their alphanumeric parts.
+TOKEN_RE = re.compile(r"[0-9a-zа-яё]+(?:[\-\./,][0-9a-zа-яё]+)*", re.IGNORECASE)
+PART_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for match in TOKEN_RE.finditer(text.lower()):
+        compound = match.group(0)
+        tokens.append(compound)
+        parts = PART_RE.findall(compound)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def is_identifier_token(token: str) -> bool:
+    return any(ch.isdigit() for ch in token) and (any(ch.isalpha() for ch in token) or len(token) >= 3)
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_document(self, doc_id: int, text: str) -> None:
+        if doc_id in self.doc_lengths:
+            # The replaced text is not known here, so its postings are found by scanning.
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            for term in [term for term, posting in self.postings.items() if doc_id in posting]:
+                del self.postings[term][doc_id]
+                if not self.postings[term]:
+                    del self.postings[term]
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove_document(self, doc_id: int, text: str) -> None:
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 5, doc_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        if not self.doc_lengths:
+            return []
+        allowed = set(doc_ids) if doc_ids is not None else None
+        avg_length = self.total_length / len(self.doc_lengths) or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in posting.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:top_k]
+
+    def matches_all_terms(self, query: str, doc_id: int) -> bool:
+        terms = set(tokenize(query))
+        return bool(terms) and all(doc_id in self.postings.get(term, ()) for term in terms)
+
+    def to_dict(self) -> Dict:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "postings": {term: [[doc_id, tf] for doc_id, tf in posting.items()] for term, posting in self.postings.items()},
+            "doc_lengths": [[doc_id, length] for doc_id, length in self.doc_lengths.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BM25Index":
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.postings = {term: {doc_id: tf for doc_id, tf in posting} for term, posting in data.get("postings", {}).items()}
+        index.doc_lengths = {doc_id: length for doc_id, length in data.get("doc_lengths", [])}
+        index.total_length = sum(index.doc_lengths.values())
+        logger.info(f"Loaded BM25 index with {len(index.doc_lengths)} documents and {len(index.postings)} terms.")
+        return index
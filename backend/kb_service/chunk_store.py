@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NO_LOCATION = -1
+
+
+class ChunkStore:
+    def __init__(
+        self,
+        arena: np.ndarray,
+        chunk_start: np.ndarray,
+        chunk_end: np.ndarray,
+        chunk_file: np.ndarray,
+        chunk_location: np.ndarray,
+        file_ids: List[str],
+        file_names: List[str],
+        locations: List[str],
+    ) -> None:
+        self.arena = arena
+        self.chunk_start = chunk_start
+        self.chunk_end = chunk_end
+        self.chunk_file = chunk_file
+        self.chunk_location = chunk_location
+        self.file_ids = file_ids
+        self.file_names = file_names
+        self.locations = locations
+        self._file_index = {file_id: i for i, file_id in enumerate(file_ids)}
+        self._rows_by_file = np.argsort(chunk_file, kind='stable').astype(np.int64)
+        self._file_starts = np.searchsorted(chunk_file[self._rows_by_file], np.arange(len(file_ids) + 1))
+
+    @classmethod
+    def empty(cls) -> "ChunkStore":
+        return ChunkStoreBuilder().build()
+
+    def __len__(self) -> int:
+        return len(self.chunk_file)
+
+    def text(self, row: int) -> str:
+        return self.arena[self.chunk_start[row]:self.chunk_end[row]].tobytes().decode('utf-8')
+
+    def texts(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self.text(row)
+
+    def file_id(self, row: int) -> str:
+        return self.file_ids[self.chunk_file[row]]
+
+    def location(self, row: int) -> Optional[str]:
+        location_idx = self.chunk_location[row]
+        return self.locations[location_idx] if location_idx != NO_LOCATION else None
+
+    def __getitem__(self, row: int) -> Dict:
+        file_idx = self.chunk_file[row]
+        return {
+            'text': self.text(row),
+            'file_id': self.file_ids[file_idx],
+            'file_name': self.file_names[file_idx],
+            'location': self.location(row),
+        }
+
+    def rows_for_file(self, file_id: str) -> np.ndarray:
+        file_idx = self._file_index.get(file_id)
+        if file_idx is None:
+            return np.empty(0, dtype=np.int64)
+        return self._rows_by_file[self._file_starts[file_idx]:self._file_starts[file_idx + 1]]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.arena.nbytes + self.chunk_start.nbytes + self.chunk_end.nbytes + self.chunk_file.nbytes + self.chunk_location.nbytes
+                   + self._rows_by_file.nbytes + self._file_starts.nbytes)
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "arena.bin"), 'wb') as f:
+            f.write(memoryview(self.arena))
+        np.save(os.path.join(directory, "chunk_start.npy"), self.chunk_start)
+        np.save(os.path.join(directory, "chunk_end.npy"), self.chunk_end)
+        np.save(os.path.join(directory, "chunk_file.npy"), self.chunk_file)
+        np.save(os.path.join(directory, "chunk_location.npy"), self.chunk_location)
+        with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"file_ids": self.file_ids, "file_names": self.file_names, "locations": self.locations}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False) -> "ChunkStore":
+        mmap_mode = 'r' if mmap else None
+        arena_path = os.path.join(directory, "arena.bin")
+        if mmap and os.path.getsize(arena_path) > 0:
+            arena = np.memmap(arena_path, dtype=np.uint8, mode='r')
+        else:
+            arena = np.fromfile(arena_path, dtype=np.uint8)
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        store = cls(
+            arena=arena,
+            chunk_start=np.load(os.path.join(directory, "chunk_start.npy"), mmap_mode=mmap_mode),
+            chunk_end=np.load(os.path.join(directory, "chunk_end.npy"), mmap_mode=mmap_mode),
+            chunk_file=np.load(os.path.join(directory, "chunk_file.npy"), mmap_mode=mmap_mode),
+            chunk_location=np.load(os.path.join(directory, "chunk_location.npy"), mmap_mode=mmap_mode),
+            file_ids=meta["file_ids"],
+            file_names=meta["file_names"],
+            locations=meta["locations"],
+        )
+        logger.info(f"Loaded chunk store with {len(store)} chunks from {directory} (mmap={mmap}).")
+        return store
+
+
+# Rows are appended to numpy columns whose capacity doubles as they fill up, and each call
+# stores its chunks with a few array operations instead of per-chunk appends.
+class ChunkStoreBuilder:
+    def __init__(self) -> None:
+        self._arena = bytearray()
+        self._size = 0
+        self._chunk_start = np.empty(0, dtype=np.int64)
+        self._chunk_end = np.empty(0, dtype=np.int64)
+        self._chunk_file = np.empty(0, dtype=np.int32)
+        self._chunk_location = np.empty(0, dtype=np.int32)
+        self._file_index: Dict[str, int] = {}
+        self._file_ids: List[str] = []
+        self._file_names: List[str] = []
+        self._location_index: Dict[str, int] = {}
+        self._locations: List[str] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _append(self, starts: np.ndarray, ends: np.ndarray, file_idx: int, locations: Union[int, np.ndarray]) -> None:
+        size = self._size + len(starts)
+        if size > len(self._chunk_start):
+            capacity = max(size, 2 * len(self._chunk_start), 1024)
+            for name in ('_chunk_start', '_chunk_end', '_chunk_file', '_chunk_location'):
+                column = getattr(self, name)
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                setattr(self, name, grown)
+        self._chunk_start[self._size:size] = starts
+        self._chunk_end[self._size:size] = ends
+        self._chunk_file[self._size:size] = file_idx
+        self._chunk_location[self._size:size] = locations
+        self._size = size
+
+    def _intern_file(self, file_id: str, file_name: str) -> int:
+        file_idx = self._file_index.get(file_id)
+        if file_idx is None:
+            file_idx = len(self._file_ids)
+            self._file_index[file_id] = file_idx
+            self._file_ids.append(file_id)
+            self._file_names.append(file_name)
+        return file_idx
+
+    def _intern_location(self, location: Optional[str]) -> int:
+        if not location:
+            return NO_LOCATION
+        location_idx = self._location_index.get(location)
+        if location_idx is None:
+            location_idx = len(self._locations)
+            self._location_index[location] = location_idx
+            self._locations.append(location)
+        return location_idx
+
+    # Overlapping chunks of one segment share a single UTF-8 copy of the covered text in the
+    # arena. The text is encoded piecewise between its distinct span boundaries, so every
+    # character is encoded once and the byte offsets of all spans are looked up in bulk.
+    # Encoding dominates the cost; encoding the whole segment and deriving the offsets from
+    # per-character UTF-8 widths with numpy measured slower than these piecewise encodes.
+    def add_spans(self, file_id: str, file_name: str, text: str, spans: Iterable[Tuple[int, int]], location: Optional[str] = None) -> int:
+        bounds = np.array(list(spans), dtype=np.int64).reshape(-1, 2)
+        if not len(bounds):
+            return 0
+        boundaries = np.unique(bounds)
+        points = boundaries.tolist()
+        byte_offsets = [len(self._arena)]
+        for start, end in zip(points, points[1:]):
+            self._arena += text[start:end].encode('utf-8')
+            byte_offsets.append(len(self._arena))
+        bounds = np.array(byte_offsets, dtype=np.int64)[np.searchsorted(boundaries, bounds)]
+        self._append(bounds[:, 0], bounds[:, 1], self._intern_file(file_id, file_name), self._intern_location(location))
+        return len(bounds)
+
+    # Copies rows of one file from an existing store. A file's chunks occupy one contiguous
+    # arena range, so that range is copied once and the overlapping chunks keep sharing it.
+    def add_rows(self, store: ChunkStore, file_id: str, file_name: str, rows: np.ndarray) -> int:
+        if not len(rows):
+            return 0
+        starts = store.chunk_start[rows]
+        ends = store.chunk_end[rows]
+        low, high = int(starts.min()), int(ends.max())
+        base = len(self._arena) - low
+        self._arena += store.arena[low:high].tobytes()
+        used, inverse = np.unique(store.chunk_location[rows], return_inverse=True)
+        location_map = np.array([self._intern_location(store.locations[idx] if idx != NO_LOCATION else None) for idx in used.tolist()], dtype=np.int32)
+        self._append(starts + base, ends + base, self._intern_file(file_id, file_name), location_map[inverse])
+        return len(rows)
+
+    def add(self, file_id: str, file_name: str, text: str, location: Optional[str] = None) -> int:
+        row = self._size
+        self.add_spans(file_id, file_name, text, [(0, len(text))], location)
+        return row
+
+    def build(self) -> ChunkStore:
+        return ChunkStore(
+            arena=np.frombuffer(self._arena, dtype=np.uint8),
+            chunk_start=self._chunk_start[:self._size].copy(),
+            chunk_end=self._chunk_end[:self._size].copy(),
+            chunk_file=self._chunk_file[:self._size].copy(),
+            chunk_location=self._chunk_location[:self._size].copy(),
+            file_ids=self._file_ids,
+            file_names=self._file_names,
+            locations=self._locations,
+        )
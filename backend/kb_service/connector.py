@@ -1,40 +1,80 @@
 import abc
 import logging
+import os
 import magic
 from pathlib import Path
-from typing import List, Dict, Optional, Union
+from typing import Callable, List, Dict, Iterable, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+ChangeCallback = Callable[[Iterable[str]], None]
+
+
+# Identifies the content of a file for incremental reindexing: the checksum when the source
+# provides one, otherwise size and modification time.
+def file_version(file_meta: Optional[Dict]) -> Optional[str]:
+    if not file_meta:
+        return None
+    if file_meta.get('sha256'):
+        return file_meta['sha256']
+    if file_meta.get('modified') is not None:
+        return f"{file_meta.get('size')}:{file_meta['modified']}"
+    return None
+
+
 class KnowledgeBaseConnector(abc.ABC):
+    # Whether the change feed also reports deleted and renamed files. Without that, removed
+    # documents stay searchable until the next full scan, so the scan cannot be relaxed.
+    feed_reports_removals = False
+
     @abc.abstractmethod
-    def list_files_recursive(self) -> List[Dict[str, str]]:
+    def list_files_recursive(self, path: str = '/') -> List[Dict[str, str]]:
         raise NotImplementedError
 
     @abc.abstractmethod
     def get_file_content(self, file_id: str) -> Optional[bytes]:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_file_metadata(self, file_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    # Starts a change feed that reports ids of added, modified or removed files (a removed
+    # directory is reported by its own id). Returns False when the connector has none.
+    def watch(self, on_change: ChangeCallback) -> bool:
+        return False
+
+    def stop_watching(self) -> None:
+        pass
+
 class MockConnector(KnowledgeBaseConnector):
+    feed_reports_removals = True
+
     def __init__(self) -> None:
-        self.base_path = Path("./mock_disk")
-        self.base_path.mkdir(exist_ok=True)
+        self.base_path = Path(os.getenv("MOCK_DISK_PATH", "./mock_disk"))
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        self._observer = None
         logger.info(f"MockConnector initialized with base path: {self.base_path.resolve()}")
 
-    def list_files_recursive(self) -> List[Dict[str, str]]:
-        logger.info(f"Scanning for files in {self.base_path.resolve()}")
+    def _file_meta(self, item: Path) -> Dict:
+        stat = item.stat()
+        return {
+            "id": str(item.relative_to(self.base_path)),
+            "name": item.name,
+            "path": str(item.resolve()),
+            "mime_type": magic.from_file(str(item), mime=True),
+            "size": stat.st_size,
+            "modified": stat.st_mtime_ns,
+        }
+
+    def list_files_recursive(self, path: str = '/') -> List[Dict[str, str]]:
+        root = self.base_path / path.lstrip('/')
+        logger.info(f"Scanning for files in {root.resolve()}")
         files_metadata: List[Dict[str, str]] = []
-        for item in self.base_path.rglob('*'):
+        for item in root.rglob('*'):
             if item.is_file():
                 try:
-                    mime_type = magic.from_file(str(item), mime=True)
-                    file_meta = {
-                        "id": str(item.relative_to(self.base_path)),
-                        "name": item.name,
-                        "path": str(item.resolve()),
-                        "mime_type": mime_type,
-                    }
-                    files_metadata.append(file_meta)
+                    files_metadata.append(self._file_meta(item))
                 except Exception as e:
                     logger.error(f"Could not process file {item}: {e}")
         return files_metadata
@@ -58,3 +98,59 @@ class MockConnector(KnowledgeBaseConnector):
         except Exception as e:
             logger.error(f"An error occurred while getting content for file_id {file_id}: {e}")
             return None
+
+    def get_file_metadata(self, file_id: str) -> Optional[Dict]:
+        file_path = self.base_path / file_id
+        if not file_path.resolve().is_relative_to(self.base_path.resolve()) or not file_path.is_file():
+            return None
+        try:
+            return self._file_meta(file_path)
+        except OSError as e:
+            logger.warning(f"Could not read metadata for {file_id}: {e}")
+            return None
+
+    def _changed_ids(self, event) -> List[str]:
+        if event.is_directory and event.event_type == "modified":
+            return []
+        root = self.base_path.resolve()
+        file_ids = []
+        for raw_path in filter(None, (event.src_path, getattr(event, 'dest_path', ''))):
+            path = Path(os.fsdecode(raw_path))
+            if not path.is_relative_to(root):
+                continue
+            if path.is_dir():
+                file_ids.extend(str(item.relative_to(root)) for item in path.rglob('*') if item.is_file())
+            else:
+                file_ids.append(str(path.relative_to(root)))
+        return file_ids
+
+    def watch(self, on_change: ChangeCallback) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.warning("watchdog is not installed; mock disk changes are only picked up by the periodic scan.")
+            return False
+
+        connector = self
+
+        class ChangeHandler(FileSystemEventHandler):
+            def on_any_event(self, event) -> None:
+                if event.event_type not in ("created", "modified", "deleted", "moved", "closed"):
+                    return
+                file_ids = connector._changed_ids(event)
+                if file_ids:
+                    on_change(file_ids)
+
+        observer = Observer()
+        observer.schedule(ChangeHandler(), str(self.base_path.resolve()), recursive=True)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+        logger.info(f"Watching {self.base_path.resolve()} for changes.")
+        return True
+
+    def stop_watching(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
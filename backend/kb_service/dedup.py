@@ -0,0 +1,83 @@
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .bm25 import PART_RE
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 8
+KB_DEDUP_ENABLED = os.getenv("KB_DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+KB_DEDUP_MAX_DISTANCE = int(os.getenv("KB_DEDUP_MAX_DISTANCE", "3"))
+
+_BIT_MASKS = np.uint64(1) << np.arange(SIMHASH_BITS, dtype=np.uint64)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+# 64-bit SimHash over word shingles. Chunks that differ in a few words (a revised
+# paragraph, a changed date, an archive copy with different whitespace) end up a few bits
+# apart. Texts with fewer than MIN_SHINGLES shingles get a plain hash of their words with
+# the top bit set instead, so short chunks collapse only with identical ones.
+def simhash(text: str) -> int:
+    words = PART_RE.findall(text.lower())
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))]
+    if len(shingles) < MIN_SHINGLES:
+        return _hash64(" ".join(words)) | (1 << (SIMHASH_BITS - 1))
+    hashes = np.fromiter((_hash64(shingle) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    votes = ((hashes[:, None] & _BIT_MASKS) != 0).sum(axis=0)
+    fingerprint = int(np.bitwise_or.reduce(_BIT_MASKS[votes * 2 > len(shingles)], initial=np.uint64(0)))
+    return fingerprint & ~(1 << (SIMHASH_BITS - 1))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+# Assigns chunks to vector slots. Fingerprints are split into SIMHASH_BANDS bands; two
+# fingerprints within KB_DEDUP_MAX_DISTANCE bits (less than the number of bands) agree on at
+# least one band, so checking the slots that share a band with the new fingerprint finds every
+# near-duplicate without comparing against all of them.
+class NearDuplicateIndex:
+    def __init__(self, max_distance: int = KB_DEDUP_MAX_DISTANCE, enabled: bool = KB_DEDUP_ENABLED) -> None:
+        self.max_distance = min(max_distance, SIMHASH_BANDS - 1)
+        self.enabled = enabled
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(SIMHASH_BANDS)]
+        self._fingerprints: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def _bands(self, fingerprint: int) -> List[int]:
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (band * self._band_bits)) & mask for band in range(SIMHASH_BANDS)]
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        if not self.enabled:
+            return None
+        for buckets, key in zip(self._buckets, self._bands(fingerprint)):
+            for slot in buckets.get(key, ()):
+                if hamming(self._fingerprints[slot], fingerprint) <= self.max_distance:
+                    return slot
+        return None
+
+    def assign(self, fingerprint: int) -> int:
+        slot = self.find(fingerprint)
+        if slot is not None:
+            return slot
+        slot = len(self._fingerprints)
+        self._fingerprints.append(fingerprint)
+        for buckets, key in zip(self._buckets, self._bands(fingerprint)):
+            buckets.setdefault(key, []).append(slot)
+        return slot
+
+
+def assign_slots(fingerprints: np.ndarray) -> np.ndarray:
+    index = NearDuplicateIndex()
+    return np.fromiter((index.assign(int(fp)) for fp in fingerprints), dtype=np.int64, count=len(fingerprints))
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import shutil
+import time
+import weakref
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from common.metrics import FAISS_SEARCH_SECONDS, observe_seconds
+from common.tracing import span
+
+from .bm25 import BM25Index, is_identifier_token, tokenize
+from .chunk_store import ChunkStore
+
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
+
+CURRENT_POINTER = "CURRENT"
+VECTOR_STORAGES = ("float32", "float16", "int8")
+
+
+# float32 searches a flat FAISS index holding a second full copy of the embeddings. float16
+# and int8 keep only scalar-quantized codes in the index (2 or 1 bytes per dimension) and
+# re-score the candidates exactly against the float32 embeddings, which a persisted
+# generation maps from disk instead of holding in memory.
+def build_vector_index(embeddings: np.ndarray, storage: str) -> "faiss.Index":
+    import faiss
+
+    if storage not in VECTOR_STORAGES:
+        raise ValueError(f"Unknown vector storage '{storage}'. Expected one of {VECTOR_STORAGES}.")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if storage == "float32":
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+    else:
+        qtype = faiss.ScalarQuantizer.QT_fp16 if storage == "float16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(embeddings.shape[1], qtype, faiss.METRIC_L2)
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def vector_storage(index: "faiss.Index") -> str:
+    import faiss
+
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "float16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+
+# Maximal marginal relevance over the vectors of an already ranked candidate list: each pick
+# trades the candidate's rank against its cosine similarity to the chunks picked before it.
+# Returns the positions of the picks.
+def mmr_order(vectors: np.ndarray, top_k: int, mmr_lambda: float) -> List[int]:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    relevance = 1.0 - np.arange(len(vectors)) / max(len(vectors), 1)
+    redundancy = np.full(len(vectors), -1.0)
+    available = np.ones(len(vectors), dtype=bool)
+    picked: List[int] = []
+    for _ in range(min(top_k, len(vectors))):
+        scores = np.where(available, mmr_lambda * relevance - (1.0 - mmr_lambda) * np.maximum(redundancy, 0.0), -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return picked
+
+
+# Immutable snapshot of the knowledge base. Readers take one reference to a generation and
+# use only that; rebuilds publish a new generation instead of mutating the current one.
+# Near-duplicate chunks keep their own rows in the chunk store but share one vector slot:
+# row_vector maps rows to slots, and BM25 and FAISS only hold the first row of each slot.
+class IndexGeneration:
+    def __init__(
+        self,
+        number: int,
+        files: Dict[str, Dict],
+        chunks: ChunkStore,
+        bm25: BM25Index,
+        embeddings: Optional[np.ndarray],
+        index: Optional["faiss.Index"],
+        built_at: Optional[float] = None,
+        row_vector: Optional[np.ndarray] = None,
+        fingerprints: Optional[np.ndarray] = None,
+    ) -> None:
+        self.number = number
+        self.files = files
+        self.chunks = chunks
+        self.bm25 = bm25
+        self.embeddings = embeddings
+        self.index = index
+        self.storage = vector_storage(index) if index is not None else "float32"
+        self.built_at = built_at or time.time()
+        self.row_vector = row_vector if row_vector is not None else np.arange(len(chunks), dtype=np.int64)
+        self.fingerprints = fingerprints
+        vectors = int(self.row_vector.max()) + 1 if len(self.row_vector) else 0
+        self._rows_by_vector = np.argsort(self.row_vector, kind='stable').astype(np.int64)
+        self._vector_starts = np.searchsorted(self.row_vector[self._rows_by_vector], np.arange(vectors + 1))
+        self.vector_rows = self._rows_by_vector[self._vector_starts[:-1]]
+        weakref.finalize(self, logger.info, f"Index generation {number} released.")
+
+    @classmethod
+    def empty(cls) -> "IndexGeneration":
+        return cls(0, {}, ChunkStore.empty(), BM25Index(), None, None)
+
+    @property
+    def is_searchable(self) -> bool:
+        return self.index is not None and self.embeddings is not None
+
+    @property
+    def is_quantized(self) -> bool:
+        return self.storage != "float32"
+
+    # Memory held by the vector search structures; memory-mapped embeddings live in the page
+    # cache and are not counted.
+    @property
+    def vector_bytes(self) -> int:
+        if self.index is None:
+            return 0
+        code_size = getattr(self.index, "code_size", self.index.d * 4)
+        embedding_bytes = self.embeddings.nbytes if self.embeddings is not None and not isinstance(self.embeddings, np.memmap) else 0
+        return int(self.index.ntotal) * code_size + embedding_bytes
+
+    def info(self) -> Dict:
+        return {
+            "generation": self.number,
+            "built_at": self.built_at,
+            "files": len(self.files),
+            "chunks": len(self.chunks),
+            "vectors": len(self.vector_rows),
+            "duplicate_chunks": len(self.chunks) - len(self.vector_rows),
+            "vector_storage": self.storage,
+            "vector_bytes": self.vector_bytes,
+        }
+
+    def canonical_rows(self, rows: np.ndarray) -> np.ndarray:
+        return np.unique(self.vector_rows[self.row_vector[rows]])
+
+    def rows_for_vector(self, vector: int) -> np.ndarray:
+        return self._rows_by_vector[self._vector_starts[vector]:self._vector_starts[vector + 1]]
+
+    def file_candidates(self, file_id: Optional[str]) -> Optional[np.ndarray]:
+        if not file_id:
+            return None
+        return self.canonical_rows(self.chunks.rows_for_file(file_id))
+
+    def sources(self, row: int) -> List[str]:
+        return list(dict.fromkeys(self.chunks.file_names[self.chunks.chunk_file[other]] for other in self.rows_for_vector(self.row_vector[row])))
+
+    # Search works on canonical rows; a file-scoped search reports the matching chunk of that
+    # file rather than its twin from another revision.
+    def chunk(self, row: int, file_id: Optional[str] = None) -> Dict:
+        if file_id:
+            rows = self.chunks.rows_for_file(file_id)
+            own = rows[self.row_vector[rows] == self.row_vector[row]]
+            if len(own):
+                row = int(own[0])
+        span = (int(self.chunks.chunk_start[row]), int(self.chunks.chunk_end[row]))
+        return {**self.chunks[row], 'sources': self.sources(row), 'span': span}
+
+    # Maximal marginal relevance over an already ranked candidate list, see mmr_order.
+    def diversify(self, ranked: List[int], top_k: int, mmr_lambda: float) -> List[int]:
+        if mmr_lambda >= 1.0 or len(ranked) <= 1 or self.embeddings is None:
+            return ranked[:top_k]
+        return [ranked[i] for i in mmr_order(self.embeddings[self.row_vector[ranked]], top_k, mmr_lambda)]
+
+    def lexical_search(self, query: str, top_k: int, candidate_ids: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        return self.bm25.search(query, top_k=top_k, doc_ids=candidate_ids)
+
+    def is_exact_match(self, query: str, lexical_hits: List[Tuple[int, float]]) -> bool:
+        if not lexical_hits:
+            return False
+        if not any(is_identifier_token(token) for token in tokenize(query)):
+            return False
+        return self.bm25.matches_all_terms(query, lexical_hits[0][0])
+
+    def vector_search_many(
+        self, query_embeddings: np.ndarray, top_k: int, candidate_ids: Optional[np.ndarray], rerank_factor: int = 1
+    ) -> List[List[Tuple[int, float]]]:
+        if candidate_ids is not None:
+            import faiss
+
+            target_embeddings = self.embeddings[self.row_vector[candidate_ids]]
+            temp_index = faiss.IndexFlatL2(target_embeddings.shape[1])
+            temp_index.add(target_embeddings)
+            with span("faiss_search", scope="file", queries=len(query_embeddings), candidates=len(candidate_ids)), observe_seconds(FAISS_SEARCH_SECONDS, scope="file"):
+                distances, local_indices = temp_index.search(query_embeddings, k=min(top_k, len(candidate_ids)))
+            return [
+                [(int(candidate_ids[i]), float(d)) for i, d in zip(row_indices, row_distances) if i >= 0]
+                for row_indices, row_distances in zip(local_indices, distances)
+            ]
+
+        rerank = self.is_quantized and rerank_factor > 0
+        fetch_k = top_k * rerank_factor if rerank else top_k
+        with span("faiss_search", scope="global", queries=len(query_embeddings), top_k=fetch_k, storage=self.storage), observe_seconds(FAISS_SEARCH_SECONDS, scope="global"):
+            distances, vector_indices = self.index.search(query_embeddings, k=fetch_k)
+        if rerank:
+            with span("exact_rerank", queries=len(query_embeddings), candidates=fetch_k):
+                return [self._rerank(query, row_indices, top_k) for query, row_indices in zip(query_embeddings, vector_indices)]
+        return [
+            [(int(self.vector_rows[i]), float(d)) for i, d in zip(row_indices, row_distances) if 0 <= i < len(self.vector_rows)]
+            for row_indices, row_distances in zip(vector_indices, distances)
+        ]
+
+    # Exact squared L2 distances, as IndexFlatL2 reports them, for the candidates of one query.
+    # Slots are read in ascending order so a memory-mapped file is read mostly sequentially.
+    def _rerank(self, query: np.ndarray, vector_indices: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        slots = np.unique(vector_indices[(vector_indices >= 0) & (vector_indices < len(self.vector_rows))])
+        distances = ((self.embeddings[slots] - query) ** 2).sum(axis=1)
+        best = np.argsort(distances, kind='stable')[:top_k]
+        return [(int(self.vector_rows[slots[i]]), float(distances[i])) for i in best]
+
+    def save(self, index_dir: str) -> None:
+        import faiss
+
+        generations_dir = os.path.join(index_dir, "generations")
+        target_dir = os.path.join(generations_dir, str(self.number))
+        tmp_dir = f"{target_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        faiss.write_index(self.index, os.path.join(tmp_dir, "index.faiss"))
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), self.embeddings)
+        np.save(os.path.join(tmp_dir, "row_vector.npy"), self.row_vector)
+        if self.fingerprints is not None:
+            np.save(os.path.join(tmp_dir, "fingerprints.npy"), self.fingerprints)
+        self.chunks.save(os.path.join(tmp_dir, "chunk_store"))
+        with open(os.path.join(tmp_dir, "files.json"), 'w', encoding='utf-8') as f:
+            json.dump({"generation": self.number, "built_at": self.built_at, "files": self.files}, f, ensure_ascii=False)
+        with open(os.path.join(tmp_dir, "bm25.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.bm25.to_dict(), f, ensure_ascii=False)
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.replace(tmp_dir, target_dir)
+
+        pointer_tmp = os.path.join(index_dir, f"{CURRENT_POINTER}.tmp")
+        with open(pointer_tmp, 'w', encoding='utf-8') as f:
+            f.write(str(self.number))
+        os.replace(pointer_tmp, os.path.join(index_dir, CURRENT_POINTER))
+
+        # Files of older generations may still be memory-mapped by in-flight readers; on POSIX
+        # unlinking them is safe, the pages stay valid until the last mapping goes away.
+        for name in os.listdir(generations_dir):
+            if name != str(self.number):
+                shutil.rmtree(os.path.join(generations_dir, name), ignore_errors=True)
+
+    # Behind a quantized index the float32 embeddings are only read for re-ranking, MMR and
+    # file-scoped searches, so they are memory-mapped. A storage other than the persisted one
+    # rebuilds the index from the embeddings.
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = False, storage: Optional[str] = None) -> Optional["IndexGeneration"]:
+        pointer_path = os.path.join(index_dir, CURRENT_POINTER)
+        if not os.path.exists(pointer_path):
+            return None
+        import faiss
+
+        with open(pointer_path, 'r', encoding='utf-8') as f:
+            generation_dir = os.path.join(index_dir, "generations", f.read().strip())
+        with open(os.path.join(generation_dir, "files.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(generation_dir, "bm25.json"), 'r', encoding='utf-8') as f:
+            bm25 = BM25Index.from_dict(json.load(f))
+        # Generations written before deduplication have one vector per row and no fingerprints.
+        row_vector_path = os.path.join(generation_dir, "row_vector.npy")
+        fingerprints_path = os.path.join(generation_dir, "fingerprints.npy")
+        index = faiss.read_index(os.path.join(generation_dir, "index.faiss"))
+        persisted = vector_storage(index)
+        storage = storage or persisted
+        embeddings = np.load(os.path.join(generation_dir, "embeddings.npy"), mmap_mode='r' if storage != "float32" else None)
+        if storage != persisted:
+            logger.info(f"Rebuilding the {persisted} vector index of generation {meta['generation']} as {storage}.")
+            index = build_vector_index(embeddings, storage)
+        return cls(
+            number=meta["generation"],
+            files=meta["files"],
+            chunks=ChunkStore.load(os.path.join(generation_dir, "chunk_store"), mmap=mmap),
+            bm25=bm25,
+            embeddings=embeddings,
+            index=index,
+            built_at=meta.get("built_at"),
+            row_vector=np.load(row_vector_path) if os.path.exists(row_vector_path) else None,
+            fingerprints=np.load(fingerprints_path) if os.path.exists(fingerprints_path) else None,
+        )
@@ -1,119 +1,522 @@
 import logging
-from typing import List, Dict, Optional
+import os
+import threading
+import time
+from typing import Iterable, List, Dict, Optional, Set, Tuple
 
-import faiss
 import numpy as np
 import google.generativeai as genai
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-from .connector import KnowledgeBaseConnector
-from .parser import parse_document
+from common.metrics import (
+    EMBEDDING_BATCH_SECONDS, EMBEDDING_BATCH_SIZE, KB_INDEX_CHANGES_TOTAL, KB_INDEX_CHUNKS, KB_INDEX_CHUNKS_BUILT_TOTAL,
+    KB_INDEX_FILES, KB_INDEX_FRESHNESS_SECONDS, KB_INDEX_GENERATION, KB_INDEX_REBUILD_SECONDS, KB_INDEX_VECTOR_BYTES, KB_INDEX_VECTORS,
+    observe_seconds,
+)
+from common.rate_limit import estimate_tokens, rate_limiter
+from common.singleflight import make_key, singleflight
+from common.tracing import span
+
+from .bm25 import BM25Index
+from .chunk_store import ChunkStore, ChunkStoreBuilder
+from .connector import KnowledgeBaseConnector, file_version
+from .dedup import assign_slots, simhash
+from .generation import VECTOR_STORAGES, IndexGeneration, build_vector_index
+from .parse_cache import ParsedTextCache, file_key
+from .parser import parse_document_segments
+from .splitter import FastTextSplitter
 
 logger = logging.getLogger(__name__)
 
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+RRF_K = 60
+WARMING_UP_STATES = ("starting", "loading", "building")
+KB_CHANGE_DEBOUNCE_SECONDS = float(os.getenv("KB_CHANGE_DEBOUNCE_SECONDS", "2"))
+KB_CHANGE_MAX_DELAY_SECONDS = float(os.getenv("KB_CHANGE_MAX_DELAY_SECONDS", "30"))
+KB_FULL_SCAN_INTERVAL_MINUTES = os.getenv("KB_FULL_SCAN_INTERVAL_MINUTES")
+KB_MMR_LAMBDA = float(os.getenv("KB_MMR_LAMBDA", "0.7"))
+KB_MMR_CANDIDATES_FACTOR = int(os.getenv("KB_MMR_CANDIDATES_FACTOR", "4"))
+KB_RERANK_FACTOR = int(os.getenv("KB_RERANK_FACTOR", "4"))
+
+
+def embed_queries(model: str, queries: List[str]) -> np.ndarray:
+    def embed() -> Dict:
+        EMBEDDING_BATCH_SIZE.labels(task_type="RETRIEVAL_QUERY").observe(len(queries))
+        rate_limiter.acquire("gemini", model, sum(estimate_tokens(query) for query in queries))
+        with observe_seconds(EMBEDDING_BATCH_SECONDS, task_type="RETRIEVAL_QUERY"):
+            return dict(genai.embed_content(model=model, content=queries, task_type="RETRIEVAL_QUERY"))
+
+    with span("embed_queries", queries=len(queries)):
+        query_embedding_result = singleflight.run("embed_content", make_key("embed_content", model, "RETRIEVAL_QUERY", queries), embed)
+    return np.array(query_embedding_result['embedding']).astype('float32').reshape(len(queries), -1)
+
+
+# Round-robin over the per-query rankings, so every query contributes its best chunks
+# before any query contributes its second best. Chunks found by several queries appear
+# once with all of them in 'queries'.
+def interleave_rankings(queries: List[str], rankings: Dict[str, List[Dict]], top_k: int) -> List[Dict]:
+    matched: Dict[Tuple, Dict] = {}
+    for rank in range(top_k):
+        for query in queries:
+            ranking = rankings.get(query, [])
+            if rank < len(ranking):
+                chunk = ranking[rank]
+                matched.setdefault((chunk['file_id'], tuple(chunk['span'])), {**chunk, 'queries': []})['queries'].append(query)
+    return list(matched.values())
+
+
 class KnowledgeBaseIndexer:
     def __init__(self, connector: KnowledgeBaseConnector) -> None:
         self.connector = connector
-        self.files: Dict[str, Dict] = {}
-        self.index: Optional[faiss.Index] = None
-        self.embeddings: Optional[np.ndarray] = None
-        self.chunks: List[Dict] = []
+        self.generation = IndexGeneration.empty()
+        self._build_lock = threading.Lock()
+        self.warmup_state = "starting"
+        self.warmup_error: Optional[str] = None
+        self.build_progress: Dict = {}
+        self.watching = False
+        self._pending_changes: Set[str] = set()
+        self._pending_since: Optional[float] = None
+        self._pending_lock = threading.Lock()
+        self._debounce_timer: Optional[threading.Timer] = None
+        self.index_dir = os.getenv("KB_INDEX_DIR", "kb_index")
+        self.use_mmap = os.getenv("KB_CHUNK_STORE_MMAP", "false").lower() in ("1", "true", "yes")
+        self.vector_storage = os.getenv("KB_VECTOR_STORAGE", "float32")
+        if self.vector_storage not in VECTOR_STORAGES:
+            raise ValueError(f"Unknown KB_VECTOR_STORAGE '{self.vector_storage}'. Expected one of {VECTOR_STORAGES}.")
+        self.parse_cache = ParsedTextCache(os.path.join(self.index_dir, "parse_cache"))
         self.embedding_model = 'models/embedding-001'
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.text_splitter = FastTextSplitter(
             chunk_size=1500,
             chunk_overlap=300,
-            separators=["\n\n", "\n", ". ", " ", ""]
+            separators=["\n\n", "\n", ". ", " "]
         )
 
-    def build_index(self) -> None:
-        logger.info("Starting production knowledge base index build.")
-        all_files = self.connector.list_files_recursive('/')
+    @property
+    def files(self) -> Dict[str, Dict]:
+        return self.generation.files
 
-        self.files = {file['id']: file for file in all_files}
-        self.chunks = []
-        self.index = None
-        self.embeddings = None
+    @property
+    def chunks(self) -> ChunkStore:
+        return self.generation.chunks
 
-        for file_id, file_meta in self.files.items():
+    @property
+    def is_warming_up(self) -> bool:
+        return self.warmup_state in WARMING_UP_STATES and not self.generation.is_searchable
+
+    # Serves the last persisted generation as soon as it is loaded and only then refreshes it
+    # from the connector, so a restart never waits for a full rebuild.
+    def warm_up(self, refresh: bool = True) -> None:
+        start = time.perf_counter()
+        self.warmup_state = "loading"
+        self.warmup_error = None
+        loaded = self.load()
+        if loaded:
+            self.warmup_state = "ready"
+            logger.info(f"Knowledge base ready from persisted index in {time.perf_counter() - start:.2f}s.")
+            if not refresh:
+                return
+        else:
+            self.warmup_state = "building"
+        try:
+            self.build_index()
+        except Exception as e:
+            logger.error(f"Knowledge base warm-up build failed: {e}", exc_info=True)
+            self.warmup_error = str(e)
+        if self.generation.is_searchable:
+            self.warmup_state = "ready"
+        elif not loaded:
+            self.warmup_state = "degraded"
+        logger.info(f"Knowledge base warm-up finished in {time.perf_counter() - start:.2f}s, state: {self.warmup_state}.")
+
+    def build_index(self) -> None:
+        with self._build_lock:
+            start = time.perf_counter()
             try:
-                content = self.connector.get_file_content(file_id)
-                if not content:
-                    continue
+                generation = self._build_generation(self.generation.number + 1)
+                if generation is not None:
+                    self._publish(generation)
+            finally:
+                self.build_progress = {}
+            KB_INDEX_REBUILD_SECONDS.observe(time.perf_counter() - start)
 
-                parsed_text = parse_document(file_meta['name'], content, file_meta.get('mime_type'))
-                if not parsed_text or not parsed_text.strip():
-                    continue
+    # Files whose version matches the previous generation keep their chunks, fingerprints and
+    # embeddings; only new or changed files are parsed. Near-duplicate chunks then share one
+    # vector slot, and only slots without a previous vector are embedded. BM25 and FAISS are
+    # rebuilt over one row per slot, which is local work.
+    def _build_generation(self, number: int, files: Optional[Dict[str, Dict]] = None) -> Optional[IndexGeneration]:
+        logger.info(f"Starting production knowledge base index build (generation {number}).")
+        if files is None:
+            self.build_progress = {"stage": "listing", "files_total": 0, "files_done": 0}
+            all_files = self.connector.list_files_recursive('/')
+            files = {file['id']: file for file in all_files}
+        previous = self.generation
 
-                split_chunks = self.text_splitter.split_text(parsed_text)
-                for chunk_text in split_chunks:
-                    self.chunks.append({
-                        'text': chunk_text,
-                        'file_id': file_id,
-                        'file_name': file_meta['name']
-                    })
+        builder = ChunkStoreBuilder()
+        reused: List[Tuple[int, np.ndarray]] = []
+        new_rows: List[int] = []
+        self.parse_cache.reset_stats()
+        self.build_progress = {"stage": "parsing", "files_total": len(files), "files_done": 0}
+        for file_id, file_meta in files.items():
+            self.build_progress["files_done"] += 1
+            version = file_version(file_meta)
+            if previous.is_searchable and version is not None and version == file_version(previous.files.get(file_id)):
+                rows = previous.chunks.rows_for_file(file_id)
+                if len(rows):
+                    first = len(builder)
+                    builder.add_rows(previous.chunks, file_id, file_meta['name'], rows)
+                    reused.append((first, rows))
+                    if file_meta.get('sha256'):
+                        self.parse_cache.touch(file_key(file_meta.get('mime_type'), file_meta['sha256']))
+                    continue
+            try:
+                segments = self._parse_file(file_id, file_meta)
+                for segment in segments:
+                    text = segment['text']
+                    spans = list(self.text_splitter.split_spans(text))
+                    first = len(builder)
+                    new_rows.extend(range(first, first + len(spans)))
+                    builder.add_spans(file_id, file_meta['name'], text, spans, segment.get('location'))
             except Exception as e:
                 logger.error(f"Failed to process file {file_meta.get('name', file_id)}: {e}")
+        chunks = builder.build()
+        logger.info(f"Parse cache: {self.parse_cache.hits} hits, {self.parse_cache.misses} misses. Chunk store uses {chunks.nbytes} bytes.")
 
-        if not self.chunks:
+        if not len(chunks):
             logger.warning("No chunks were created from the documents. Index is empty.")
-            return
+            return IndexGeneration(number, files, chunks, BM25Index(), None, None)
+
+        self.build_progress["stage"] = "deduplicating"
+        fingerprints = np.empty(len(chunks), dtype=np.uint64)
+        previous_rows = np.full(len(chunks), -1, dtype=np.int64)
+        for first, rows in reused:
+            previous_rows[first:first + len(rows)] = rows
+            if previous.fingerprints is not None:
+                fingerprints[first:first + len(rows)] = previous.fingerprints[rows]
+            else:
+                fingerprints[first:first + len(rows)] = [simhash(previous.chunks.text(row)) for row in rows]
+        for row in new_rows:
+            fingerprints[row] = simhash(chunks.text(row))
+        row_vector = assign_slots(fingerprints)
+        vectors = int(row_vector.max()) + 1
+        vector_rows = np.unique(row_vector, return_index=True)[1]
+        previous_vector = np.full(vectors, -1, dtype=np.int64)
+        carried = np.flatnonzero(previous_rows >= 0)
+        carried_vectors, first_carried = np.unique(row_vector[carried], return_index=True)
+        previous_vector[carried_vectors] = previous.row_vector[previous_rows[carried[first_carried]]]
+
+        bm25 = BM25Index()
+        for row in vector_rows:
+            bm25.add_document(int(row), chunks.text(row))
+
+        to_embed = np.flatnonzero(previous_vector < 0)
+        reused_count = len(chunks) - len(new_rows)
+        logger.info(f"Generated {len(chunks)} chunks ({reused_count} reused from generation {previous.number}) in {vectors} distinct vectors. Embedding {len(to_embed)} new vectors...")
+        KB_INDEX_CHUNKS_BUILT_TOTAL.labels(source="reused").inc(reused_count)
+        KB_INDEX_CHUNKS_BUILT_TOTAL.labels(source="embedded").inc(len(to_embed))
+        KB_INDEX_CHUNKS_BUILT_TOTAL.labels(source="duplicate").inc(len(chunks) - vectors)
+        self.build_progress["stage"] = "embedding"
+        new_embeddings = self._embed_documents([chunks.text(row) for row in vector_rows[to_embed]])
+        dimension = new_embeddings.shape[1] if len(to_embed) else previous.embeddings.shape[1]
+        embeddings = np.empty((vectors, dimension), dtype='float32')
+        if len(to_embed):
+            embeddings[to_embed] = new_embeddings
+        kept = np.flatnonzero(previous_vector >= 0)
+        if len(kept):
+            embeddings[kept] = previous.embeddings[previous_vector[kept]]
 
-        logger.info(f"Generated {len(self.chunks)} chunks. Now creating embeddings...")
-        chunk_texts = [c['text'] for c in self.chunks]
-        result = genai.embed_content(
-            model=self.embedding_model,
-            content=chunk_texts,
-            task_type="RETRIEVAL_DOCUMENT"
+        index = build_vector_index(embeddings, self.vector_storage)
+        logger.info(f"FAISS index ({self.vector_storage}) built successfully with {vectors} vectors for {len(chunks)} chunks from {len(files)} files.")
+        self._report_reduction(chunks, vectors, dimension)
+        return IndexGeneration(number, files, chunks, bm25, embeddings, index, row_vector=row_vector, fingerprints=fingerprints)
+
+    @staticmethod
+    def _report_reduction(chunks: ChunkStore, vectors: int, dimension: int) -> None:
+        duplicates = len(chunks) - vectors
+        saved_bytes = duplicates * dimension * 4 * 2
+        logger.info(
+            f"Near-duplicate collapse: {duplicates} of {len(chunks)} chunks share a vector "
+            f"({duplicates / len(chunks):.1%} fewer vectors, about {saved_bytes / 1e6:.1f} MB of embeddings and FAISS index saved)."
         )
 
-        embeddings_array = np.array(result['embedding']).astype('float32')
-        self.embeddings = embeddings_array
+    def _embed_documents(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        EMBEDDING_BATCH_SIZE.labels(task_type="RETRIEVAL_DOCUMENT").observe(len(texts))
+        rate_limiter.acquire("gemini", self.embedding_model, sum(estimate_tokens(text) for text in texts))
+        with observe_seconds(EMBEDDING_BATCH_SECONDS, task_type="RETRIEVAL_DOCUMENT"):
+            result = genai.embed_content(
+                model=self.embedding_model,
+                content=texts,
+                task_type="RETRIEVAL_DOCUMENT"
+            )
+        return np.array(result['embedding']).astype('float32')
+
+    def start_watching(self) -> bool:
+        self.watching = self.connector.watch(self.notify_changed)
+        return self.watching
+
+    def full_scan_interval_minutes(self) -> int:
+        if KB_FULL_SCAN_INTERVAL_MINUTES:
+            return int(KB_FULL_SCAN_INTERVAL_MINUTES)
+        return 360 if self.watching and self.connector.feed_reports_removals else 60
+
+    # Change feeds report bursts (an upload fires several events per file, a folder copy one
+    # per file). Changes are collected until the feed has been quiet for the debounce period,
+    # but never held longer than KB_CHANGE_MAX_DELAY_SECONDS.
+    def notify_changed(self, file_ids: Iterable[str]) -> None:
+        with self._pending_lock:
+            self._pending_changes.update(file_ids)
+            now = time.monotonic()
+            if self._pending_since is None:
+                self._pending_since = now
+            if self._debounce_timer is not None:
+                self._debounce_timer.cancel()
+            delay = min(KB_CHANGE_DEBOUNCE_SECONDS, max(0.0, self._pending_since + KB_CHANGE_MAX_DELAY_SECONDS - now))
+            self._debounce_timer = threading.Timer(delay, self._flush_changes)
+            self._debounce_timer.daemon = True
+            self._debounce_timer.start()
+
+    def _flush_changes(self) -> None:
+        with self._pending_lock:
+            file_ids, self._pending_changes = self._pending_changes, set()
+            pending_since, self._pending_since = self._pending_since, None
+            self._debounce_timer = None
+        if not file_ids:
+            return
+        try:
+            self.apply_changes(file_ids)
+            KB_INDEX_FRESHNESS_SECONDS.observe(time.monotonic() - pending_since)
+        except Exception as e:
+            logger.error(f"Incremental knowledge base update failed: {e}", exc_info=True)
 
-        dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(self.embeddings)
-        logger.info(f"FAISS index built successfully with {len(self.chunks)} chunks from {len(self.files)} files.")
+    def apply_changes(self, file_ids: Iterable[str]) -> None:
+        if not self.generation.is_searchable:
+            self.build_index()
+            return
+        with self._build_lock:
+            start = time.perf_counter()
+            files = dict(self.generation.files)
+            updated: Dict[str, Dict] = {}
+            removed: Set[str] = set()
+            for file_id in set(file_ids):
+                file_meta = self.connector.get_file_metadata(file_id)
+                if file_meta is not None:
+                    updated[file_id] = file_meta
+                else:
+                    removed.add(file_id)
+            dropped: Set[str] = set()
+            for file_id in removed:
+                prefix = file_id.rstrip('/') + '/'
+                dropped.update(known for known in files if (known == file_id or known.startswith(prefix)) and known not in updated)
+            for known in dropped:
+                del files[known]
+            changed = [file_id for file_id, file_meta in updated.items() if file_version(file_meta) is None or file_version(file_meta) != file_version(files.get(file_id))]
+            files.update(updated)
+            if not changed and not dropped:
+                logger.info(f"Change feed reported {len(updated) + len(removed)} paths, none of them changed the index.")
+                return
+            logger.info(f"Applying incremental update: {len(changed)} added or changed, {len(dropped)} removed.")
+            try:
+                generation = self._build_generation(self.generation.number + 1, files)
+                if generation is not None:
+                    self._publish(generation)
+            finally:
+                self.build_progress = {}
+            KB_INDEX_CHANGES_TOTAL.inc(len(changed) + len(dropped))
+            logger.info(f"Incremental update finished in {time.perf_counter() - start:.2f}s.")
+
+    def _publish(self, generation: IndexGeneration) -> None:
+        if generation.is_searchable:
+            try:
+                generation.save(self.index_dir)
+                logger.info(f"Knowledge base index generation {generation.number} persisted to {self.index_dir}.")
+                # Reloading maps the persisted files instead of keeping the built arrays in memory.
+                if self.use_mmap or generation.is_quantized:
+                    generation = IndexGeneration.load(self.index_dir, mmap=self.use_mmap, storage=self.vector_storage) or generation
+            except Exception as e:
+                logger.error(f"Failed to persist knowledge base index to {self.index_dir}: {e}", exc_info=True)
+            self.parse_cache.prune()
+        # A single reference assignment is atomic; readers that already hold the previous
+        # generation finish on it and it is freed once the last of them drops the reference.
+        self.generation = generation
+        self._update_index_gauges()
+        logger.info(f"Published index generation {generation.number}.")
 
-    def search(self, query: str, top_k: int = 5, file_id: Optional[str] = None) -> List[Dict]:
-        logger.info(f"Performing semantic search for '{query}'" + (f" within file {file_id}" if file_id else ""))
-        if self.index is None or self.embeddings is None or not query:
+    def _update_index_gauges(self) -> None:
+        generation = self.generation
+        KB_INDEX_GENERATION.set(generation.number)
+        KB_INDEX_FILES.set(len(generation.files))
+        KB_INDEX_CHUNKS.set(len(generation.chunks))
+        KB_INDEX_VECTORS.set(len(generation.vector_rows))
+        KB_INDEX_VECTOR_BYTES.set(generation.vector_bytes)
+
+    def _parse_file(self, file_id: str, file_meta: Dict) -> List[Dict]:
+        mime_type = file_meta.get('mime_type')
+        if file_meta.get('sha256'):
+            cached = self.parse_cache.get(file_key(mime_type, file_meta['sha256']))
+            if cached is not None:
+                return cached
+        content = self.connector.get_file_content(file_id)
+        if not content:
             return []
+        return parse_document_segments(file_meta['name'], content, mime_type, cache=self.parse_cache)
 
-        query_embedding_result = genai.embed_content(
-            model=self.embedding_model,
-            content=query,
-            task_type="RETRIEVAL_QUERY"
-        )
-        query_embedding = np.array([query_embedding_result['embedding']]).astype('float32')
+    def load(self) -> bool:
+        try:
+            generation = IndexGeneration.load(self.index_dir, mmap=self.use_mmap, storage=self.vector_storage)
+        except Exception as e:
+            logger.error(f"Failed to load persisted knowledge base index from {self.index_dir}: {e}", exc_info=True)
+            return False
+        if generation is None:
+            return False
+        self.generation = generation
+        self._update_index_gauges()
+        logger.info(f"Loaded persisted index generation {generation.number} with {len(generation.chunks)} chunks from {len(generation.files)} files.")
+        return True
 
-        if file_id:
-            target_chunk_indices = [i for i, chunk in enumerate(self.chunks) if chunk.get('file_id') == file_id]
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        return embed_queries(self.embedding_model, queries)
 
-            if not target_chunk_indices:
-                logger.warning(f"No chunks found for file_id: {file_id}")
-                return []
+    @staticmethod
+    def _fetch_k(top_k: int) -> int:
+        return top_k * KB_MMR_CANDIDATES_FACTOR if KB_MMR_LAMBDA < 1.0 else top_k
 
-            target_embeddings = self.embeddings[target_chunk_indices]
+    @staticmethod
+    def _fuse(*rankings: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, (chunk_idx, _) in enumerate(ranking):
+                fused[chunk_idx] = fused.get(chunk_idx, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
 
-            dimension = target_embeddings.shape[1]
-            temp_index = faiss.IndexFlatL2(dimension)
-            temp_index.add(target_embeddings)
+    # Ranks rows for each query; higher scores are better (BM25, negated L2 distance or the
+    # fused RRF score). Query vectors can be supplied by the caller; with embed=False queries
+    # that still need one are returned as pending together with their lexical hits. The
+    # lexical and vector hits behind each fused ranking are returned as components.
+    def _rank(
+        self,
+        generation: IndexGeneration,
+        queries: List[str],
+        top_k: int,
+        candidate_ids: Optional[np.ndarray],
+        mode: str,
+        query_embeddings: Optional[Dict[str, np.ndarray]] = None,
+        embed: bool = True,
+    ) -> Tuple[Dict[str, List[Tuple[int, float]]], List[str], Dict[str, Tuple[List, List]]]:
+        fetch_k = self._fetch_k(top_k)
+        rankings: Dict[str, List[Tuple[int, float]]] = {}
+        components: Dict[str, Tuple[List, List]] = {}
+        lexical_hits: Dict[str, List[Tuple[int, float]]] = {}
+        if mode in ("lexical", "hybrid"):
+            for query in queries:
+                lexical_hits[query] = generation.lexical_search(query, fetch_k, candidate_ids)
+                if mode == "lexical":
+                    rankings[query] = lexical_hits[query]
+                elif generation.is_exact_match(query, lexical_hits[query]):
+                    logger.info(f"Exact identifier match for '{query}', skipping embedding call.")
+                    rankings[query] = lexical_hits[query]
 
-            distances, local_indices = temp_index.search(query_embedding, k=min(top_k, len(target_chunk_indices)))
+        vectors = dict(query_embeddings or {})
+        missing = [q for q in queries if q not in rankings and q not in vectors]
+        if missing and embed:
+            vectors.update(zip(missing, self._embed_queries(missing)))
+        to_search = [q for q in queries if q not in rankings and q in vectors]
+        pending = [q for q in queries if q not in rankings and q not in vectors]
+        if to_search:
+            vector_hits = generation.vector_search_many(np.stack([vectors[q] for q in to_search]).astype('float32'), fetch_k, candidate_ids, KB_RERANK_FACTOR)
+            for query, hits in zip(to_search, vector_hits):
+                if mode == "hybrid":
+                    rankings[query] = self._fuse(lexical_hits[query], hits)
+                    components[query] = (lexical_hits[query], hits)
+                else:
+                    rankings[query] = [(idx, -distance) for idx, distance in hits]
+        for query in pending:
+            rankings[query] = lexical_hits.get(query, [])
 
-            original_indices = [target_chunk_indices[i] for i in local_indices[0]]
+        diversified = {}
+        for query, ranking in rankings.items():
+            scores = dict(ranking)
+            diversified[query] = [(idx, scores[idx]) for idx in generation.diversify([idx for idx, _ in ranking], top_k, KB_MMR_LAMBDA)]
+        return diversified, pending, components
 
-            results = [self.chunks[i] for i in original_indices]
+    def _candidates(self, generation: IndexGeneration, file_id: Optional[str], mode: str) -> Optional[np.ndarray]:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'. Expected one of {SEARCH_MODES}.")
+        candidate_ids = generation.file_candidates(file_id)
+        if candidate_ids is not None and len(candidate_ids) == 0:
+            logger.warning(f"No chunks found for file_id: {file_id}")
+        return candidate_ids
 
-        else:
-            distances, original_indices = self.index.search(query_embedding, k=top_k)
-            results = [self.chunks[i] for i in original_indices[0] if i < len(self.chunks)]
+    def search(self, query: str, top_k: int = 5, file_id: Optional[str] = None, mode: str = "hybrid") -> List[Dict]:
+        logger.info(f"Performing {mode} search for '{query}'" + (f" within file {file_id}" if file_id else ""))
+        generation = self.generation
+        candidate_ids = self._candidates(generation, file_id, mode)
+        if not generation.is_searchable or not query or (candidate_ids is not None and len(candidate_ids) == 0):
+            return []
 
+        rankings, _, _ = self._rank(generation, [query], top_k, candidate_ids, mode)
+        results = [{**generation.chunk(idx, file_id), 'score': score} for idx, score in rankings[query]]
         logger.info(f"Search found {len(results)} relevant chunks.")
         return results
 
+    def search_many(self, queries: List[str], top_k: int = 5, file_id: Optional[str] = None, mode: str = "hybrid") -> List[Dict]:
+        queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q]
+        logger.info(f"Performing batched {mode} search for {len(queries)} queries" + (f" within file {file_id}" if file_id else ""))
+        generation = self.generation
+        candidate_ids = self._candidates(generation, file_id, mode)
+        if not generation.is_searchable or not queries or (candidate_ids is not None and len(candidate_ids) == 0):
+            return []
+
+        rankings, _, _ = self._rank(generation, queries, top_k, candidate_ids, mode)
+        results = interleave_rankings(queries, {query: [{**generation.chunk(idx, file_id), 'score': score} for idx, score in ranking] for query, ranking in rankings.items()}, top_k)
+        logger.info(f"Batched search found {len(results)} unique chunks for {len(queries)} queries.")
+        return results
+
+    # Entry point of a retrieval shard: per-query rankings as chunk dicts, so a coordinator
+    # can merge them with the other shards' by score. RRF scores depend on the ranks within
+    # this shard, so hybrid hits also carry their BM25 score and vector distance, and the
+    # components list the scores of all fused candidates for re-fusing across shards. Every
+    # hit carries its SimHash fingerprint, and its vector when MMR is on, for the coordinator
+    # to collapse near-duplicates and diversify across shards.
+    def rank(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        file_id: Optional[str] = None,
+        mode: str = "hybrid",
+        query_embeddings: Optional[Dict[str, np.ndarray]] = None,
+        embed: bool = True,
+    ) -> Tuple[Dict[str, List[Dict]], List[str], Dict[str, Dict[str, List[float]]]]:
+        generation = self.generation
+        candidate_ids = self._candidates(generation, file_id, mode)
+        if not generation.is_searchable or not queries or (candidate_ids is not None and len(candidate_ids) == 0):
+            return {query: [] for query in queries}, [], {}
+        rankings, pending, components = self._rank(generation, queries, top_k, candidate_ids, mode, query_embeddings, embed)
+        results: Dict[str, List[Dict]] = {}
+        for query, ranking in rankings.items():
+            results[query] = [{**generation.chunk(idx, file_id), 'score': float(score)} for idx, score in ranking]
+            for (idx, _), chunk in zip(ranking, results[query]):
+                chunk['fingerprint'] = int(generation.fingerprints[idx]) if generation.fingerprints is not None else simhash(chunk['text'])
+                if KB_MMR_LAMBDA < 1.0:
+                    chunk['vector'] = generation.embeddings[generation.row_vector[idx]].tolist()
+            if query in components:
+                lexical, vector = (dict(hits) for hits in components[query])
+                for (idx, _), chunk in zip(ranking, results[query]):
+                    chunk['lexical_score'] = float(lexical[idx]) if idx in lexical else None
+                    chunk['distance'] = float(vector[idx]) if idx in vector else None
+        fused = {query: {"lexical": [float(score) for _, score in lexical], "vector": [float(distance) for _, distance in vector]} for query, (lexical, vector) in components.items()}
+        return results, pending, fused
+
     def get_file_by_id(self, file_id: str) -> Optional[Dict[str, str]]:
-        return self.files.get(file_id)
+        return self.generation.files.get(file_id)
 
     def get_all_files(self) -> List[Dict]:
-        return list(self.files.values()) if self.files else []
+        files = self.generation.files
+        return list(files.values()) if files else []
+
+    def get_status(self) -> Dict:
+        status = {**self.generation.info(), "rebuilding": self._build_lock.locked(), "state": self.warmup_state}
+        if self.build_progress:
+            status["progress"] = dict(self.build_progress)
+        if self.warmup_error:
+            status["error"] = self.warmup_error
+        return status
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PARSER_VERSION = 1
+KB_PARSE_CACHE_MAX_BYTES = int(os.getenv("KB_PARSE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+
+def content_key(kind: str, data: bytes) -> str:
+    return f"{kind}:{hashlib.sha256(data).hexdigest()}"
+
+
+def file_key(mime_type: str, sha256_hex: str) -> str:
+    return f"file:{mime_type}:{sha256_hex}"
+
+
+# Entries are keyed by content hash, so edited and deleted files leave theirs behind. The
+# cache is kept under max_bytes by evicting the least recently used entries; reads and
+# touch() refresh an entry's modification time.
+class ParsedTextCache:
+    def __init__(self, cache_dir: str, max_bytes: int = KB_PARSE_CACHE_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(f"v{PARSER_VERSION}:{key}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def touch(self, key: str) -> None:
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                segments = json.load(f)
+            self.touch(key)
+            self.hits += 1
+            return segments
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable parse cache entry for '{key}': {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key: str, segments: List[Dict]) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(segments, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write parse cache entry for '{key}': {e}")
+
+    def prune(self) -> int:
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not evict parse cache entry {path}: {e}")
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Parse cache: evicted {removed} least recently used entries, {total} bytes kept.")
+        return removed
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
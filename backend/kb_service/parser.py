@@ -1,114 +1,140 @@
 import logging
 import io
-import rarfile
-import zipfile
-import magic
-from pypdf import PdfReader
-from docx import Document
-from openpyxl import load_workbook
+import hashlib
+from typing import Dict, List, Optional
+
+from .archive import ARCHIVE_TYPES, is_archive_error, walk_archive
+from .parse_cache import ParsedTextCache, content_key, file_key
 
 logger = logging.getLogger(__name__)
 
-def parse_document(file_name: str, file_content: bytes, mime_type: str) -> str:
-    logger.info(f"--- PARSER START: Parsing '{file_name}' with MIME type: {mime_type} ---")
-    
+SUPPORTED_TYPES = [
+    'text/plain',
+    'application/pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'text/csv',
+] + ARCHIVE_TYPES
+
+
+def _segment(text: str, location: Optional[str] = None) -> Dict:
+    return {'text': text, 'location': location}
+
+
+def _join_location(prefix: Optional[str], location: Optional[str]) -> Optional[str]:
+    if prefix and location:
+        return f"{prefix} / {location}"
+    return prefix or location
+
+
+def _parse_pdf(file_name: str, file_content: bytes, cache: Optional[ParsedTextCache]) -> List[Dict]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(file_content))
+    segments = []
+    reparsed = 0
+    for page_number, page in enumerate(reader.pages, start=1):
+        page_key = None
+        if cache is not None:
+            contents = page.get_contents()
+            page_key = content_key("pdf-page", contents.get_data() if contents is not None else b"")
+            cached = cache.get(page_key)
+            if cached is not None:
+                segments.extend(_segment(s['text'], f"стр. {page_number}") for s in cached)
+                continue
+        text = page.extract_text() or ""
+        reparsed += 1
+        if cache is not None:
+            cache.put(page_key, [_segment(text)])
+        segments.append(_segment(text, f"стр. {page_number}"))
+    logger.info(f"Extracted {len(segments)} pages from PDF '{file_name}' ({reparsed} parsed, {len(segments) - reparsed} from cache).")
+    return segments
+
+
+def _parse_xlsx(file_name: str, file_content: bytes) -> List[Dict]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(filename=io.BytesIO(file_content), read_only=True, data_only=True)
+    segments = []
     try:
-        SUPPORTED_TYPES = [
-            'text/plain', 
-            'application/pdf', 
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document', 
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-            'text/csv', 
-            'application/zip', 
-            'application/x-rar-compressed', 
-            'application/x-rar'
-        ]
+        for sheet in workbook.worksheets:
+            lines = []
+            for row in sheet.iter_rows(values_only=True):
+                row_text = " ".join(str(value) for value in row if value is not None)
+                if row_text:
+                    lines.append(row_text)
+            segments.append(_segment("\n".join(lines), f"лист '{sheet.title}'"))
+    finally:
+        workbook.close()
+    logger.info(f"Extracted {len(segments)} sheets from XLSX '{file_name}'.")
+    return segments
 
+
+def _parse_archive(file_name: str, file_content: bytes, mime_type: str, cache: Optional[ParsedTextCache]) -> List[Dict]:
+    segments = []
+    skip = cache.contains if cache is not None else None
+    for entry in walk_archive(file_name, io.BytesIO(file_content), mime_type, SUPPORTED_TYPES, skip=skip):
+        entry_segments = cache.get(entry.key) if entry.skipped else None
+        if entry_segments is None:
+            content = entry.content
+            if content is None:
+                continue
+            logger.info(f"[{file_name}] -> Processing inner file: '{entry.path}'")
+            entry_segments = parse_document_segments(entry.path, content, entry.mime_type, cache=cache)
+            if cache is not None:
+                cache.put(entry.key, entry_segments)
+        segments.extend(_segment(s['text'], _join_location(entry.path, s.get('location'))) for s in entry_segments)
+    return segments
+
+
+def parse_document_segments(file_name: str, file_content: bytes, mime_type: str, cache: Optional[ParsedTextCache] = None) -> List[Dict]:
+    logger.info(f"--- PARSER START: Parsing '{file_name}' with MIME type: {mime_type} ---")
+    try:
         if mime_type not in SUPPORTED_TYPES:
             logger.warning(f"Unsupported file type '{mime_type}' for file '{file_name}'. Skipping parsing.")
-            return f"НЕПОДДЕРЖИВАЕМЫЙ ТИП ФАЙЛА: {mime_type}"
+            return []
 
-        if mime_type in ['text/plain', 'text/csv']:
-            text = file_content.decode('utf-8', errors='ignore')
-            logger.info(f"Successfully decoded text/csv file '{file_name}' with {len(text)} characters.")
-            return text
+        whole_file_key = file_key(mime_type, hashlib.sha256(file_content).hexdigest())
+        if cache is not None:
+            cached = cache.get(whole_file_key)
+            if cached is not None:
+                logger.info(f"Parse cache hit for '{file_name}' ({len(cached)} segments).")
+                return cached
 
+        if mime_type in ['text/plain', 'text/csv']:
+            segments = [_segment(file_content.decode('utf-8', errors='ignore'))]
         elif mime_type == 'application/pdf':
-            reader = PdfReader(io.BytesIO(file_content))
-            text = "".join(page.extract_text() or "" for page in reader.pages)
-            logger.info(f"Successfully extracted {len(text)} characters from PDF '{file_name}'.")
-            return text
-
+            segments = _parse_pdf(file_name, file_content, cache)
         elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-            doc = Document(io.BytesIO(file_content))
-            text = "\n".join([para.text for para in doc.paragraphs])
-            logger.info(f"Successfully extracted {len(text)} characters from DOCX '{file_name}'.")
-            return text
+            from docx import Document
 
+            doc = Document(io.BytesIO(file_content))
+            segments = [_segment("\n".join(para.text for para in doc.paragraphs))]
         elif mime_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-            workbook = load_workbook(filename=io.BytesIO(file_content))
-            text = ""
-            for sheet in workbook.worksheets:
-                for row in sheet.iter_rows():
-                    row_text = " ".join([str(cell.value) for cell in row if cell.value is not None])
-                    text += row_text + "\n"
-            logger.info(f"Successfully extracted {len(text)} characters from XLSX '{file_name}'.")
-            return text
-
-        elif mime_type == 'application/zip':
-            logger.info(f"[{file_name}] Entering ZIP handler.")
-            all_texts = []
-            try:
-                logger.info(f"[{file_name}] Attempting to open ZIP file in memory.")
-                with zipfile.ZipFile(io.BytesIO(file_content)) as zf:
-                    logger.info(f"[{file_name}] ZIP file opened successfully. Found {len(zf.infolist())} items inside.")
-                    for info in zf.infolist():
-                        if info.is_dir():
-                            continue
-                        logger.info(f"[{file_name}] -> Processing inner file: '{info.filename}'")
-                        inner_file_content = zf.read(info.filename)
-                        inner_mime_type = magic.from_buffer(inner_file_content, mime=True)
-                        logger.info(f"[{file_name}] -> Inner file '{info.filename}' has MIME type: {inner_mime_type}")
-                        inner_text = parse_document(info.filename, inner_file_content, inner_mime_type)
-                        logger.info(f"[{file_name}] -> Finished recursive parsing for '{info.filename}'.")
-                        if not inner_text.startswith("НЕПОДДЕРЖИВАЕМЫЙ ТИП ФАЙЛА"):
-                            all_texts.append(inner_text)
-                if all_texts:
-                    return "\n\n--- [Content from " + file_name + "] ---\n\n".join(all_texts)
-                return f"Архив '{file_name}' не содержит поддерживаемых для анализа файлов."
-            except zipfile.BadZipFile as e:
-                logger.error(f"Could not process ZIP file {file_name}: {e}")
-                return f"Ошибка обработки ZIP архива: {file_name}"
-
-        elif mime_type in ['application/x-rar-compressed', 'application/x-rar']:
-            logger.info(f"[{file_name}] Entering RAR handler.")
-            all_texts = []
-            try:
-                logger.info(f"[{file_name}] Attempting to open RAR file in memory.")
-                with rarfile.RarFile(io.BytesIO(file_content)) as rf:
-                    logger.info(f"[{file_name}] RAR file opened successfully. Found {len(rf.infolist())} items inside.")
-                    for info in rf.infolist():
-                        if info.is_dir():
-                            continue
-                        logger.info(f"[{file_name}] -> Processing inner file: '{info.filename}'")
-                        inner_file_content = rf.read(info.filename)
-                        inner_mime_type = magic.from_buffer(inner_file_content, mime=True)
-                        logger.info(f"[{file_name}] -> Inner file '{info.filename}' has MIME type: {inner_mime_type}")
-                        inner_text = parse_document(info.filename, inner_file_content, inner_mime_type)
-                        logger.info(f"[{file_name}] -> Finished recursive parsing for '{info.filename}'.")
-                        if not inner_text.startswith("НЕПОДДЕРЖИВАЕМЫЙ ТИП ФАЙЛА"):
-                            all_texts.append(inner_text)
-                if all_texts:
-                    return "\n\n--- [Content from " + file_name + "] ---\n\n".join(all_texts)
-                return f"Архив '{file_name}' не содержит поддерживаемых для анализа файлов."
-            except rarfile.Error as e:
-                logger.error(f"Could not process RAR file {file_name}: {e}")
-                return f"Ошибка обработки RAR архива: {file_name}"
+            segments = _parse_xlsx(file_name, file_content)
+        else:
+            segments = _parse_archive(file_name, file_content, mime_type, cache)
+
+        segments = [s for s in segments if s['text'] and s['text'].strip()]
+        if cache is not None:
+            cache.put(whole_file_key, segments)
+        logger.info(f"Successfully extracted {sum(len(s['text']) for s in segments)} characters in {len(segments)} segments from '{file_name}'.")
+        return segments
 
     except Exception as e:
+        if is_archive_error(e):
+            logger.error(f"Could not process archive {file_name}: {e}")
+            return []
         logger.error(f"Failed to extract text from file '{file_name}' with MIME type {mime_type}. Error: {e}", exc_info=True)
-        return f"[Error processing file: {e}]"
+        return []
     finally:
         logger.info(f"--- PARSER END: Finished parsing '{file_name}' ---")
 
-    return ""
+
+def parse_document(file_name: str, file_content: bytes, mime_type: str) -> str:
+    if mime_type not in SUPPORTED_TYPES:
+        return f"НЕПОДДЕРЖИВАЕМЫЙ ТИП ФАЙЛА: {mime_type}"
+    segments = parse_document_segments(file_name, file_content, mime_type)
+    if not segments and mime_type in ARCHIVE_TYPES:
+        return f"Архив '{file_name}' не содержит поддерживаемых для анализа файлов."
+    return "\n\n".join(s['text'] for s in segments)
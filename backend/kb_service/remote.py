@@ -0,0 +1,283 @@
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from common.metrics import RETRIEVAL_SHARD_ERRORS_TOTAL, RETRIEVAL_SHARD_SECONDS, observe_seconds
+from common.tracing import span
+
+from .bm25 import is_identifier_token, tokenize
+from .dedup import NearDuplicateIndex
+from .generation import mmr_order
+from .indexer import KB_FULL_SCAN_INTERVAL_MINUTES, KB_MMR_LAMBDA, RRF_K, SEARCH_MODES, WARMING_UP_STATES, embed_queries, interleave_rankings
+from .sharding import shard_for
+
+logger = logging.getLogger(__name__)
+
+KB_RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("KB_RETRIEVAL_TIMEOUT_SECONDS", "10"))
+KB_CATALOG_TTL_SECONDS = float(os.getenv("KB_CATALOG_TTL_SECONDS", "30"))
+KB_STATUS_TTL_SECONDS = 2.0
+
+
+# KB_RETRIEVAL_SHARDS lists shards separated by ";" and the replicas of a shard separated
+# by ",", e.g. "http://retrieval-0:8100,http://retrieval-0b:8100;http://retrieval-1:8100".
+# Shard order must match the KB_SHARD_INDEX of the services.
+def parse_shards(spec: str) -> List[List[str]]:
+    return [[url.strip().rstrip('/') for url in shard.split(',') if url.strip()] for shard in spec.split(';') if shard.strip()]
+
+
+class ShardUnavailable(RuntimeError):
+    pass
+
+
+# A shard answers a hybrid query by an exact identifier match with lexical hits and neither
+# components nor a pending vector search.
+def exact_match(query: str, responses: List[Dict]) -> bool:
+    return any(response["rankings"].get(query) and query not in response.get("components", {}) and query not in response["pending"] for response in responses)
+
+
+# Shards collapse near-duplicates only among their own chunks; twins stored on different
+# shards are collapsed here by fingerprint. The best-scored hit is kept and takes over the
+# sources of the others.
+def collapse_near_duplicates(hits: List[Dict]) -> List[Dict]:
+    index = NearDuplicateIndex()
+    kept: List[Dict] = []
+    by_slot: Dict[int, Dict] = {}
+    for chunk in hits:
+        fingerprint = chunk.get('fingerprint')
+        slot = index.assign(fingerprint) if fingerprint is not None else None
+        if slot in by_slot:
+            twin = by_slot[slot]
+            twin['sources'] = list(dict.fromkeys(twin.get('sources', []) + chunk.get('sources', [])))
+            continue
+        if slot is not None:
+            by_slot[slot] = chunk
+        kept.append(chunk)
+    return kept
+
+
+# Hybrid hits are fused again over the candidates of all shards: the rank of a hit in each
+# component is the number of better scores any shard reported. A shard that answered by an
+# exact identifier match makes the query lexical, as it would be on a single index. Hits of a
+# shard that only answered the lexical first round carry no components and take part with
+# their BM25 score alone. Rankings of several shards are then collapsed by fingerprint and
+# diversified by MMR again, as a single index would have done over all of their chunks.
+def merge_rankings(query: str, responses: List[Dict], top_k: int, mode: str) -> List[Dict]:
+    hits = [dict(chunk) for response in responses for chunk in response["rankings"].get(query, [])]
+    components = [response["components"][query] for response in responses if query in response.get("components", {})]
+    if mode == "hybrid" and components and not exact_match(query, responses):
+        lexical = sorted(score for component in components for score in component["lexical"])
+        vector = sorted(distance for component in components for distance in component["vector"])
+        for chunk in hits:
+            lexical_score, distance = chunk.get('lexical_score', chunk['score']), chunk.get('distance')
+            chunk['score'] = 0.0
+            if lexical_score is not None:
+                chunk['score'] += 1.0 / (RRF_K + len(lexical) - bisect.bisect_right(lexical, lexical_score) + 1)
+            if distance is not None:
+                chunk['score'] += 1.0 / (RRF_K + bisect.bisect_left(vector, distance) + 1)
+    elif mode == "hybrid":
+        hits = [chunk for chunk in hits if chunk.get('lexical_score', chunk['score']) is not None]
+        for chunk in hits:
+            chunk['score'] = chunk.get('lexical_score', chunk['score'])
+    for chunk in hits:
+        chunk.pop('lexical_score', None)
+        chunk.pop('distance', None)
+    hits.sort(key=lambda chunk: chunk['score'], reverse=True)
+    if len(responses) > 1:
+        hits = collapse_near_duplicates(hits)
+    vectors = [chunk.pop('vector', None) for chunk in hits]
+    for chunk in hits:
+        chunk.pop('fingerprint', None)
+    if len(responses) > 1 and KB_MMR_LAMBDA < 1.0 and len(hits) > 1 and all(vector is not None for vector in vectors):
+        hits = [hits[i] for i in mmr_order(vectors, top_k, KB_MMR_LAMBDA)]
+    return hits[:top_k]
+
+
+# Client side of the retrieval service with the interface of KnowledgeBaseIndexer. Queries
+# are embedded once here and scattered to every shard (or only to the owner of file_id);
+# the per-query rankings are merged by score. Replicas of a shard are used round-robin and a
+# failed replica is retried on the next one. A shard with no live replica is left out of the
+# results rather than failing the search.
+class RemoteKnowledgeBase:
+    def __init__(self, shards: List[List[str]], embedding_model: str = 'models/embedding-001') -> None:
+        if not shards or not all(shards):
+            raise ValueError("At least one retrieval shard with one replica is required.")
+        self.shards = shards
+        self.embedding_model = embedding_model
+        self.http = httpx.Client(
+            timeout=httpx.Timeout(KB_RETRIEVAL_TIMEOUT_SECONDS, connect=2.0),
+            limits=httpx.Limits(max_connections=16 * len(shards), max_keepalive_connections=8 * len(shards)),
+            trust_env=False,
+        )
+        self._pool = ThreadPoolExecutor(max_workers=4 * len(shards), thread_name_prefix="retrieval-scatter")
+        self._next_replica = [itertools.count() for _ in shards]
+        self._lock = threading.Lock()
+        self._catalog: Dict[str, Dict] = {}
+        self._catalog_at = 0.0
+        self._status: Optional[Dict] = None
+        self._status_at = 0.0
+        logger.info(f"Using the retrieval service: {len(shards)} shards, {sum(map(len, shards))} replicas.")
+
+    def _call(self, shard: int, method: str, path: str, payload: Optional[Dict] = None) -> Any:
+        replicas = self.shards[shard]
+        first = next(self._next_replica[shard])
+        last_error: Optional[Exception] = None
+        for attempt in range(len(replicas)):
+            url = replicas[(first + attempt) % len(replicas)]
+            try:
+                with observe_seconds(RETRIEVAL_SHARD_SECONDS, shard=str(shard)):
+                    response = self.http.request(method, f"{url}{path}", json=payload)
+                if response.status_code == 400:
+                    raise ValueError(response.json().get("detail"))
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                RETRIEVAL_SHARD_ERRORS_TOTAL.labels(shard=str(shard)).inc()
+                logger.warning(f"Retrieval replica {url} failed: {e}")
+                last_error = e
+        raise ShardUnavailable(f"No replica of retrieval shard {shard} answered: {last_error}")
+
+    def _scatter(self, shards: List[int], method: str, path: str, payload: Optional[Dict] = None) -> Dict[int, Any]:
+        futures = {shard: self._pool.submit(self._call, shard, method, path, payload) for shard in shards}
+        responses: Dict[int, Any] = {}
+        for shard, future in futures.items():
+            try:
+                responses[shard] = future.result()
+            except ShardUnavailable as e:
+                logger.error(str(e))
+        if shards and not responses:
+            raise ShardUnavailable("No retrieval shard answered.")
+        return responses
+
+    def _embed(self, queries: List[str]) -> Dict[str, List[float]]:
+        if not queries:
+            return {}
+        return dict(zip(queries, embed_queries(self.embedding_model, queries).tolist()))
+
+    # Hybrid queries with identifiers may be answered lexically. They are sent without a
+    # vector first, and embedded for a second round when a shard still needs the vector and no
+    # shard found an exact match. Shards that are empty or warming up report nothing pending.
+    # If the second round fails, the lexical hits of the first one are served.
+    def _rank(self, queries: List[str], top_k: int, file_id: Optional[str], mode: str) -> Dict[str, List[Dict]]:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'. Expected one of {SEARCH_MODES}.")
+        shards = [shard_for(file_id, len(self.shards))] if file_id else list(range(len(self.shards)))
+        request = {"queries": queries, "top_k": top_k, "file_id": file_id, "mode": mode}
+        if mode == "vector":
+            eager = queries
+        elif mode == "hybrid":
+            eager = [q for q in queries if not any(is_identifier_token(token) for token in tokenize(q))]
+        else:
+            eager = []
+        with span("retrieval_scatter", shards=len(shards), queries=len(queries)):
+            responses = self._scatter(shards, "POST", "/rank", {**request, "query_embeddings": self._embed(eager)})
+            pending = [q for q in queries if any(q in response["pending"] for response in responses.values()) and not exact_match(q, list(responses.values()))]
+            if pending:
+                try:
+                    second = self._scatter(shards, "POST", "/rank", {**request, "queries": pending, "query_embeddings": self._embed(pending)})
+                except ShardUnavailable as e:
+                    logger.error(f"Second retrieval round failed, serving lexical hits: {e}")
+                    second = {}
+                for shard, response in second.items():
+                    merged = responses.setdefault(shard, {"rankings": {}, "pending": [], "components": {}})
+                    merged["rankings"].update(response["rankings"])
+                    merged["components"].update(response["components"])
+                    merged["pending"] = [q for q in merged["pending"] if q not in response["rankings"]]
+        return {query: merge_rankings(query, list(responses.values()), top_k, mode) for query in queries}
+
+    def search(self, query: str, top_k: int = 5, file_id: Optional[str] = None, mode: str = "hybrid") -> List[Dict]:
+        logger.info(f"Performing remote {mode} search for '{query}'" + (f" within file {file_id}" if file_id else ""))
+        if not query:
+            return []
+        results = self._rank([query], top_k, file_id, mode)[query]
+        logger.info(f"Search found {len(results)} relevant chunks.")
+        return results
+
+    def search_many(self, queries: List[str], top_k: int = 5, file_id: Optional[str] = None, mode: str = "hybrid") -> List[Dict]:
+        queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q]
+        logger.info(f"Performing remote batched {mode} search for {len(queries)} queries" + (f" within file {file_id}" if file_id else ""))
+        if not queries:
+            return []
+        results = interleave_rankings(queries, self._rank(queries, top_k, file_id, mode), top_k)
+        logger.info(f"Batched search found {len(results)} unique chunks for {len(queries)} queries.")
+        return results
+
+    def _refresh_catalog(self) -> Dict[str, Dict]:
+        catalog: Dict[str, Dict] = {}
+        for files in self._scatter(list(range(len(self.shards))), "GET", "/files").values():
+            catalog.update((file['id'], file) for file in files)
+        with self._lock:
+            self._catalog, self._catalog_at = catalog, time.monotonic()
+        return catalog
+
+    def _files(self) -> Dict[str, Dict]:
+        if time.monotonic() - self._catalog_at > KB_CATALOG_TTL_SECONDS:
+            try:
+                return self._refresh_catalog()
+            except ShardUnavailable as e:
+                logger.error(f"Could not refresh the file catalogue, serving the cached one: {e}")
+        return self._catalog
+
+    def get_file_by_id(self, file_id: str) -> Optional[Dict[str, str]]:
+        return self._files().get(file_id)
+
+    def get_all_files(self) -> List[Dict]:
+        return list(self._files().values())
+
+    def get_status(self) -> Dict:
+        if self._status is not None and time.monotonic() - self._status_at < KB_STATUS_TTL_SECONDS:
+            return self._status
+        try:
+            responses = self._scatter(list(range(len(self.shards))), "GET", "/status")
+        except ShardUnavailable:
+            responses = {}
+        shards = [responses.get(shard) or {"state": "unavailable"} for shard in range(len(self.shards))]
+        states = {shard["state"] for shard in shards}
+        status = {
+            "generation": max((shard.get("generation", 0) for shard in shards), default=0),
+            "files": sum(shard.get("files", 0) for shard in shards),
+            "chunks": sum(shard.get("chunks", 0) for shard in shards),
+            "vectors": sum(shard.get("vectors", 0) for shard in shards),
+            "duplicate_chunks": sum(shard.get("duplicate_chunks", 0) for shard in shards),
+            "vector_bytes": sum(shard.get("vector_bytes", 0) for shard in shards),
+            "rebuilding": any(shard.get("rebuilding") for shard in shards),
+            "state": "ready" if states == {"ready"} else next((state for state in WARMING_UP_STATES if state in states), "degraded"),
+            "warming_up": any(shard.get("warming_up") for shard in shards),
+            "shards": shards,
+        }
+        progress = [shard["progress"] for shard in shards if shard.get("progress")]
+        if progress:
+            status["progress"] = {
+                "stage": progress[0].get("stage"),
+                "files_total": sum(p.get("files_total", 0) for p in progress),
+                "files_done": sum(p.get("files_done", 0) for p in progress),
+            }
+        self._status, self._status_at = status, time.monotonic()
+        return status
+
+    @property
+    def is_warming_up(self) -> bool:
+        return self.get_status()["warming_up"]
+
+    # Indexes are built and kept fresh by the shards; here a build only refreshes the cached
+    # file catalogue.
+    def warm_up(self, refresh: bool = True) -> None:
+        try:
+            self._refresh_catalog()
+        except ShardUnavailable as e:
+            logger.error(f"Retrieval service is not reachable yet: {e}")
+
+    def build_index(self) -> None:
+        self.warm_up()
+
+    def start_watching(self) -> bool:
+        return False
+
+    def full_scan_interval_minutes(self) -> int:
+        return int(KB_FULL_SCAN_INTERVAL_MINUTES or 60)
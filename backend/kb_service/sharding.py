@@ -0,0 +1,41 @@
+import zlib
+from typing import Dict, List, Optional
+
+from .connector import ChangeCallback, KnowledgeBaseConnector
+
+
+def shard_for(file_id: str, shard_count: int) -> int:
+    return zlib.crc32(file_id.encode('utf-8')) % shard_count if shard_count > 1 else 0
+
+
+# The part of a knowledge base that one retrieval shard indexes. Files are assigned by a
+# hash of their id, so every shard sees a stable subset without coordinating with the
+# others. Metadata of another shard's file reads as missing, which the indexer treats as
+# "not ours": nothing of that id is in this shard, so nothing is removed.
+class ShardedConnector(KnowledgeBaseConnector):
+    def __init__(self, connector: KnowledgeBaseConnector, shard_index: int, shard_count: int) -> None:
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"Shard index {shard_index} is out of range for {shard_count} shards.")
+        self.connector = connector
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    def owns(self, file_id: str) -> bool:
+        return shard_for(file_id, self.shard_count) == self.shard_index
+
+    def list_files_recursive(self, path: str = '/') -> List[Dict[str, str]]:
+        return [file for file in self.connector.list_files_recursive(path) if self.owns(file['id'])]
+
+    def get_file_content(self, file_id: str) -> Optional[bytes]:
+        return self.connector.get_file_content(file_id)
+
+    def get_file_metadata(self, file_id: str) -> Optional[Dict]:
+        if not self.owns(file_id):
+            return None
+        return self.connector.get_file_metadata(file_id)
+
+    def watch(self, on_change: ChangeCallback) -> bool:
+        return self.connector.watch(on_change)
+
+    def stop_watching(self) -> None:
+        self.connector.stop_watching()
@@ -0,0 +1,54 @@
+from typing import Iterator, List, Sequence, Tuple
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+
+# Windows of at most chunk_size characters, computed in a single pass over offsets. A window
+# ends after the last occurrence of the highest-priority separator in its second half (or
+# hard at chunk_size when there is none), and the next one starts at the first space in the
+# last chunk_overlap characters. RecursiveCharacterTextSplitter instead splits the whole text
+# at one separator and re-merges the pieces, so chunk boundaries differ from its output; the
+# size and overlap budgets are the same.
+class FastTextSplitter:
+    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 300, separators: Sequence[str] = DEFAULT_SEPARATORS) -> None:
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = [sep for sep in separators if sep]
+
+    def _find_break(self, text: str, start: int, end: int) -> int:
+        window_floor = start + self.chunk_size // 2
+        for sep in self.separators:
+            idx = text.rfind(sep, window_floor, end)
+            if idx != -1:
+                return idx + len(sep)
+        return end
+
+    def _next_start(self, text: str, start: int, end: int) -> int:
+        overlap_start = end - self.chunk_overlap
+        if overlap_start <= start:
+            return end
+        idx = text.find(" ", overlap_start, end)
+        return idx + 1 if idx != -1 else overlap_start
+
+    def split_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        length = len(text)
+        start = 0
+        while start < length:
+            end = min(start + self.chunk_size, length)
+            if end < length:
+                end = self._find_break(text, start, end)
+            span_start, span_end = start, end
+            while span_start < span_end and text[span_start].isspace():
+                span_start += 1
+            while span_end > span_start and text[span_end - 1].isspace():
+                span_end -= 1
+            if span_end > span_start:
+                yield span_start, span_end
+            if end >= length:
+                break
+            start = self._next_start(text, start, end)
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
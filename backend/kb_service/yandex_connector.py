@@ -1,14 +1,19 @@
 import logging
 import io
+import os
+import threading
 from typing import List, Dict, Optional
 
 import yadisk
 from yadisk.exceptions import UnauthorizedError, NotFoundError
 
-from .connector import KnowledgeBaseConnector
+from .connector import ChangeCallback, KnowledgeBaseConnector, file_version
 
 logger = logging.getLogger(__name__)
 
+KB_POLL_INTERVAL_SECONDS = float(os.getenv("KB_POLL_INTERVAL_SECONDS", "30"))
+KB_LAST_UPLOADED_LIMIT = int(os.getenv("KB_LAST_UPLOADED_LIMIT", "100"))
+
 
 class YandexDiskConnector(KnowledgeBaseConnector):
     def __init__(self, token: str):
@@ -16,14 +21,36 @@ class YandexDiskConnector(KnowledgeBaseConnector):
             raise ValueError("Yandex.Disk API token is required.")
         self.token = token
         self.client: yadisk.YaDisk = yadisk.YaDisk(token=self.token)
+        self._verified = False
+        self._stop_polling = threading.Event()
+        self._poll_thread: Optional[threading.Thread] = None
+        logger.info("YandexDiskConnector initialized; the token is verified on first scan.")
+
+    # Kept out of __init__: a network round trip there blocks process startup.
+    def verify(self) -> None:
+        if self._verified:
+            return
         try:
             logger.info("Verifying Yandex.Disk API token...")
             self.client.get_disk_info()
-            logger.info("YandexDiskConnector initialized and token verified successfully.")
+            self._verified = True
+            logger.info("Yandex.Disk API token verified successfully.")
         except UnauthorizedError:
             logger.critical("Yandex.Disk API token is invalid or has expired.")
             raise ValueError("Invalid Yandex.Disk API token.")
 
+    @staticmethod
+    def _file_meta(item) -> Dict:
+        return {
+            "id": item.path,
+            "name": item.name,
+            "path": item.path,
+            "mime_type": item.mime_type,
+            "sha256": item.sha256,
+            "size": item.size,
+            "modified": item.modified.isoformat() if item.modified else None,
+        }
+
     def _scan_path_recursive(self, path: str) -> List[Dict[str, str]]:
         files_metadata: List[Dict[str, str]] = []
         try:
@@ -38,13 +65,7 @@ class YandexDiskConnector(KnowledgeBaseConnector):
                 if item_type == 'dir':
                     files_metadata.extend(self._scan_path_recursive(item_path))
                 elif item_type == 'file':
-                    file_meta = {
-                        "id": item_path,
-                        "name": item.name,
-                        "path": item_path,
-                        "mime_type": item.mime_type,
-                    }
-                    files_metadata.append(file_meta)
+                    files_metadata.append(self._file_meta(item))
         except NotFoundError:
             logger.warning(f"Path not found on Yandex.Disk: {path}")
             return []
@@ -52,7 +73,8 @@ class YandexDiskConnector(KnowledgeBaseConnector):
             logger.error(f"An unexpected error occurred while scanning Yandex.Disk path {path}: {e}", exc_info=True)
         return files_metadata
 
-    def list_files_recursive(self, path: str) -> List[Dict[str, str]]:
+    def list_files_recursive(self, path: str = '/') -> List[Dict[str, str]]:
+        self.verify()
         return self._scan_path_recursive(path)
 
     def get_file_content(self, file_id: str) -> Optional[bytes]:
@@ -69,3 +91,45 @@ class YandexDiskConnector(KnowledgeBaseConnector):
         except Exception as e:
             logger.error(f"An unexpected error occurred while downloading file {file_id} from Yandex.Disk: {e}", exc_info=True)
             return None
+
+    def get_file_metadata(self, file_id: str) -> Optional[Dict]:
+        try:
+            item = self.client.get_meta(file_id)
+        except NotFoundError:
+            return None
+        return self._file_meta(item) if item.type == 'file' else None
+
+    # The disk API has no change notifications. The "last uploaded" listing is a single cheap
+    # request sorted by upload time, so polling it finds new and overwritten files without a
+    # recursive scan; deletions and renames are left to the periodic full scan, which keeps
+    # its hourly default for this connector (see feed_reports_removals).
+    def _poll_last_uploaded(self, on_change: ChangeCallback) -> None:
+        seen: Optional[Dict[str, Optional[str]]] = None
+        delay = 0.0
+        while not self._stop_polling.wait(delay):
+            delay = KB_POLL_INTERVAL_SECONDS
+            try:
+                items = self.client.get_last_uploaded(limit=KB_LAST_UPLOADED_LIMIT)
+            except Exception as e:
+                logger.warning(f"Polling recently uploaded files on Yandex.Disk failed: {e}")
+                continue
+            versions = {item.path: file_version(self._file_meta(item)) for item in items if item.path}
+            if seen is not None:
+                changed = [path for path, version in versions.items() if seen.get(path) != version]
+                if changed:
+                    logger.info(f"Yandex.Disk reports {len(changed)} recently uploaded or changed files.")
+                    on_change(changed)
+            seen = versions
+
+    def watch(self, on_change: ChangeCallback) -> bool:
+        if self._poll_thread is not None:
+            return True
+        self._stop_polling.clear()
+        self._poll_thread = threading.Thread(target=self._poll_last_uploaded, args=(on_change,), name="yadisk-poll", daemon=True)
+        self._poll_thread.start()
+        logger.info(f"Polling Yandex.Disk for recent uploads every {KB_POLL_INTERVAL_SECONDS}s.")
+        return True
+
+    def stop_watching(self) -> None:
+        self._stop_polling.set()
+        self._poll_thread = None
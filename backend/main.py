@@ -11,10 +11,8 @@ from auth import router as auth_router, get_current_active_user, User
 
 import google.generativeai as genai
 import google.generativeai.protos as gap
-from google.ai.generativelanguage_v1beta.services.generative_service import GenerativeServiceAsyncClient
-from google.api_core.client_options import ClientOptions
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
@@ -22,108 +20,66 @@ from typing import Dict, List, Optional, Any
 from apscheduler.schedulers.background import BackgroundScheduler
 from google.api_core.exceptions import ResourceExhausted, InternalServerError
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from openai import AsyncOpenAI
 import redis
-import httpx
+import time
+from prometheus_client import make_asgi_app
 
 from kb_service.connector import MockConnector
 from kb_service.yandex_connector import YandexDiskConnector
 from kb_service.indexer import KnowledgeBaseIndexer
+from kb_service.remote import RemoteKnowledgeBase, parse_shards
 from kb_service.parser import parse_document
+from common.cancellation import request_cancel
+from common.chat_history import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, ChatHistoryReader, etag_matches, make_etag, read_history, write_history
+from common.codec import dumps, loads
+from common.clients import client_registry
+from common.config_service import AppConfig, config_service
+from common.job_store import TERMINAL_STATUSES, JobStore
+from common.metrics import JOB_QUEUE_DEPTH, record_retry
+from common.rate_limit import rate_limiter
+from common.tracing import new_trace_id
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-PROXY_URL = "http://51.158.76.113:9999"
-
 redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "redis"), port=6379, db=0, decode_responses=True)
+rate_limiter.attach(redis_client)
+config_service.listen(redis_client)
 
 YANDEX_TOKEN = os.getenv("YANDEX_DISK_API_TOKEN")
+KB_RETRIEVAL_SHARDS = os.getenv("KB_RETRIEVAL_SHARDS")
 
-if YANDEX_TOKEN:
-    logging.info("YANDEX_DISK_API_TOKEN found. Initializing YandexDiskConnector.")
-    kb_connector = YandexDiskConnector(token=YANDEX_TOKEN)
+if KB_RETRIEVAL_SHARDS:
+    kb_indexer = RemoteKnowledgeBase(parse_shards(KB_RETRIEVAL_SHARDS))
 else:
-    logging.info("YANDEX_DISK_API_TOKEN not found. Initializing MockConnector as a fallback.")
-    kb_connector = MockConnector()
-
-kb_indexer = KnowledgeBaseIndexer(connector=kb_connector)
+    if YANDEX_TOKEN:
+        logging.info("YANDEX_DISK_API_TOKEN found. Initializing YandexDiskConnector.")
+        kb_connector = YandexDiskConnector(token=YANDEX_TOKEN)
+    else:
+        logging.info("YANDEX_DISK_API_TOKEN not found. Initializing MockConnector as a fallback.")
+        kb_connector = MockConnector()
+    kb_indexer = KnowledgeBaseIndexer(connector=kb_connector)
+JOB_QUEUE_DEPTH.set_function(lambda: redis_client.llen("job_queue"))
 scheduler = BackgroundScheduler()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable not set!")
 
-generative_client = GenerativeServiceAsyncClient(transport="rest", client_options=ClientOptions(api_key=GEMINI_API_KEY))
-embedding_client = generative_client
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-CONTROLLER_PROVIDER = os.getenv("CONTROLLER_PROVIDER", "openai").lower()
-CONTROLLER_API_KEY = None
-CONTROLLER_BASE_URL = None
-
-if CONTROLLER_PROVIDER == "openrouter":
-    CONTROLLER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-    CONTROLLER_BASE_URL = "https://openrouter.ai/api/v1"
-    logger.info("Configuring Controller to use OpenRouter.")
-else:
-    CONTROLLER_API_KEY = os.getenv("OPENAI_API_KEY")
-    CONTROLLER_BASE_URL = "https://api.openai.com/v1"
-    logger.info("Configuring Controller to use OpenAI.")
-
-if not CONTROLLER_API_KEY:
-    logger.warning("Controller API key is not set. The Quality Control stage will be skipped.")
-    controller_client = None
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY, client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    logger.info(f"Gemini requests are routed to {GEMINI_API_ENDPOINT}.")
 else:
-    controller_client = AsyncOpenAI(
-        base_url=CONTROLLER_BASE_URL,
-        api_key=CONTROLLER_API_KEY,
-        http_client=httpx.AsyncClient(proxies={"all://": PROXY_URL})
-    )
-
-def analyze_document(file_id: str, query: str) -> str:
-    logger.info(f"TOOL CALL: analyze_document for file_id: {file_id} with query: '{query}'")
-    try:
-        results = kb_indexer.search(query=query, file_id=file_id)
-        if not results:
-            file_info = kb_indexer.get_file_by_id(file_id)
-            file_name = file_info['name'] if file_info else file_id
-            return f"Внутри файла '{file_name}' по вашему запросу '{query}' ничего не найдено."
-        formatted_results = [f"--- Результат поиска №{i+1} (из файла: {chunk['file_name']}) ---\n{chunk['text']}\n" for i, chunk in enumerate(results)]
-        return "\n".join(formatted_results)
-    except Exception as e:
-        logger.error(f"Error in analyze_document tool for file_id {file_id}: {e}", exc_info=True)
-        return f"ОШИБКА: Произошла внутренняя ошибка при поиске по файлу: {e}"
-
-def search_knowledge_base(query: str) -> str:
-    logger.info(f"TOOL CALL: search_knowledge_base with query: '{query}'")
-    results = kb_indexer.search(query)
-    if not results:
-        return "По вашему запросу в базе знаний ничего не найдено."
-    formatted_results = [f"--- Результат поиска №{i+1} (из файла: {chunk['file_name']}) ---\n{chunk['text']}\n" for i, chunk in enumerate(results)]
-    return "\n".join(formatted_results)
-
-def list_all_files_summary() -> str:
-    logger.info("TOOL CALL: list_all_files_summary")
-    try:
-        all_files = kb_indexer.get_all_files()
-        if not all_files:
-            return "В базе знаний нет доступных файлов."
-        
-        summary = "Доступные файлы в базе знаний:\n"
-        for f in all_files:
-            summary += f"- Имя файла: '{f.get('name', 'N/A')}', ID: '{f.get('id', 'N/A')}'\n"
-        return summary.strip()
-    except Exception as e:
-        logger.error(f"Error in list_all_files_summary tool: {e}", exc_info=True)
-        return f"ОШИБКА: Не удалось получить список файлов: {e}"
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 @retry(
     wait=wait_exponential(multiplier=1, min=2, max=60),
     stop=stop_after_attempt(3),
-    retry=retry_if_exception_type((ResourceExhausted, InternalServerError))
+    retry=retry_if_exception_type((ResourceExhausted, InternalServerError)),
+    before_sleep=record_retry
 )
 async def run_with_retry(func, *args, **kwargs):
     return await func(*args, **kwargs)
@@ -151,7 +107,7 @@ Analyze the user's query. If it explicitly or implicitly refers to one of the fi
 If the query does not refer to any specific file, respond with the exact word "None". Do not provide any other text or explanation.
 """
     try:
-        context_model = genai.GenerativeModel('gemini-2.5-flash')
+        context_model = client_registry.model('gemini-2.5-flash')
         response = await run_with_retry(context_model.generate_content_async, prompt)
         
         file_id_match = response.text.strip()
@@ -171,6 +127,7 @@ If the query does not refer to any specific file, respond with the exact word "N
 app = FastAPI(title="Engineering Hub API", docs_url="/api/docs", openapi_url="/api/openapi.json")
 
 app.include_router(auth_router, prefix="/api", tags=["Authentication"])
+app.mount("/metrics", make_asgi_app())
 
 
 def update_kb_index() -> None:
@@ -179,10 +136,27 @@ def update_kb_index() -> None:
 @app.on_event("startup")
 def startup_event():
     logging.info("Application startup: Initializing services...")
-    update_kb_index()
-    scheduler.add_job(update_kb_index, "interval", hours=1, id="update_kb_index_job", replace_existing=True)
+    scheduler.add_job(kb_indexer.warm_up, id="kb_warm_up_job", replace_existing=True)
+    kb_indexer.start_watching()
+    scheduler.add_job(update_kb_index, "interval", minutes=kb_indexer.full_scan_interval_minutes(), id="update_kb_index_job", replace_existing=True)
+    scheduler.add_job(job_store.compact, "interval", minutes=int(os.getenv("JOB_COMPACTION_INTERVAL_MINUTES", "15")), id="compact_job_store_job", replace_existing=True)
     scheduler.start()
-    logging.info("Application startup: Services initialized and scheduler started.")
+    logging.info("Application startup: Scheduler started, knowledge base is warming up in the background.")
+
+@app.get("/api/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+# Ready as soon as Redis answers: a knowledge base that is still warming up only degrades
+# search, so it is reported but does not take the instance out of rotation.
+@app.get("/api/health/ready")
+async def readiness():
+    kb_status = kb_indexer.get_status()
+    try:
+        redis_client.ping()
+    except redis.RedisError as e:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unavailable", "redis": str(e), "knowledge_base": kb_status})
+    return {"status": "ready" if kb_status["state"] == "ready" else "degraded", "knowledge_base": kb_status}
 
 app.add_middleware(
     CORSMiddleware,
@@ -193,17 +167,10 @@ app.add_middleware(
 )
 
 HISTORY_DIR = "chat_histories"
-CONFIG_FILE = "/app_config/config.json"
+job_store = JobStore(redis_client, HISTORY_DIR)
+history_reader = ChatHistoryReader(HISTORY_DIR)
 CONTROLLER_SYSTEM_PROMPT = "You are a helpful assistant."
 
-class AgentSettings(BaseModel):
-    model_name: str
-    system_prompt: str
-
-class AppConfig(BaseModel):
-    executor: AgentSettings
-    controller: AgentSettings
-
 class ChatRequest(BaseModel):
     message: str
     conversation_id: str
@@ -232,44 +199,47 @@ class Message(BaseModel):
 class JobCreationResponse(BaseModel):
     job_id: str
 
+class BulkJobRequest(BaseModel):
+    message: str
+    conversation_id: str
+    folder: Optional[str] = None
+    file_ids: Optional[List[str]] = None
 
-def load_config() -> AppConfig:
-    default_config = AppConfig(
-        executor=AgentSettings(model_name='gemini-2.5-pro', system_prompt='You are a helpful assistant.'),
-        controller=AgentSettings(model_name='o4-mini', system_prompt='You are a helpful assistant.')
-    )
-    if not os.path.exists(CONFIG_FILE):
-        return default_config
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return AppConfig.model_validate(data)
-    except Exception as e:
-        logger.warning(f"Could not load or validate config file due to: {e}. Deleting corrupt file and using defaults.")
-        try:
-            os.remove(CONFIG_FILE)
-        except OSError as del_e:
-            logger.error(f"Failed to delete corrupt config file: {del_e}")
-        return default_config
+class SearchManyRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    file_id: Optional[str] = None
+    mode: str = "hybrid"
 
-def save_config(config: AppConfig):
-    os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(config.model_dump(), f, indent=2, ensure_ascii=False)
 
 @app.get("/api/v1/config", response_model=AppConfig)
 async def get_config(current_user: User = Depends(get_current_active_user)):
-    return load_config()
+    return config_service.get()
 
 @app.post("/api/v1/config", status_code=status.HTTP_200_OK)
 async def set_config(config: AppConfig, current_user: User = Depends(get_current_active_user)):
-    save_config(config)
-    return {"status": "success", "message": "Configuration saved."}
+    try:
+        version = await asyncio.to_thread(config_service.save, config)
+    except OSError as e:
+        logger.error(f"Failed to save configuration: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to save configuration.")
+    return {"status": "success", "message": "Configuration saved.", "version": version}
 
 @app.get("/api/kb/files", response_model=List[Dict])
 async def get_all_kb_files(current_user: User = Depends(get_current_active_user)):
     return kb_indexer.get_all_files()
 
+@app.get("/api/kb/status")
+async def get_kb_status(current_user: User = Depends(get_current_active_user)):
+    return kb_indexer.get_status()
+
+@app.post("/api/kb/search_many", response_model=List[Dict])
+async def search_kb_many(request: SearchManyRequest, current_user: User = Depends(get_current_active_user)):
+    try:
+        return await asyncio.to_thread(kb_indexer.search_many, request.queries, request.top_k, request.file_id, request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/v1/chats", response_model=List[ChatInfo])
 async def list_chats(current_user: User = Depends(get_current_active_user)):
     chats = []
@@ -284,18 +254,95 @@ async def list_chats(current_user: User = Depends(get_current_active_user)):
                     title = f.read().strip() or title
             else:
                 try:
-                    with open(os.path.join(HISTORY_DIR, filename), 'r', encoding='utf-8') as f:
-                        history = json.load(f)
-                        if history:
-                            first_user_message = next((item for item in history if item.get('role') == 'user'), None)
-                            if first_user_message and first_user_message.get('parts'):
-                               title = first_user_message['parts'][0][:50]
+                    history = read_history(os.path.join(HISTORY_DIR, filename))
+                    if history:
+                        first_user_message = next((item for item in history if item.get('role') == 'user'), None)
+                        if first_user_message and first_user_message.get('parts'):
+                           title = first_user_message['parts'][0][:50]
                 except (json.JSONDecodeError, IndexError) as e:
                     logger.warning(f"Could not generate title for {filename} due to error: {e}")
                     pass
             chats.append(ChatInfo(id=conversation_id, title=title))
     return sorted(chats, key=lambda item: os.path.getmtime(os.path.join(HISTORY_DIR, f"{item.id}.json")), reverse=True)
 
+def validate_chat_id(chat_id: str) -> str:
+    try:
+        return str(uuid.UUID(chat_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+def history_etag_or_404(chat_id: str, *parts) -> str:
+    version = history_reader.version(chat_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return make_etag(version, *parts)
+
+@app.get("/api/v1/chats/{chat_id}")
+async def get_chat_history(
+    chat_id: str,
+    before: Optional[int] = Query(None, ge=0),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+):
+    chat_id = validate_chat_id(chat_id)
+    etag = history_etag_or_404(chat_id, before if before is not None else "latest", limit)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    page = await asyncio.to_thread(history_reader.page, chat_id, before, limit)
+    return JSONResponse(content=page, headers=headers)
+
+@app.get("/api/v1/chats/{chat_id}/messages/{index}/thinking_steps")
+async def get_message_thinking_steps(
+    chat_id: str,
+    index: int,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+):
+    chat_id = validate_chat_id(chat_id)
+    etag = history_etag_or_404(chat_id, "steps", index)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    steps = await asyncio.to_thread(history_reader.thinking_steps, chat_id, index)
+    if steps is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return JSONResponse(content={"index": index, "thinking_steps": steps}, headers=headers)
+
+@app.get("/api/v1/chats/{chat_id}/active_job")
+async def get_active_job(chat_id: str, current_user: User = Depends(get_current_active_user)):
+    chat_id = validate_chat_id(chat_id)
+    return {"job_id": redis_client.get(f"active_job_for_convo:{chat_id}")}
+
+@app.put("/api/v1/chats/{chat_id}", response_model=ChatInfo)
+async def rename_chat(chat_id: str, request: RenameRequest, current_user: User = Depends(get_current_active_user)):
+    chat_id = validate_chat_id(chat_id)
+    if history_reader.version(chat_id) is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    title = request.new_title.strip()
+    if not title:
+        raise HTTPException(status_code=400, detail="Title must not be empty.")
+    with open(os.path.join(HISTORY_DIR, f"{chat_id}.title.txt"), 'w', encoding='utf-8') as f:
+        f.write(title)
+    return ChatInfo(id=chat_id, title=title)
+
+@app.delete("/api/v1/chats/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_chat(chat_id: str, current_user: User = Depends(get_current_active_user)):
+    chat_id = validate_chat_id(chat_id)
+    history_path = history_reader.path(chat_id)
+    if not os.path.exists(history_path):
+        raise HTTPException(status_code=404, detail="Chat not found")
+    for path in (history_path, os.path.join(HISTORY_DIR, f"{chat_id}.title.txt")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    history_reader.forget(chat_id)
+    redis_client.delete(f"active_job_for_convo:{chat_id}")
+    logger.info(f"Chat {chat_id} deleted.")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
 @app.post("/api/v1/chats", response_model=ChatInfo, status_code=status.HTTP_201_CREATED)
 async def create_new_chat(request: CreateChatRequest, current_user: User = Depends(get_current_active_user)):
     conversation_id = str(uuid.uuid4())
@@ -303,64 +350,87 @@ async def create_new_chat(request: CreateChatRequest, current_user: User = Depen
     title_file_path = os.path.join(HISTORY_DIR, f"{conversation_id}.title.txt")
     try:
         os.makedirs(HISTORY_DIR, exist_ok=True)
-        with open(history_file_path, 'w', encoding='utf-8') as f: json.dump([], f)
+        write_history(history_file_path, [])
         with open(title_file_path, 'w', encoding='utf-8') as f: f.write(request.title)
         return ChatInfo(id=conversation_id, title=request.title)
     except OSError as e:
         raise HTTPException(status_code=500, detail="Failed to create chat files.")
 
-@app.post("/api/v1/jobs", response_model=JobCreationResponse, status_code=status.HTTP_202_ACCEPTED)
-async def create_chat_job(request: ChatRequest, current_user: User = Depends(get_current_active_user)):
+def enqueue_job(conversation_id: str, message: str, job_data: Dict) -> JobCreationResponse:
     job_id = f"job:{uuid.uuid4()}"
-    job_data = request.model_dump_json()
+    trace_id = new_trace_id()
 
     try:
-        history_file_path = os.path.join(HISTORY_DIR, f"{request.conversation_id}.json")
-        if not os.path.exists(history_file_path):
-            with open(history_file_path, 'w', encoding='utf-8') as f:
-                json.dump([], f)
-
-        with open(history_file_path, 'r+', encoding='utf-8') as f:
-            try:
-                history = json.load(f)
-                if not isinstance(history, list): history = []
-            except json.JSONDecodeError:
-                history = []
-            
-            history.append({"role": "user", "parts": [request.message]})
-            
-            f.seek(0)
-            json.dump(history, f, indent=2, ensure_ascii=False)
-            f.truncate()
+        history_file_path = os.path.join(HISTORY_DIR, f"{conversation_id}.json")
+        try:
+            history = read_history(history_file_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            history = []
+        history.append({"role": "user", "parts": [message]})
+        write_history(history_file_path, history)
     except Exception as e:
         logger.error(f"Failed to write user message to history file {history_file_path}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to save user message.")
 
-    redis_client.set(f"active_job_for_convo:{request.conversation_id}", job_id, ex=3600)
-    logger.info(f"Linked conversation {request.conversation_id} to active job {job_id}")
+    redis_client.set(f"active_job_for_convo:{conversation_id}", job_id, ex=3600)
+    logger.info(f"Linked conversation {conversation_id} to active job {job_id}")
 
     initial_status = {
         "status": "queued",
-        "thoughts": json.dumps([{"type": "info", "content": "Задача поставлена в очередь..."}]),
-        "final_answer": ""
+        "thoughts": dumps([{"type": "info", "content": "Задача поставлена в очередь..."}]),
+        "final_answer": "",
+        "trace_id": trace_id,
+        "created_at": time.time()
     }
     
     redis_client.hset(job_id, mapping=initial_status)
     
-    redis_client.lpush("job_queue", json.dumps({"job_id": job_id, "payload": job_data}))
+    redis_client.lpush("job_queue", dumps({"job_id": job_id, "trace_id": trace_id, "payload": job_data, "enqueued_at": time.time()}))
     
-    logger.info(f"Job {job_id} created and queued for conversation {request.conversation_id}.")
+    logger.info(f"Job {job_id} created and queued for conversation {conversation_id} (trace {trace_id}).")
     return JobCreationResponse(job_id=job_id)
 
+@app.post("/api/v1/jobs", response_model=JobCreationResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_chat_job(request: ChatRequest, current_user: User = Depends(get_current_active_user)):
+    return enqueue_job(request.conversation_id, request.message, request.model_dump())
+
+# One question over every file of a folder (or an explicit list of files), answered by
+# per-file map tasks spread over the workers and a final reduce step.
+@app.post("/api/v1/jobs/bulk", response_model=JobCreationResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_bulk_job(request: BulkJobRequest, current_user: User = Depends(get_current_active_user)):
+    if not request.folder and not request.file_ids:
+        raise HTTPException(status_code=400, detail="Either folder or file_ids is required.")
+    return enqueue_job(request.conversation_id, request.message, {**request.model_dump(), "mode": "bulk"})
+
 @app.get("/api/v1/jobs/{job_id}/status")
 async def get_job_status(job_id: str, current_user: User = Depends(get_current_active_user)):
-    job_data = redis_client.hgetall(job_id)
+    job_data = job_store.get(job_id)
     if not job_data:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job_data['thoughts'] = json.loads(job_data.get('thoughts', '[]'))
+    job_data.pop('trace', None)
+    job_data['thoughts'] = loads(job_data.get('thoughts', '[]'))
+    if 'bulk_total' in job_data:
+        job_data['progress'] = {key: int(job_data.get(f"bulk_{key}") or 0) for key in ("total", "done", "found", "empty", "error")}
+    return JSONResponse(content=job_data)
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    job_data = job_store.get(job_id)
+    if not job_data:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job_data['thoughts'] = loads(job_data.get('thoughts', '[]'))
+    job_data['trace'] = loads(job_data['trace']) if job_data.get('trace') else None
     return JSONResponse(content=job_data)
 
 @app.post("/api/v1/jobs/{job_id}/cancel", status_code=status.HTTP_200_OK)
 async def cancel_job(job_id: str, current_user: User = Depends(get_current_active_user)):
-    if not redis_client.exists
+    current_status = redis_client.hget(job_id, "status")
+    if current_status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if current_status in TERMINAL_STATUSES:
+        return {"status": "success", "message": f"Job already {current_status}."}
+    receivers = request_cancel(redis_client, job_id)
+    logger.info(f"Job {job_id} marked as cancelled; cancel request delivered to {receivers} worker(s).")
+    return {"status": "success", "message": "Job cancellation requested."}
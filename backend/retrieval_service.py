@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+import google.generativeai as genai
+import numpy as np
+from apscheduler.schedulers.background import BackgroundScheduler
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import JSONResponse
+from prometheus_client import make_asgi_app
+from pydantic import BaseModel
+
+from kb_service.connector import MockConnector
+from kb_service.indexer import KnowledgeBaseIndexer
+from kb_service.sharding import ShardedConnector
+from kb_service.yandex_connector import YandexDiskConnector
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# One shard of the knowledge base index. Every replica of a shard runs with the same
+# KB_SHARD_INDEX/KB_SHARD_COUNT and its own KB_INDEX_DIR, and builds its index from the
+# connector independently. Queries are embedded by the caller (kb_service.remote), so the
+# embedding API is only used here for building the index and for callers that send none.
+KB_SHARD_INDEX = int(os.getenv("KB_SHARD_INDEX", "0"))
+KB_SHARD_COUNT = int(os.getenv("KB_SHARD_COUNT", "1"))
+
+YANDEX_TOKEN = os.getenv("YANDEX_DISK_API_TOKEN")
+
+if YANDEX_TOKEN:
+    logging.info("YANDEX_DISK_API_TOKEN found. Initializing YandexDiskConnector.")
+    kb_connector = YandexDiskConnector(token=YANDEX_TOKEN)
+else:
+    logging.info("YANDEX_DISK_API_TOKEN not found. Initializing MockConnector as a fallback.")
+    kb_connector = MockConnector()
+
+kb_indexer = KnowledgeBaseIndexer(connector=ShardedConnector(kb_connector, KB_SHARD_INDEX, KB_SHARD_COUNT))
+scheduler = BackgroundScheduler()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if not GEMINI_API_KEY:
+    raise ValueError("GEMINI_API_KEY environment variable not set!")
+
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY, client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    logger.info(f"Gemini requests are routed to {GEMINI_API_ENDPOINT}.")
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
+
+app = FastAPI(title="Engineering Hub Retrieval Shard", docs_url="/docs")
+app.mount("/metrics", make_asgi_app())
+
+
+class RankRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    file_id: Optional[str] = None
+    mode: str = "hybrid"
+    query_embeddings: Optional[Dict[str, List[float]]] = None
+
+
+def update_kb_index() -> None:
+    kb_indexer.build_index()
+
+@app.on_event("startup")
+def startup_event():
+    logging.info(f"Retrieval shard {KB_SHARD_INDEX + 1}/{KB_SHARD_COUNT} starting: knowledge base is warming up in the background.")
+    scheduler.add_job(kb_indexer.warm_up, id="kb_warm_up_job", replace_existing=True)
+    kb_indexer.start_watching()
+    scheduler.add_job(update_kb_index, "interval", minutes=kb_indexer.full_scan_interval_minutes(), id="update_kb_index_job", replace_existing=True)
+    scheduler.start()
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    kb_status = kb_indexer.get_status()
+    if kb_indexer.is_warming_up:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "warming_up", "knowledge_base": kb_status})
+    return {"status": "ready", "knowledge_base": kb_status}
+
+@app.get("/status")
+async def get_status():
+    return {**kb_indexer.get_status(), "warming_up": kb_indexer.is_warming_up, "shard": KB_SHARD_INDEX, "shards": KB_SHARD_COUNT}
+
+@app.get("/files", response_model=List[Dict])
+async def get_files():
+    return kb_indexer.get_all_files()
+
+@app.post("/rank")
+async def rank(request: RankRequest):
+    query_embeddings = {query: np.asarray(vector, dtype=np.float32) for query, vector in (request.query_embeddings or {}).items()}
+    generation = kb_indexer.generation.number
+    try:
+        rankings, pending, components = await asyncio.to_thread(kb_indexer.rank, request.queries, request.top_k, request.file_id, request.mode, query_embeddings, False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"rankings": rankings, "pending": pending, "components": components, "generation": generation}
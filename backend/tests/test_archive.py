@@ -0,0 +1,31 @@
+import io
+import zipfile
+
+from kb_service.archive import ArchiveLimits, walk_archive
+
+TEXT_TYPES = ['text/plain']
+
+
+def archive(entries) -> io.BytesIO:
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in entries:
+            zf.writestr(name, content)
+    stream.seek(0)
+    return stream
+
+
+def extracted(stream: io.BytesIO, limits: ArchiveLimits):
+    return [(entry.path, entry.content) for entry in walk_archive("docs.zip", stream, 'application/zip', TEXT_TYPES, limits)]
+
+
+def test_oversized_entry_is_skipped_and_the_rest_extracted():
+    stream = archive([("small.txt", "первый документ"), ("huge.txt", "x " * 4096), ("last.txt", "последний документ")])
+    entries = extracted(stream, ArchiveLimits(max_total_bytes=1024, max_ratio=1000))
+    assert entries == [("small.txt", "первый документ".encode('utf-8')), ("last.txt", "последний документ".encode('utf-8'))]
+
+
+def test_entry_count_budget_stops_the_whole_archive():
+    stream = archive([(f"{i}.txt", f"документ {i}") for i in range(5)])
+    entries = extracted(stream, ArchiveLimits(max_entries=3))
+    assert [path for path, _ in entries] == ["0.txt", "1.txt", "2.txt"]
@@ -0,0 +1,44 @@
+from kb_service.bm25 import BM25Index, is_identifier_token, tokenize
+
+
+def test_tokenize_keeps_compound_identifiers_and_their_parts():
+    assert tokenize("Болт ГОСТ 7798-70, М12х1.5") == ["болт", "гост", "7798-70", "7798", "70", "м12х1.5", "м12х1", "5"]
+    assert is_identifier_token("7798-70") and is_identifier_token("м12х1")
+    assert not is_identifier_token("болт") and not is_identifier_token("70")
+
+
+def test_search_returns_the_ids_documents_were_added_under():
+    index = BM25Index()
+    index.add_document(7, "болт ГОСТ 7798-70 сталь")
+    index.add_document(3, "гайка ГОСТ 5915-70 сталь")
+    index.add_document(12, "шайба плоская")
+
+    assert index.search("7798-70")[0][0] == 7
+    assert index.search("5915-70")[0][0] == 3
+    assert {doc_id for doc_id, _ in index.search("сталь")} == {3, 7}
+    assert [doc_id for doc_id, _ in index.search("сталь", doc_ids=[3, 12])] == [3]
+    assert index.matches_all_terms("шайба плоская", 12) and not index.matches_all_terms("шайба сталь", 12)
+
+
+def test_remove_and_readd_document_keeps_statistics_consistent():
+    index = BM25Index()
+    index.add_document(0, "болт сталь")
+    index.add_document(1, "гайка сталь")
+    index.add_document(1, "гайка латунь")
+
+    assert index.doc_lengths == {0: 2, 1: 2} and index.total_length == 4
+    assert index.search("латунь")[0][0] == 1
+    index.remove_document(0, "болт сталь")
+    assert "болт" not in index.postings
+    assert index.search("сталь") == []
+
+
+def test_to_dict_round_trip_keeps_integer_ids():
+    index = BM25Index()
+    index.add_document(5, "фланец DN50 PN16")
+    index.add_document(9, "фланец DN80 PN16")
+
+    restored = BM25Index.from_dict(index.to_dict())
+    assert restored.doc_lengths == index.doc_lengths
+    assert restored.search("dn80") == index.search("dn80")
+    assert restored.search("dn80")[0][0] == 9
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from kb_service.chunk_store import ChunkStore, ChunkStoreBuilder
+from kb_service.splitter import FastTextSplitter
+
+PARAGRAPH = (
+    "Болт М12х1.5 по ГОСТ 7798-70 изготавливается из стали Ст3 с цинковым покрытием. "
+    "Допуск резьбы 6g, момент затяжки указан в спецификации. "
+    "Flange DN50 PN16 is mounted with eight bolts.\n"
+)
+TEXT = "\n\n".join(f"Раздел {i}. " + PARAGRAPH * (i % 4 + 1) for i in range(30))
+
+
+@pytest.fixture
+def splitter():
+    return FastTextSplitter(chunk_size=400, chunk_overlap=80)
+
+
+def test_split_spans_cover_text_within_chunk_size(splitter):
+    spans = list(splitter.split_spans(TEXT))
+    assert len(spans) > 10
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT.rstrip())
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert 0 < end - start <= splitter.chunk_size
+        assert next_start <= end
+        assert not TEXT[start].isspace() and not TEXT[end - 1].isspace()
+    assert splitter.split_text(TEXT) == [TEXT[start:end] for start, end in spans]
+
+
+def test_split_spans_of_whitespace_only_text_is_empty(splitter):
+    assert list(splitter.split_spans(" \n\n  ")) == []
+
+
+def test_chunk_store_round_trips_span_text(splitter):
+    spans = list(splitter.split_spans(TEXT))
+    builder = ChunkStoreBuilder()
+    builder.add_spans("a.txt", "a.txt", TEXT, spans, "стр. 1")
+    builder.add("b.txt", "b.txt", "Короткий документ")
+    store = builder.build()
+
+    assert len(store) == len(spans) + 1
+    assert [store.text(row) for row in range(len(spans))] == [TEXT[start:end] for start, end in spans]
+    assert store.text(len(spans)) == "Короткий документ"
+    assert store.location(0) == "стр. 1" and store.location(len(spans)) is None
+    assert store[len(spans)]["file_name"] == "b.txt"
+    for row, (start, end) in enumerate(spans):
+        assert store.chunk_end[row] - store.chunk_start[row] == len(TEXT[start:end].encode('utf-8'))
+    assert store.nbytes < len(TEXT.encode('utf-8')) * 2
+
+
+def test_spans_of_mixed_width_text_map_to_their_bytes():
+    text = "a€𝄞 ё😀b " * 50
+    spans = [(0, 7), (3, 40), (40, 41), (5, len(text) - 1), (120, 200)]
+    builder = ChunkStoreBuilder()
+    assert builder.add("a.txt", "a.txt", "Ж") == 0
+    assert builder.add_spans("b.txt", "b.txt", text, spans) == len(spans)
+    assert builder.add("c.txt", "c.txt", "𝄞") == len(spans) + 1
+    store = builder.build()
+
+    assert [store.text(row + 1) for row in range(len(spans))] == [text[start:end] for start, end in spans]
+    assert store.text(len(spans) + 1) == "𝄞"
+
+
+def test_add_rows_copies_chunks_of_one_file(splitter):
+    builder = ChunkStoreBuilder()
+    builder.add_spans("a.txt", "a.txt", TEXT, splitter.split_spans(TEXT))
+    builder.add_spans("b.txt", "b.txt", PARAGRAPH, splitter.split_spans(PARAGRAPH), "лист 2")
+    previous = builder.build()
+
+    rows = previous.rows_for_file("b.txt")
+    rebuilt = ChunkStoreBuilder()
+    rebuilt.add("c.txt", "c.txt", "Новый файл")
+    rebuilt.add_rows(previous, "b.txt", "b.txt", rows)
+    store = rebuilt.build()
+
+    assert [store.text(row) for row in store.rows_for_file("b.txt")] == [previous.text(row) for row in rows]
+    assert store.location(int(store.rows_for_file("b.txt")[0])) == "лист 2"
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_chunk_store_save_and_load(splitter, tmp_path, mmap):
+    builder = ChunkStoreBuilder()
+    builder.add_spans("a.txt", "a.txt", TEXT, splitter.split_spans(TEXT), "стр. 1")
+    store = builder.build()
+    store.save(str(tmp_path))
+
+    loaded = ChunkStore.load(str(tmp_path), mmap=mmap)
+    assert list(loaded.texts()) == list(store.texts())
+    assert np.array_equal(loaded.rows_for_file("a.txt"), store.rows_for_file("a.txt"))
+    assert loaded[0] == store[0]
@@ -0,0 +1,44 @@
+import base64
+import json
+import zlib
+
+import pytest
+
+from common.codec import ZSTD_PREFIX, JsonCodec, OrjsonCodec, ZlibCompressor, ZstdCompressor, decompress_text, loads, orjson, zstandard
+
+ANSWER = "Болт М12х1.5 по ГОСТ 7798-70.\n\n" * 200
+VALUE = {"role": "model", "parts": [ANSWER[:200]], "thinking_steps": [{"type": "log", "content": "поиск"}], "score": 0.5, "file_id": None}
+
+
+def test_decompress_reads_legacy_zlib_values():
+    legacy = base64.b64encode(zlib.compress(ANSWER.encode('utf-8'))).decode('ascii')
+    assert not legacy.startswith(ZSTD_PREFIX)
+    assert decompress_text(legacy) == ANSWER
+    assert decompress_text(ZlibCompressor().compress(ANSWER)) == ANSWER
+
+
+@pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")
+def test_zstd_values_are_prefixed_and_round_trip():
+    packed = ZstdCompressor().compress(ANSWER)
+    assert packed.startswith(ZSTD_PREFIX)
+    assert decompress_text(packed) == ANSWER
+    assert len(packed) < len(ANSWER.encode('utf-8'))
+
+
+def test_loads_reads_legacy_json_written_with_indent_and_escapes():
+    assert loads(json.dumps(VALUE, indent=2)) == VALUE
+    assert loads(json.dumps(VALUE, indent=2, ensure_ascii=False).encode('utf-8')) == VALUE
+
+
+def test_json_codec_keeps_non_ascii_text_unescaped():
+    encoded = JsonCodec().dumps(VALUE)
+    assert "Болт" in encoded
+    assert json.loads(encoded) == VALUE
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+def test_orjson_codec_is_interchangeable_with_json_codec():
+    assert OrjsonCodec().dumps(VALUE) == JsonCodec().dumps(VALUE)
+    assert OrjsonCodec().loads(JsonCodec().dumps(VALUE)) == VALUE
+    assert JsonCodec().loads(OrjsonCodec().dumps(VALUE)) == VALUE
+    assert OrjsonCodec().loads(OrjsonCodec().dumps({1: "a"})) == {"1": "a"}
@@ -0,0 +1,59 @@
+from typing import Dict, List
+
+from common.context_packer import _join, merge_chunks
+from kb_service.chunk_store import ChunkStoreBuilder
+from kb_service.splitter import FastTextSplitter
+
+TEXT = " ".join(f"Пункт {i}: болт М12 по ГОСТ 7798-70, сталь Ст3, момент затяжки {40 + i} Н·м." for i in range(40))
+
+
+def hits(store_text: str = TEXT, file_id: str = "a.txt", location: str = "стр. 1") -> List[Dict]:
+    spans = list(FastTextSplitter(chunk_size=300, chunk_overlap=60).split_spans(store_text))
+    builder = ChunkStoreBuilder()
+    builder.add_spans(file_id, file_id, store_text, spans, location)
+    store = builder.build()
+    return [
+        {**store[row], 'span': (int(store.chunk_start[row]), int(store.chunk_end[row])), 'score': 1.0 / (row + 1), 'queries': [f"q{row}"]}
+        for row in range(len(store))
+    ]
+
+
+def test_join_merges_overlapping_neighbours_into_their_union():
+    first, second = hits()[:2]
+    assert second['span'][0] < first['span'][1]
+
+    joined = _join(first, second)
+    assert joined['text'] == TEXT[:TEXT.index(second['text']) + len(second['text'])]
+    assert joined['span'] == (first['span'][0], second['span'][1])
+    assert joined['score'] == first['score']
+    assert joined['queries'] == ["q0", "q1"]
+
+
+def test_join_keeps_a_contained_chunk_and_rejects_gaps():
+    chunks = hits()
+    first = chunks[0]
+    assert _join(first, {**first, 'score': 0.0, 'queries': ["other"]})['text'] == first['text']
+    assert _join(first, chunks[3]) is None
+
+
+def test_join_rejects_spans_whose_bytes_differ():
+    first, second = hits()[:2]
+    overlap = first['text'].encode('utf-8')[second['span'][0] - first['span'][0]:].decode('utf-8')
+    assert second['text'].startswith(overlap)
+    tampered = {**second, 'text': overlap.replace("7", "1") + second['text'][len(overlap):]}
+    assert _join(first, tampered) is None
+    assert _join(first, {**second, 'text': second['text'] + "!"}) is None
+
+
+def test_merge_chunks_joins_runs_per_file_and_location():
+    chunks = hits()
+    other_file = hits(file_id="b.txt")
+    other_location = hits(location="стр. 2")
+    merged = merge_chunks([chunks[0], other_file[1], chunks[2], chunks[1], other_location[0], {"text": "без позиции", "file_id": "c.txt"}])
+
+    texts = {(passage['file_id'], passage.get('location')): passage['text'] for passage in merged if passage.get('span')}
+    assert len(merged) == 4
+    assert texts[("a.txt", "стр. 1")] == TEXT[:TEXT.index(chunks[2]['text']) + len(chunks[2]['text'])]
+    assert texts[("b.txt", "стр. 1")] == other_file[1]['text']
+    assert texts[("a.txt", "стр. 2")] == other_location[0]['text']
+    assert [passage['score'] for passage in merged] == sorted((passage['score'] for passage in merged), reverse=True)
@@ -0,0 +1,60 @@
+import random
+
+import numpy as np
+
+from kb_service.dedup import SIMHASH_BITS, NearDuplicateIndex, assign_slots, hamming, simhash
+
+PARAGRAPH = (
+    "Болт с шестигранной головкой М12х1.5 по ГОСТ 7798-70 изготавливается из стали Ст3 "
+    "с цинковым покрытием толщиной девять микрон, допуск резьбы 6g, момент затяжки указан "
+    "в спецификации к сборочному чертежу узла крепления фланца DN50 PN16."
+)
+WORDS = ["болт", "гайка", "шайба", "гост", "сталь", "допуск", "резьба", "чертеж", "фланец", "покрытие"]
+
+
+# A chunk-sized text: a one-word edit changes a few of its ~200 shingles.
+def chunk_text(seed: int) -> str:
+    rng = random.Random(seed)
+    return " ".join(f"{rng.choice(WORDS)}{rng.randint(0, 99)}" for _ in range(200))
+
+
+def test_near_duplicates_are_a_few_bits_apart():
+    text = chunk_text(0)
+
+    assert simhash(text.upper().replace(" ", "  \n")) == simhash(text)
+    assert hamming(simhash(text), simhash(text + " дополнение")) <= 3
+    assert hamming(simhash(text), simhash(text.rsplit(" ", 1)[0])) <= 3
+    assert hamming(simhash(text), simhash(chunk_text(1))) > 3
+
+
+def test_short_texts_only_match_identical_ones():
+    short = simhash("Таблица 1")
+    assert short >> (SIMHASH_BITS - 1) == 1
+    assert simhash("таблица  1") == short
+    assert simhash("Таблица 2") != short
+    assert simhash(PARAGRAPH) >> (SIMHASH_BITS - 1) == 0
+
+
+def test_index_finds_fingerprints_within_max_distance():
+    index = NearDuplicateIndex(max_distance=3)
+    base = simhash(PARAGRAPH)
+    assert index.assign(base) == 0
+    assert index.assign(base ^ 0b101) == 0
+    assert index.assign(base ^ (1 << 10) ^ (1 << 30) ^ (1 << 50)) == 0
+    assert index.assign(base ^ 0b1111) == 1
+    assert index.find(base ^ (1 << 62)) == 0
+    assert len(index) == 2
+
+
+def test_disabled_index_gives_every_fingerprint_its_own_slot():
+    index = NearDuplicateIndex(enabled=False)
+    base = simhash(PARAGRAPH)
+    assert [index.assign(base), index.assign(base)] == [0, 1]
+
+
+def test_assign_slots_numbers_slots_by_first_occurrence():
+    base = simhash(PARAGRAPH)
+    other = simhash("Гайка шестигранная М16 по ГОСТ 5915-70, класс прочности 8, покрытие отсутствует, " * 3)
+    revised = simhash(chunk_text(0) + " дополнение")
+    fingerprints = np.array([other, base, simhash(chunk_text(0)), revised, other, simhash("Таблица 1")], dtype=np.uint64)
+    assert assign_slots(fingerprints).tolist() == [0, 1, 2, 2, 0, 3]
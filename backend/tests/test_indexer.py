@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from kb_service.bm25 import tokenize
+from kb_service.connector import MockConnector
+from kb_service.indexer import KnowledgeBaseIndexer
+
+
+def document(name: str, parts: int) -> str:
+    return "\n\n".join(
+        f"Изделие {name}-{i:03d}: болт М12 по ГОСТ 7798-70, партия {name}{i:03d}, материал сталь Ст3. " * 12
+        for i in range(parts)
+    )
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    disk = tmp_path / "disk"
+    disk.mkdir()
+    (disk / "a.txt").write_text(document("a", 6), encoding='utf-8')
+    (disk / "b.txt").write_text(document("b", 4), encoding='utf-8')
+    (disk / "a_copy.txt").write_text(document("a", 6), encoding='utf-8')
+    monkeypatch.setenv("MOCK_DISK_PATH", str(disk))
+    monkeypatch.setenv("KB_INDEX_DIR", str(tmp_path / "index"))
+    kb = KnowledgeBaseIndexer(MockConnector())
+    rng = np.random.default_rng(0)
+    monkeypatch.setattr(kb, "_embed_documents", lambda texts: rng.standard_normal((len(texts), 8)).astype('float32'))
+    return kb
+
+
+def test_bm25_ids_are_the_canonical_rows_of_their_chunks(indexer):
+    generation = indexer._build_generation(1)
+    chunks, bm25 = generation.chunks, generation.bm25
+    canonical = np.unique(generation.row_vector, return_index=True)[1]
+
+    assert len(chunks) > len(canonical) > 1
+    assert set(bm25.doc_lengths) == set(canonical.tolist())
+    for row in canonical.tolist():
+        tokens = tokenize(chunks.text(row))
+        assert bm25.doc_lengths[row] == len(tokens)
+        assert all(row in bm25.postings[token] for token in tokens)
+
+
+def test_lexical_search_finds_the_chunk_holding_the_identifier(indexer):
+    generation = indexer._build_generation(1)
+    chunks = generation.chunks
+    for row in generation.chunks.rows_for_file("b.txt").tolist():
+        identifier = next(token for token in tokenize(chunks.text(row)) if token.startswith("b") and token[1:].isdigit())
+        hits = [int(doc_id) for doc_id, _ in generation.bm25.search(identifier, top_k=50)]
+        assert generation.row_vector[row] in {int(generation.row_vector[hit]) for hit in hits}
+        assert all(identifier in chunks.text(hit).lower() for hit in hits)
+
+
+def test_full_scan_is_relaxed_only_when_the_feed_reports_removals(indexer, monkeypatch):
+    monkeypatch.setattr("kb_service.indexer.KB_FULL_SCAN_INTERVAL_MINUTES", None)
+    assert indexer.full_scan_interval_minutes() == 60
+    indexer.watching = True
+    assert indexer.full_scan_interval_minutes() == 360
+    monkeypatch.setattr(indexer.connector, "feed_reports_removals", False)
+    assert indexer.full_scan_interval_minutes() == 60
+
+
+def test_shard_hits_carry_fingerprint_and_vector(indexer):
+    generation = indexer.generation = indexer._build_generation(1)
+    rankings, _, _ = indexer.rank(["болт ГОСТ 7798-70"], top_k=3, mode="lexical")
+    hits = rankings["болт ГОСТ 7798-70"]
+    assert hits
+    for hit in hits:
+        assert isinstance(hit['fingerprint'], int) and 0 <= hit['fingerprint'] < 1 << 64
+        assert len(hit['vector']) == generation.embeddings.shape[1]
@@ -0,0 +1,29 @@
+import os
+
+from kb_service.parse_cache import ParsedTextCache
+
+
+def segments(size: int):
+    return [{"text": "т" * size, "location": None}]
+
+
+def test_prune_evicts_least_recently_used_entries(tmp_path):
+    cache = ParsedTextCache(str(tmp_path), max_bytes=0)
+    for age, key in enumerate(["new", "read", "old"]):
+        cache.put(key, segments(100))
+        os.utime(cache._path(key), (1000 - age * 100, 1000 - age * 100))
+    entry_bytes = os.path.getsize(cache._path("new"))
+    assert cache.get("read") is not None
+    cache.max_bytes = 2 * entry_bytes
+
+    assert cache.prune() == 1
+    assert not cache.contains("old")
+    assert cache.contains("new") and cache.contains("read")
+
+
+def test_prune_keeps_a_cache_within_its_budget(tmp_path):
+    cache = ParsedTextCache(str(tmp_path), max_bytes=1024 * 1024)
+    cache.put("a", segments(10))
+    cache.put("b", segments(10))
+    assert cache.prune() == 0
+    assert cache.contains("a") and cache.contains("b")
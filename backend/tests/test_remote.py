@@ -0,0 +1,136 @@
+from typing import Dict, List, Optional
+
+import pytest
+
+from kb_service.remote import RemoteKnowledgeBase, ShardUnavailable, merge_rankings
+
+IDENTIFIER_QUERY = "болт ГОСТ 7798-70"
+
+
+def chunk(text: str, score: float, lexical_score: Optional[float] = None, distance: Optional[float] = None, components: bool = True) -> Dict:
+    hit = {"text": text, "file_id": f"{text}.txt", "score": score}
+    if components:
+        hit.update(lexical_score=lexical_score, distance=distance)
+    return hit
+
+
+def lexical_round(query: str, hits: List[Dict]) -> Dict:
+    return {"rankings": {query: hits}, "pending": [query], "components": {}}
+
+
+def fused_round(query: str, hits: List[Dict]) -> Dict:
+    lexical = [hit["lexical_score"] for hit in hits if hit["lexical_score"] is not None]
+    vector = [hit["distance"] for hit in hits if hit["distance"] is not None]
+    return {"rankings": {query: hits}, "pending": [], "components": {query: {"lexical": lexical, "vector": vector}}}
+
+
+class FakeShards:
+    def __init__(self, first: Dict[int, Dict], second: Dict[int, Dict]) -> None:
+        self.first = first
+        self.second = second
+        self.rounds: List[Dict] = []
+
+    def __call__(self, shard: int, method: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        responses = self.second if payload["query_embeddings"] else self.first
+        if shard == 0:
+            self.rounds.append(payload)
+        if shard not in responses:
+            raise ShardUnavailable(f"shard {shard} is down")
+        return responses[shard]
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    kb = RemoteKnowledgeBase([["http://shard-0"], ["http://shard-1"]])
+    monkeypatch.setattr(kb, "_embed", lambda queries: {query: [0.0] for query in queries})
+    yield kb
+    kb.http.close()
+
+
+def test_merge_rankings_fuses_components_across_shards():
+    responses = [
+        fused_round("q", [chunk("a", 0.03, lexical_score=9.0, distance=0.5), chunk("b", 0.02, lexical_score=None, distance=0.1)]),
+        fused_round("q", [chunk("c", 0.03, lexical_score=5.0, distance=None)]),
+    ]
+    merged = merge_rankings("q", responses, top_k=3, mode="hybrid")
+    assert [hit["text"] for hit in merged] == ["a", "b", "c"]
+    assert all("lexical_score" not in hit and "distance" not in hit for hit in merged)
+
+
+def test_merge_rankings_exact_match_on_one_shard_makes_query_lexical():
+    responses = [
+        {"rankings": {"q": [chunk("exact", 12.0, components=False)]}, "pending": [], "components": {}},
+        fused_round("q", [chunk("fused", 0.03, lexical_score=3.0, distance=0.2)]),
+    ]
+    merged = merge_rankings("q", responses, top_k=5, mode="hybrid")
+    assert [hit["text"] for hit in merged] == ["exact", "fused"]
+    assert merged[0]["score"] == 12.0
+
+
+def test_merge_rankings_collapses_near_duplicates_across_shards():
+    twin = {**chunk("archive copy", 8.0, components=False), "fingerprint": 0b1011, "sources": ["old.docx"]}
+    responses = [
+        {"rankings": {"q": [{**chunk("revision", 9.0, components=False), "fingerprint": 0b1010, "sources": ["new.docx"]}]}, "pending": [], "components": {}},
+        {"rankings": {"q": [twin, {**chunk("other", 7.0, components=False), "fingerprint": 0xFFFF << 32, "sources": ["other.docx"]}]}, "pending": [], "components": {}},
+    ]
+    merged = merge_rankings("q", responses, top_k=5, mode="lexical")
+    assert [hit["text"] for hit in merged] == ["revision", "other"]
+    assert merged[0]["sources"] == ["new.docx", "old.docx"]
+    assert all("fingerprint" not in hit for hit in merged)
+
+
+def test_merge_rankings_diversifies_across_shards():
+    responses = [
+        {"rankings": {"q": [{**chunk("a", 9.0, components=False), "vector": [1.0, 0.0]}, {**chunk("a2", 8.0, components=False), "vector": [1.0, 0.01]}]}, "pending": [], "components": {}},
+        {"rankings": {"q": [{**chunk("b", 7.0, components=False), "vector": [0.0, 1.0]}]}, "pending": [], "components": {}},
+    ]
+    merged = merge_rankings("q", responses, top_k=2, mode="lexical")
+    assert [hit["text"] for hit in merged] == ["a", "b"]
+    assert all("vector" not in hit for hit in merged)
+
+
+def test_shard_failing_second_round_keeps_its_lexical_hits(remote, monkeypatch):
+    query = IDENTIFIER_QUERY
+    shards = FakeShards(
+        first={0: lexical_round(query, [chunk("a", 7.0, components=False)]), 1: lexical_round(query, [chunk("b", 8.0, components=False)])},
+        second={0: fused_round(query, [chunk("a", 0.03, lexical_score=7.0, distance=0.4), chunk("v", 0.01, distance=0.2)])},
+    )
+    monkeypatch.setattr(remote, "_call", shards)
+    results = remote.search(query, top_k=5)
+    assert len(shards.rounds) == 2
+    assert {hit["text"] for hit in results} == {"a", "b", "v"}
+
+
+def test_all_shards_failing_second_round_serves_first_round(remote, monkeypatch):
+    query = IDENTIFIER_QUERY
+    shards = FakeShards(
+        first={0: lexical_round(query, [chunk("a", 7.0, components=False)]), 1: lexical_round(query, [chunk("b", 8.0, components=False)])},
+        second={},
+    )
+    monkeypatch.setattr(remote, "_call", shards)
+    assert [hit["text"] for hit in remote.search(query, top_k=5)] == ["b", "a"]
+
+
+def test_second_round_runs_when_another_shard_reports_nothing_pending(remote, monkeypatch):
+    query = IDENTIFIER_QUERY
+    empty = {"rankings": {query: []}, "pending": [], "components": {}}
+    shards = FakeShards(
+        first={0: lexical_round(query, [chunk("a", 7.0, components=False)]), 1: empty},
+        second={0: fused_round(query, [chunk("a", 0.03, lexical_score=7.0, distance=0.4), chunk("v", 0.01, distance=0.2)]), 1: empty},
+    )
+    monkeypatch.setattr(remote, "_call", shards)
+    results = remote.search(query, top_k=5)
+    assert len(shards.rounds) == 2
+    assert {hit["text"] for hit in results} == {"a", "v"}
+
+
+def test_exact_match_skips_second_round(remote, monkeypatch):
+    query = IDENTIFIER_QUERY
+    shards = FakeShards(
+        first={0: lexical_round(query, [chunk("a", 7.0, components=False)]), 1: {"rankings": {query: [chunk("exact", 12.0, components=False)]}, "pending": [], "components": {}}},
+        second={},
+    )
+    monkeypatch.setattr(remote, "_call", shards)
+    results = remote.search(query, top_k=5)
+    assert len(shards.rounds) == 1
+    assert results[0]["text"] == "exact"
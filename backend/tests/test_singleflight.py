@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common.singleflight import SingleFlight, make_key
+
+
+# Followers that arrive after the leader finished would lead a call of their own.
+def wait_for_followers(flight: SingleFlight, key: str, count: int) -> None:
+    deadline = time.monotonic() + 5
+    while len(flight._calls[key].done._cond._waiters) < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_make_key_depends_on_name_and_parts():
+    assert make_key("search", "болт", 5) == make_key("search", "болт", 5)
+    assert make_key("search", "болт", 5) != make_key("search", "болт", 6)
+    assert make_key("search", {"a": 1, "b": 2}) == make_key("search", {"b": 2, "a": 1})
+    assert make_key("search", "болт").startswith("search:")
+
+
+def test_concurrent_calls_share_one_leader():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"answer": 42}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(flight.run, "test", "key", fn)
+        started.wait(5)
+        followers = [pool.submit(flight.run, "test", "key", fn) for _ in range(4)]
+        wait_for_followers(flight, "key", 4)
+        release.set()
+        results = [leader.result(5)] + [follower.result(5) for follower in followers]
+
+    assert calls == [1]
+    assert results == [{"answer": 42}] * 5
+    assert flight._calls == {}
+    assert flight.run("test", "key", lambda: "next") == "next"
+
+
+def test_followers_receive_the_leader_error():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.run, "test", "key", fn)
+        started.wait(5)
+        follower = pool.submit(flight.run, "test", "key", fn)
+        wait_for_followers(flight, "key", 1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="boom"):
+                future.result(5)
+
+
+def test_async_calls_share_one_leader():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.run_async("test", "key", fn) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert calls == [1]
+    assert flight._futures == {}
+
+
+def test_cancelled_async_leader_hands_over_to_a_follower():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(flight.run_async("test", "key", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.run_async("test", "key", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == 2
+    assert calls == [1, 1]
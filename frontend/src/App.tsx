@@ -9,7 +9,8 @@ import LoginPage from './pages/LoginPage';
 import apiClient from './api/client';
 
 interface Chat { id: string; title: string; }
-interface Message { id:string; jobId?: string; role: 'user' | 'model' | 'error'; content: string; displayedContent: string; thinking_steps?: Thought[]; sources?: string[]; }
+interface Message { id:string; jobId?: string; role: 'user' | 'model' | 'error'; content: string; displayedContent: string; thinking_steps?: Thought[]; thinking_steps_count?: number; index?: number; sources?: string[]; }
+interface HistoryPage { messages: { index: number; role: 'user' | 'model'; content: string; thinking_steps_count: number; }[]; next_cursor: string | null; total: number; }
 interface ModalState { visible: boolean; title: string; message: string; showInput: boolean; inputValue: string; confirmText: string; onConfirm: (value: string | boolean | null) => void; }
 interface KnowledgeBaseFile { id: string; name: string; }
 interface AgentSettings { model_name: string; system_prompt: string; }
@@ -43,6 +44,10 @@ function App() {
   const chatContainerRef = useRef<HTMLDivElement>(null);
   const userInputRef = useRef<HTMLTextAreaElement>(null);
   const pollIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+  const scrollAnchorRef = useRef<number | null>(null);
+  const skipAutoScrollRef = useRef(false);
 
 
   useEffect(() => {
@@ -160,6 +165,49 @@ function App() {
       pollIntervalRef.current = setInterval(poll, 2000);
   };
 
+  const toHistoryMessages = (chatId: string, page: HistoryPage): Message[] => page.messages.map(m => ({
+    id: `${chatId}-${m.index}`,
+    index: m.index,
+    role: m.role,
+    content: m.content || '',
+    displayedContent: m.content || '',
+    thinking_steps_count: m.thinking_steps_count,
+  }));
+
+  const loadOlderMessages = async () => {
+    if (!currentChatId || !historyCursor || isLoadingOlder) return;
+    const chatId = currentChatId;
+    setIsLoadingOlder(true);
+    try {
+        const response = await apiClient.get(`/v1/chats/${chatId}`, { params: { before: historyCursor } });
+        const page: HistoryPage = response.data;
+        const container = chatContainerRef.current;
+        if (container) scrollAnchorRef.current = container.scrollHeight - container.scrollTop;
+        setMessages(prev => [...toHistoryMessages(chatId, page), ...prev]);
+        setHistoryCursor(page.next_cursor);
+    } catch (error) {
+        console.error("Failed to load older messages:", error);
+    } finally {
+        setIsLoadingOlder(false);
+    }
+  };
+
+  const loadThinkingSteps = async (message: Message) => {
+    if (!currentChatId || message.index === undefined || message.thinking_steps) return;
+    try {
+        const response = await apiClient.get(`/v1/chats/${currentChatId}/messages/${message.index}/thinking_steps`);
+        skipAutoScrollRef.current = true;
+        setMessages(prev => prev.map(m => m.id === message.id ? { ...m, thinking_steps: response.data.thinking_steps } : m));
+    } catch (error) {
+        console.error("Failed to load thinking steps:", error);
+    }
+  };
+
+  const handleChatScroll = () => {
+    const container = chatContainerRef.current;
+    if (container && container.scrollTop < 100) loadOlderMessages();
+  };
+
   const selectChat = async (chatId: string) => {
     if (isLoading && chatId !== currentChatId) return;
     if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
@@ -167,18 +215,13 @@ function App() {
     setIsLoading(true);
     setCurrentChatId(chatId);
     setMessages([]);
+    setHistoryCursor(null);
 
     try {
         const historyRes = await apiClient.get(`/v1/chats/${chatId}`);
-        const historyData = historyRes.data;
-        const historyMessages: Message[] = historyData.map((m: any, index: number) => ({
-            id: `${chatId}-${index}`,
-            role: m.role,
-            content: m.content || '',
-            displayedContent: m.content || '',
-            thinking_steps: m.thinking_steps || [],
-            sources: m.sources || []
-        }));
+        const historyPage: HistoryPage = historyRes.data;
+        const historyMessages = toHistoryMessages(chatId, historyPage);
+        setHistoryCursor(historyPage.next_cursor);
 
         const activeJobRes = await apiClient.get(`/v1/chats/${chatId}/active_job`);
         const { job_id } = activeJobRes.data;
@@ -219,6 +262,7 @@ function App() {
     setCurrentChatId(null);
     setCurrentJobId(null);
     setMessages([]);
+    setHistoryCursor(null);
     setActiveFileId(null);
   };
 
@@ -373,7 +417,17 @@ function App() {
     });
   };
 
-  useEffect(scrollToBottom, [messages]);
+  useEffect(() => {
+    const container = chatContainerRef.current;
+    if (container && scrollAnchorRef.current !== null) {
+      container.scrollTo({ top: container.scrollHeight - scrollAnchorRef.current, behavior: 'instant' });
+      scrollAnchorRef.current = null;
+    } else if (skipAutoScrollRef.current) {
+      skipAutoScrollRef.current = false;
+    } else {
+      scrollToBottom();
+    }
+  }, [messages]);
   useEffect(adjustTextareaHeight, [userInput]);
 
   const handleThemeToggle = () => setTheme(theme === 'dark' ? 'light' : 'dark');
@@ -424,16 +478,19 @@ function App() {
         </aside>
         <main className="main-content">
           <div className="chat-area">
-            <div className="chat-container" ref={chatContainerRef}>
+            <div className="chat-container" ref={chatContainerRef} onScroll={handleChatScroll}>
+              {isLoadingOlder && <div className="spinner-container"><ClipLoader color="#888" size={20} /></div>}
               {messages.length === 0 && !isLoading ? (
                   <div className="welcome-screen"><h1>Mossa AI</h1><p>Начните новый диалог или выберите существующий</p></div>
               ) : (
                   messages.map((msg, index) => (
                       <div key={msg.id} className={`message-block ${msg.role} ${msg.content.length > 0 && msg.content === msg.displayedContent ? 'done' : ''}`}>
                           <div className="message-content">
-                              {msg.role === 'model' && msg.thinking_steps && msg.thinking_steps.length > 0 && (
+                              {msg.role === 'model' && ((msg.thinking_steps && msg.thinking_steps.length > 0) || !!msg.thinking_steps_count) && (
                                 <AgentThoughts
-                                  steps={msg.thinking_steps}
+                                  steps={msg.thinking_steps || null}
+                                  stepsCount={msg.thinking_steps_count}
+                                  onExpand={() => loadThinkingSteps(msg)}
                                   defaultCollapsed={!msg.jobId}
                                 />
                               )}
@@ -7,11 +7,13 @@ export interface Thought {
 
 interface AgentThoughtsProps {
   steps: Thought[] | null;
+  stepsCount?: number;
+  onExpand?: () => void;
   defaultCollapsed: boolean;
   isFinalizing?: boolean;
 }
 
-const AgentThoughts: React.FC<AgentThoughtsProps> = ({ steps, defaultCollapsed, isFinalizing }) => {
+const AgentThoughts: React.FC<AgentThoughtsProps> = ({ steps, stepsCount, onExpand, defaultCollapsed, isFinalizing }) => {
   const [isCollapsed, setIsCollapsed] = useState(defaultCollapsed);
   const contentRef = useRef<HTMLDivElement>(null);
 
@@ -29,10 +31,15 @@ const AgentThoughts: React.FC<AgentThoughtsProps> = ({ steps, defaultCollapsed,
     }
   }, [steps, isCollapsed]);
 
-  if (!steps || steps.length === 0) {
+  if ((!steps || steps.length === 0) && !stepsCount) {
     return null;
   }
 
+  const toggleCollapsed = () => {
+    if (isCollapsed && !steps && onExpand) onExpand();
+    setIsCollapsed(!isCollapsed);
+  };
+
   const getPrefix = (type: string) => {
     const typeMap: { [key: string]: string } = {
       thought: '[Анализ]',
@@ -45,8 +52,8 @@ const AgentThoughts: React.FC<AgentThoughtsProps> = ({ steps, defaultCollapsed,
 
   return (
     <div className={`agent-thoughts-container ${isFinalizing ? 'collapsing' : ''}`}>
-      <div className="agent-thoughts-header" onClick={() => setIsCollapsed(!isCollapsed)}>
-        <h5>Мыслительный процесс</h5>
+      <div className="agent-thoughts-header" onClick={toggleCollapsed}>
+        <h5>Мыслительный процесс{stepsCount ? ` (${stepsCount})` : ''}</h5>
         <button>{isCollapsed ? 'Развернуть' : 'Свернуть'}</button>
       </div>
 
@@ -62,7 +69,8 @@ const AgentThoughts: React.FC<AgentThoughtsProps> = ({ steps, defaultCollapsed,
           borderRadius: '8px',
         }}
       >
-        {steps.map((step, index) => (
+        {!steps && <div className="thought-step">Загрузка...</div>}
+        {steps && steps.map((step, index) => (
           <div key={index} className="thought-step">
             <span style={{ whiteSpace: 'pre-wrap' }}>{`${getPrefix(step.type)} ${step.content}`}</span>
           </div>
@@ -1,39 +1,47 @@
-from google.api_core.client_options import ClientOptions
 import os
 import time
 import logging
 import json
+import threading
 import redis
 import google.generativeai as genai
 import google.generativeai.protos as gap
-from google.ai.generativelanguage_v1beta.services.generative_service.async_client import GenerativeServiceAsyncClient
-from google.ai.generativelanguage_v1beta.services.generative_service import GenerativeServiceAsyncClient as EmbeddingServiceAsyncClient
 from openai import AsyncOpenAI
 import asyncio
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from google.api_core.exceptions import ResourceExhausted, InternalServerError
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-import httpx
+from prometheus_client import start_http_server
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-PROXY_URL = "socks5://host.docker.internal:9999"
+PROXY_URL = os.getenv("CONTROLLER_PROXY_URL", "socks5://host.docker.internal:9999")
 
 from kb_service.connector import MockConnector
 from kb_service.yandex_connector import YandexDiskConnector
 from kb_service.indexer import KnowledgeBaseIndexer
-
-class AgentSettings(BaseModel):
-    model_name: str
-    system_prompt: str
-
-class AppConfig(BaseModel):
-    executor: AgentSettings
-    controller: AgentSettings
+from kb_service.remote import RemoteKnowledgeBase, parse_shards
+from common.metrics import (
+    BULK_FILES_TOTAL, BULK_TASK_QUEUE_DEPTH, JOB_DURATION_SECONDS, JOB_QUEUE_DEPTH, JOB_QUEUE_WAIT_SECONDS, JOBS_TOTAL,
+    STAGE_LATENCY_SECONDS, observe_seconds, record_gemini_usage, record_openai_usage, record_retry,
+)
+from common.bulk_jobs import BULK_MAX_FILES, BULK_TASK_QUEUE, BulkJobStore, select_files
+from common.cancellation import cancellations
+from common.chat_history import read_history, write_history
+from common.clients import client_registry
+from common.codec import dumps, loads
+from common.config_service import AppConfig, config_service
+from common.context_packer import JobContext, job_context, pack_chunks, truncate_to_tokens
+from common.health import start_health_server
+from common.job_store import TERMINAL_STATUSES, JobStore
+from common.kb_tools import KnowledgeBaseTools, format_chunk_source
+from common.rate_limit import estimate_tokens, rate_limited, rate_limiter
+from common.singleflight import make_key, singleflight
+from common.tracing import export_otlp, new_trace_id, span, start_trace
 
 class ThinkingStep(BaseModel):
     type: str
@@ -45,8 +53,12 @@ class Message(BaseModel):
     thinking_steps: Optional[List[ThinkingStep]] = None
 
 HISTORY_DIR = "/app/chat_histories"
-CONFIG_FILE = "/app_config/config.json"
 CONTROLLER_SYSTEM_PROMPT = "You are a helpful assistant."
+BULK_MAP_MODEL = os.getenv("BULK_MAP_MODEL", "gemini-2.5-flash")
+BULK_TOP_K = int(os.getenv("BULK_TOP_K", "5"))
+BULK_FINDING_TOKENS = int(os.getenv("BULK_FINDING_TOKENS", "400"))
+BULK_REDUCE_TOKEN_BUDGET = int(os.getenv("BULK_REDUCE_TOKEN_BUDGET", "30000"))
+BULK_NOT_FOUND = "НЕТ ДАННЫХ"
 
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
@@ -56,9 +68,9 @@ def update_job_status(r_client: redis.Redis, job_id: str, new_thought: str = Non
         
         if new_thought:
             current_thoughts_raw = r_client.hget(job_id, "thoughts")
-            current_thoughts = json.loads(current_thoughts_raw) if current_thoughts_raw else []
+            current_thoughts = loads(current_thoughts_raw) if current_thoughts_raw else []
             current_thoughts.append({"type": "log", "content": new_thought})
-            update_data["thoughts"] = json.dumps(current_thoughts)
+            update_data["thoughts"] = dumps(current_thoughts)
 
         current_job_status = r_client.hget(job_id, "status")
         is_terminal = current_job_status in [b"complete", b"failed", b"cancelled"] if isinstance(current_job_status, bytes) else current_job_status in ["complete", "failed", "cancelled"]
@@ -82,85 +94,46 @@ def update_job_status(r_client: redis.Redis, job_id: str, new_thought: str = Non
     except Exception as e:
         logger.error(f"Failed to update status for job {job_id}: {e}")
 
-def load_config() -> AppConfig:
-    default_config = AppConfig(
-        executor=AgentSettings(model_name='gemini-2.5-pro', system_prompt='You are a helpful assistant.'),
-        controller=AgentSettings(model_name='openai/gpt-4o-mini', system_prompt='You are a helpful assistant.')
-    )
-    if not os.path.exists(CONFIG_FILE):
-        return default_config
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return AppConfig.model_validate(data)
-    except Exception as e:
-        logger.warning(f"Could not load config file due to: {e}. Using defaults.")
-        return default_config
-
 logger.info("Initializing AI clients and services...")
-YANDEX_TOKEN = os.getenv("YANDEX_DISK_API_TOKEN")
-kb_connector = YandexDiskConnector(token=YANDEX_TOKEN) if YANDEX_TOKEN else MockConnector()
-kb_indexer = KnowledgeBaseIndexer(connector=kb_connector)
-kb_indexer.build_index()
-
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 if GEMINI_API_KEY:
-    generative_client = None
-    embedding_client = None
-    genai.configure(api_key=GEMINI_API_KEY)
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY, client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        logger.info(f"Gemini requests are routed to {GEMINI_API_ENDPOINT}.")
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
 else:
     raise ValueError("GEMINI_API_KEY environment variable not set!")
 
+YANDEX_TOKEN = os.getenv("YANDEX_DISK_API_TOKEN")
+KB_RETRIEVAL_SHARDS = os.getenv("KB_RETRIEVAL_SHARDS")
+if KB_RETRIEVAL_SHARDS:
+    kb_indexer = RemoteKnowledgeBase(parse_shards(KB_RETRIEVAL_SHARDS))
+else:
+    kb_connector = YandexDiskConnector(token=YANDEX_TOKEN) if YANDEX_TOKEN else MockConnector()
+    kb_indexer = KnowledgeBaseIndexer(connector=kb_connector)
+
 CONTROLLER_PROVIDER = os.getenv("CONTROLLER_PROVIDER", "openai").lower()
 CONTROLLER_API_KEY = os.getenv("OPENROUTER_API_KEY") if CONTROLLER_PROVIDER == "openrouter" else os.getenv("OPENAI_API_KEY")
-CONTROLLER_BASE_URL = "https://openrouter.ai/api/v1" if CONTROLLER_PROVIDER == "openrouter" else "https://api.openai.com/v1"
+CONTROLLER_BASE_URL = os.getenv("CONTROLLER_BASE_URL") or ("https://openrouter.ai/api/v1" if CONTROLLER_PROVIDER == "openrouter" else "https://api.openai.com/v1")
 controller_client = AsyncOpenAI(
     base_url=CONTROLLER_BASE_URL, 
     api_key=CONTROLLER_API_KEY,
-    http_client=httpx.AsyncClient(proxies={"all://": PROXY_URL})
+    http_client=client_registry.http_client(PROXY_URL)
 ) if CONTROLLER_API_KEY else None
 if controller_client:
     logger.info(f"Controller configured to use {CONTROLLER_PROVIDER}.")
 else:
     logger.warning("Controller client not configured. Quality Control will be skipped.")
 
-def analyze_document(file_id: str, query: str) -> str:
-    logger.info(f"TOOL CALL: analyze_document for file_id: {file_id} with query: '{query}'")
-    try:
-        results = kb_indexer.search(query=query, file_id=file_id)
-        if not results:
-            file_info = kb_indexer.get_file_by_id(file_id)
-            file_name = file_info['name'] if file_info else file_id
-            return f"Внутри файла '{file_name}' по вашему запросу '{query}' ничего не найдено."
-        formatted_results = [f"--- Результат поиска №{i+1} (из файла: {chunk['file_name']}) ---\n{chunk['text']}\n" for i, chunk in enumerate(results)]
-        return "\n".join(formatted_results)
-    except Exception as e:
-        logger.error(f"Error in analyze_document tool for file_id {file_id}: {e}", exc_info=True)
-        return f"ОШИБКА: Произошла внутренняя ошибка при поиске по файлу: {e}"
-
-def search_knowledge_base(query: str) -> str:
-    logger.info(f"TOOL CALL: search_knowledge_base with query: '{query}'")
-    results = kb_indexer.search(query)
-    if not results:
-        return "По вашему запросу в базе знаний ничего не найдено."
-    formatted_results = [f"--- Результат поиска №{i+1} (из файла: {chunk['file_name']}) ---\n{chunk['text']}\n" for i, chunk in enumerate(results)]
-    return "\n".join(formatted_results)
-
-def list_all_files_summary() -> str:
-    logger.info("TOOL CALL: list_all_files_summary")
-    try:
-        all_files = kb_indexer.get_all_files()
-        if not all_files: return "В базе знаний нет доступных файлов."
-        summary = "Доступные файлы в базе знаний:\n" + "\n".join([f"- Имя файла: '{f.get('name', 'N/A')}', ID: '{f.get('id', 'N/A')}'" for f in all_files])
-        return summary.strip()
-    except Exception as e:
-        logger.error(f"Error in list_all_files_summary tool: {e}", exc_info=True)
-        return f"ОШИБКА: Не удалось получить список файлов: {e}"
+kb_tools = KnowledgeBaseTools(kb_indexer)
 
 @retry(
     wait=wait_exponential(multiplier=1, min=2, max=60),
     stop=stop_after_attempt(3),
-    retry=retry_if_exception_type((ResourceExhausted, InternalServerError))
+    retry=retry_if_exception_type((ResourceExhausted, InternalServerError)),
+    before_sleep=record_retry
 )
 async def run_with_retry(func, *args, **kwargs):
     return await func(*args, **kwargs)
@@ -171,11 +144,7 @@ def load_and_prepare_history(conversation_id: str) -> List[Dict]:
         return []
     
     try:
-        with open(history_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            if not content:
-                return []
-            loaded_history = json.loads(content)
+        loaded_history = read_history(history_file_path)
     except (json.JSONDecodeError, IOError) as e:
         logger.warning(f"Could not load/parse history for {conversation_id}: {e}. Starting fresh.")
         return []
@@ -183,14 +152,44 @@ def load_and_prepare_history(conversation_id: str) -> List[Dict]:
     sanitized_history = [{k: v for k, v in msg.items() if k != 'thinking_steps'} for msg in loaded_history]
     return sanitized_history
 
+def save_model_message(r_client: redis.Redis, job_id: str, conversation_id: str, answer: str) -> None:
+    history_file_path = os.path.join(HISTORY_DIR, f"{conversation_id}.json")
+    try:
+        with span("history_write"):
+            history = read_history(history_file_path) if os.path.exists(history_file_path) else []
+
+            final_thoughts_raw = r_client.hget(job_id, "thoughts")
+            final_thinking_steps = loads(final_thoughts_raw) if final_thoughts_raw else []
+            model_message = Message(role="model", parts=[answer], thinking_steps=[ThinkingStep(**step) for step in final_thinking_steps])
+
+            history.append(model_message.model_dump(exclude_none=True))
+
+            write_history(history_file_path, history)
+
+        logger.info(f"Task for job {job_id} finished. History saved.")
+
+    except Exception as e:
+        logger.error(f"Failed to save model response to history for job {job_id}: {e}", exc_info=True)
+    finally:
+        release_active_job(r_client, job_id, conversation_id)
+
+def release_active_job(r_client: redis.Redis, job_id: str, conversation_id: Optional[str]) -> None:
+    active_job_key = f"active_job_for_convo:{conversation_id}"
+    if conversation_id and r_client.get(active_job_key) == job_id:
+        r_client.delete(active_job_key)
+        logger.info(f"Cleaned up active job key '{active_job_key}' for job {job_id}.")
+
 async def determine_file_context(user_message: str, all_files: List[Dict]) -> Optional[str]:
     if not all_files: return None
     files_summary = "\n".join([f"- Имя файла: '{f.get('name', 'N/A')}', ID: '{f.get('id', 'N/A')}'" for f in all_files])
     prompt = f"You are a classification assistant. Your task is to determine if a user's query refers to a specific file from a provided list. Here is the list of available files:\n\n<file_list>\n{files_summary}\n</file_list>\n\nUser's query: <query>{user_message}</query>\n\nIf the query explicitly or implicitly refers to one of the files from the list, respond with ONLY the file's ID from the list. If it does not refer to any specific file, or if you are unsure, respond with 'None'."
+    async def classify() -> str:
+        context_model = client_registry.model('gemini-2.5-flash')
+        response = await run_with_retry(rate_limited("gemini", 'gemini-2.5-flash', estimate_tokens(prompt), context_model.generate_content_async), prompt)
+        record_gemini_usage('gemini-2.5-flash', response)
+        return response.text.strip()
     try:
-        context_model = genai.GenerativeModel('gemini-2.5-flash')
-        response = await run_with_retry(context_model.generate_content_async, prompt)
-        file_id_match = response.text.strip()
+        file_id_match = await singleflight.run_async("determine_file_context", make_key("determine_file_context", 'gemini-2.5-flash', prompt), classify)
         if file_id_match in {f.get('id') for f in all_files}:
             logger.info(f"Context analysis determined the query refers to file_id: {file_id_match}")
             return file_id_match
@@ -199,24 +198,19 @@ async def determine_file_context(user_message: str, all_files: List[Dict]) -> Op
         logger.error(f"Error during context determination: {e}")
         return None
 
-async def handle_complex_task(job_id: str, request_payload: dict, r_client: redis.Redis, config: AppConfig):
-    if r_client.hget(job_id, "status") == "cancelled":
-        logger.info(f"Job {job_id} was cancelled. Aborting before processing.")
-        return
-        
+async def handle_complex_task(job_id: str, request_payload: dict, r_client: redis.Redis, config: AppConfig, context: JobContext):
     MAX_ITERATIONS = 3
     feedback_from_controller = ""
     final_approved_answer = "Агент не смог сформировать ответ."
-    tool_context = ""
     request_message = request_payload['message']
     request_file_id = request_payload.get('file_id')
     conversation_id = request_payload['conversation_id']
 
     logger.info(f"EXECUTOR PROMPT FOR JOB {job_id}: '{config.executor.system_prompt}'")
 
-    model = genai.GenerativeModel(
-        model_name=config.executor.model_name,
-        tools=[analyze_document, search_knowledge_base, list_all_files_summary],
+    model = client_registry.model(
+        config.executor.model_name,
+        tools=kb_tools.tools,
         system_instruction=config.executor.system_prompt
     )
     
@@ -225,17 +219,14 @@ async def handle_complex_task(job_id: str, request_payload: dict, r_client: redi
     chat_session = model.start_chat(history=sanitized_history)
     
     for iteration in range(MAX_ITERATIONS):
-        if r_client.hget(job_id, "status") == "cancelled":
-            logger.info(f"Job {job_id} was cancelled during iteration {iteration + 1}. Aborting.")
-            return
-
         if iteration == 0:
             update_job_status(r_client, job_id, new_thought="[Анализ] Анализирую запрос и планирую действия...")
             
             if not request_file_id:
                 update_job_status(r_client, job_id, new_thought="[Анализ] Ищу возможные отсылки к документам в базе знаний...")
                 all_files = kb_indexer.get_all_files()
-                contextual_file_id = await determine_file_context(request_message, all_files)
+                with span("determine_file_context", files=len(all_files)), observe_seconds(STAGE_LATENCY_SECONDS, stage="context_detection"):
+                    contextual_file_id = await determine_file_context(request_message, all_files)
                 if contextual_file_id:
                     request_file_id = contextual_file_id
                     file_info = kb_indexer.get_file_by_id(contextual_file_id)
@@ -250,15 +241,12 @@ async def handle_complex_task(job_id: str, request_payload: dict, r_client: redi
         elif iteration > 0:
             prompt_for_executor = f"IMPORTANT: An internal quality review has provided feedback on your last response. You MUST refine your answer for the end-user based on this feedback. Do not address the feedback directly. Instead, provide a new, improved final answer to the user's original query.\n\n[Original User Query]: {request_message}\n\n[Internal Feedback]: {feedback_from_controller}\n\nRefine your previous answer now."
         
-        response = await run_with_retry(chat_session.send_message_async, prompt_for_executor)
+        with span("send_message_async", model=config.executor.model_name, iteration=iteration + 1), observe_seconds(STAGE_LATENCY_SECONDS, stage="executor_turn"):
+            response = await run_with_retry(rate_limited("gemini", config.executor.model_name, estimate_tokens(prompt_for_executor), chat_session.send_message_async), prompt_for_executor)
+        record_gemini_usage(config.executor.model_name, response)
         executor_answer = "Исполнитель не смог сформировать ответ."
-        tool_context = ""
 
         while True:
-            if r_client.hget(job_id, "status") == "cancelled":
-                logger.info(f"Job {job_id} was cancelled during tool use. Aborting.")
-                return
-            
             if not response.candidates or not response.candidates[0].content.parts:
                 logger.error(f"Gemini returned an empty or malformed response for job {job_id}. This might be due to safety filters. Response: {response}")
                 if iteration > 0:
@@ -271,12 +259,15 @@ async def handle_complex_task(job_id: str, request_payload: dict, r_client: redi
 
             if hasattr(part, 'function_call') and part.function_call.name:
                 fc = part.function_call
-                tool_map = {"analyze_document": analyze_document, "search_knowledge_base": search_knowledge_base, "list_all_files_summary": list_all_files_summary}
+                tool_map = {tool.__name__: tool for tool in kb_tools.tools}
                 tool_func = tool_map.get(fc.name)
-                tool_result = tool_func(**dict(fc.args)) if tool_func else f"Ошибка: Неизвестный инструмент '{fc.name}'."
-                tool_context += f"Вызов {fc.name} с {fc.args} дал результат:\n{tool_result}\n\n"
-                update_job_status(r_client, job_id, new_thought=f"Обращаюсь к базе знаний с запросом: {fc.args.get('query', '...')}")
-                response = await run_with_retry(chat_session.send_message_async, gap.Part(function_response=gap.FunctionResponse(name=fc.name, response={'content': tool_result})))
+                with span("tool_call", tool=fc.name), observe_seconds(STAGE_LATENCY_SECONDS, stage="tool_call"):
+                    tool_result = await asyncio.to_thread(tool_func, **dict(fc.args)) if tool_func else f"Ошибка: Неизвестный инструмент '{fc.name}'."
+                context.record_call(fc.name, dict(fc.args), tool_result)
+                update_job_status(r_client, job_id, new_thought=f"Обращаюсь к базе знаний с запросом: {fc.args.get('query') or '; '.join(fc.args.get('queries', [])) or '...'}")
+                with span("send_message_async", model=config.executor.model_name, iteration=iteration + 1, function_response=fc.name), observe_seconds(STAGE_LATENCY_SECONDS, stage="executor_turn"):
+                    response = await run_with_retry(rate_limited("gemini", config.executor.model_name, estimate_tokens(tool_result), chat_session.send_message_async), gap.Part(function_response=gap.FunctionResponse(name=fc.name, response={'content': tool_result})))
+                record_gemini_usage(config.executor.model_name, response)
             elif hasattr(part, 'text') and part.text:
                 executor_answer = part.text
                 break
@@ -288,15 +279,18 @@ async def handle_complex_task(job_id: str, request_payload: dict, r_client: redi
             update_job_status(r_client, job_id, new_thought="Контроль качества пропущен (не настроен).")
             break
         
-        if r_client.hget(job_id, "status") == "cancelled":
-            logger.info(f"Job {job_id} was cancelled before controller. Aborting.")
-            return
-
         update_job_status(r_client, job_id, new_thought="Отправляю на проверку качества ответа")
-        controller_prompt = f"User query: <user_query>{request_message}</user_query>\nRetrieved context: <retrieved_context>{tool_context or 'None'}</retrieved_context>\nAnswer to review: <answer_to_review>{executor_answer}</answer_to_review>\nIs the answer complete and accurate? Respond with JSON: {{'is_approved': boolean, 'feedback': string}}."
+        controller_prompt = f"User query: <user_query>{request_message}</user_query>\nRetrieved context: <retrieved_context>{context.controller_view()}</retrieved_context>\nAnswer to review: <answer_to_review>{executor_answer}</answer_to_review>\nIs the answer complete and accurate? Respond with JSON: {{'is_approved': boolean, 'feedback': string}}."
         controller_model_name = os.getenv("CONTROLLER_MODEL_NAME") or config.controller.model_name
-        controller_response = await controller_client.chat.completions.create(model=controller_model_name, messages=[{"role": "system", "content": config.controller.system_prompt}, {"role": "user", "content": controller_prompt}], response_format={"type": "json_object"})
-        review_data = json.loads(controller_response.choices[0].message.content)
+        controller_messages = [{"role": "system", "content": config.controller.system_prompt}, {"role": "user", "content": controller_prompt}]
+        async def review() -> str:
+            create = rate_limited(CONTROLLER_PROVIDER, controller_model_name, estimate_tokens(controller_prompt), controller_client.chat.completions.create)
+            controller_response = await create(model=controller_model_name, messages=controller_messages, response_format={"type": "json_object"})
+            record_openai_usage(controller_model_name, controller_response)
+            return controller_response.choices[0].message.content
+        with span("controller_review", model=controller_model_name, iteration=iteration + 1), observe_seconds(STAGE_LATENCY_SECONDS, stage="controller_review"):
+            review_content = await singleflight.run_async("controller_review", make_key("controller_review", controller_model_name, controller_messages), review)
+        review_data = json.loads(review_content)
 
         if review_data.get("is_approved"):
             update_job_status(r_client, job_id, new_thought="Ответ прошел проверку качества.")
@@ -307,35 +301,11 @@ async def handle_complex_task(job_id: str, request_payload: dict, r_client: redi
             if iteration == MAX_ITERATIONS - 1:
                 logger.warning("Max iterations reached for job {job_id}. Using the last answer.")
 
+    r_client.hset(job_id, "context_tokens_saved", context.total_saved)
+    logger.info(f"Context packing saved about {context.total_saved} prompt tokens for job {job_id} (tool results: {context.tokens_saved['tool']}, controller: {context.tokens_saved['controller']}).")
     update_job_status(r_client, job_id, final_answer=final_approved_answer, status="complete")
     
-    history_file_path = os.path.join(HISTORY_DIR, f"{conversation_id}.json")
-    try:
-        if os.path.exists(history_file_path):
-            with open(history_file_path, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if not isinstance(history, list): history = []
-        else:
-            history = []
-        
-        final_thoughts_raw = r_client.hget(job_id, "thoughts")
-        final_thinking_steps = json.loads(final_thoughts_raw) if final_thoughts_raw else []
-        model_message = Message(role="model", parts=[final_approved_answer], thinking_steps=[ThinkingStep(**step) for step in final_thinking_steps])
-        
-        history.append(model_message.model_dump(exclude_none=True))
-        
-        with open(history_file_path, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"Task for job {job_id} finished. History saved.")
-
-    except Exception as e:
-        logger.error(f"Failed to save model response to history for job {job_id}: {e}", exc_info=True)
-    finally:
-        active_job_key = f"active_job_for_convo:{conversation_id}"
-        if r_client.get(active_job_key) == job_id:
-             r_client.delete(active_job_key)
-             logger.info(f"Cleaned up active job key '{active_job_key}' for completed job {job_id}.")
+    save_model_message(r_client, job_id, conversation_id, final_approved_answer)
 
 async def handle_simple_chat(job_id: str, request_payload: dict, r_client: redis.Redis, config: AppConfig):
     request_message = request_payload['message']
@@ -344,52 +314,213 @@ async def handle_simple_chat(job_id: str, request_payload: dict, r_client: redis
     sanitized_history = load_and_prepare_history(conversation_id)
 
     update_job_status(r_client, job_id, new_thought="Инициализация модели 'gemini-2.5-flash'...")
-    model = genai.GenerativeModel(model_name='gemini-2.5-flash')
+    model = client_registry.model('gemini-2.5-flash')
     chat_session = model.start_chat(history=sanitized_history)
 
     update_job_status(r_client, job_id, new_thought="Отправка запроса в модель...")
-    response = await run_with_retry(chat_session.send_message_async, request_message)
+    with span("send_message_async", model='gemini-2.5-flash'), observe_seconds(STAGE_LATENCY_SECONDS, stage="executor_turn"):
+        response = await run_with_retry(rate_limited("gemini", 'gemini-2.5-flash', estimate_tokens(request_message), chat_session.send_message_async), request_message)
+    record_gemini_usage('gemini-2.5-flash', response)
     final_answer = response.text
 
     update_job_status(r_client, job_id, new_thought="Ответ сгенерирован в простом режиме.", final_answer=final_answer, status="complete")
 
-    history_file_path = os.path.join(HISTORY_DIR, f"{conversation_id}.json")
+    save_model_message(r_client, job_id, conversation_id, final_answer)
+
+# Bulk jobs answer one question over many files. The job itself only selects the files and
+# queues one map task per file; any free worker slot picks map tasks up, so wall time
+# scales with the number of workers. Each map task searches its file and has the cheap
+# model extract what is relevant, and the task that finishes the last file runs the reduce.
+async def handle_bulk_job(job_id: str, request_payload: dict, r_client: redis.Redis) -> None:
+    warming_up = kb_tools.warming_up_message()
+    if warming_up:
+        update_job_status(r_client, job_id, final_answer=warming_up, status="complete")
+        save_model_message(r_client, job_id, request_payload['conversation_id'], warming_up)
+        return
+    files = select_files(kb_indexer.get_all_files(), request_payload.get('folder'), request_payload.get('file_ids'))
+    if not files:
+        answer = "Не найдено ни одного файла для пакетного анализа. Проверьте путь к папке или список файлов."
+        update_job_status(r_client, job_id, final_answer=answer, status="complete")
+        save_model_message(r_client, job_id, request_payload['conversation_id'], answer)
+        return
+    if len(files) > BULK_MAX_FILES:
+        update_job_status(r_client, job_id, new_thought=f"[Пакетный анализ] Выбрано {len(files)} файлов, будут проанализированы первые {BULK_MAX_FILES}.")
+        files = files[:BULK_MAX_FILES]
+    update_job_status(r_client, job_id, new_thought=f"[Пакетный анализ] Запускаю анализ {len(files)} файлов...")
+    task = {"message": request_payload['message'], "conversation_id": request_payload['conversation_id']}
+    BulkJobStore(r_client).start(job_id, files, task)
+    logger.info(f"Bulk job {job_id} queued {len(files)} map tasks.")
+
+async def extract_from_file(task: Dict) -> Dict:
+    results = await asyncio.to_thread(kb_indexer.search, task['message'], BULK_TOP_K, task['file_id'])
+    if not results:
+        return {"status": "empty", "answer": ""}
+    fragments = "\n\n".join(f"[{format_chunk_source(passage)}]\n{passage['text']}" for passage in pack_chunks(results))
+    prompt = f"You are checking one document as part of a review of many documents.\n\nQuestion: <question>{task['message']}</question>\n\nFragments of the document '{task['file_name']}':\n<fragments>\n{fragments}\n</fragments>\n\nAnswer the question for this document only, using only the fragments. Be brief, quote exact values and references to sections or pages, and answer in the language of the question. If the fragments contain nothing relevant, respond with exactly '{BULK_NOT_FOUND}'."
+    model = client_registry.model(BULK_MAP_MODEL)
+    response = await run_with_retry(rate_limited("gemini", BULK_MAP_MODEL, estimate_tokens(prompt), model.generate_content_async), prompt)
+    record_gemini_usage(BULK_MAP_MODEL, response)
+    answer = response.text.strip()
+    if not answer or answer.upper().startswith(BULK_NOT_FOUND):
+        return {"status": "empty", "answer": ""}
+    return {"status": "found", "answer": truncate_to_tokens(answer, BULK_FINDING_TOKENS)}
+
+async def run_bulk_task(r_client: redis.Redis, task_raw: str) -> None:
     try:
-        if os.path.exists(history_file_path):
-            with open(history_file_path, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if not isinstance(history, list): history = []
-        else:
-            history = []
-        
-        final_thoughts_raw = r_client.hget(job_id, "thoughts")
-        final_thinking_steps = json.loads(final_thoughts_raw) if final_thoughts_raw else []
-        model_message = Message(role="model", parts=[final_answer], thinking_steps=[ThinkingStep(**step) for step in final_thinking_steps])
-        
-        history.append(model_message.model_dump(exclude_none=True))
-        
-        with open(history_file_path, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"Task for job {job_id} finished. History saved.")
-
+        task = loads(task_raw)
+        job_id = task['job_id']
+    except (json.JSONDecodeError, KeyError) as e:
+        logger.error(f"Failed to decode bulk task from Redis: {e}. Raw data: '{task_raw}'")
+        return
+    store = BulkJobStore(r_client)
+    # Map tasks register under the bulk job, so a cancel aborts every one in flight.
+    cancellations.register(job_id, asyncio.current_task())
+    try:
+        status = r_client.hget(job_id, "status")
+        if status == "cancelled":
+            logger.info(f"Skipping map task for {task['file_id']}: bulk job {job_id} was cancelled.")
+            finish_cancelled_bulk_job(r_client, job_id, task, "queued")
+            return
+        if status != "processing":
+            logger.info(f"Skipping map task for {task['file_id']}: bulk job {job_id} is no longer running.")
+            return
+        try:
+            with observe_seconds(STAGE_LATENCY_SECONDS, stage="bulk_map"):
+                result = await extract_from_file(task)
+        except Exception as e:
+            logger.error(f"Map task for {task['file_id']} of bulk job {job_id} failed: {e}", exc_info=True)
+            result = {"status": "error", "answer": str(e)}
+        BULK_FILES_TOTAL.labels(status=result['status']).inc()
+        progress = store.record_result(job_id, task['file_id'], {**result, "file_id": task['file_id'], "file_name": task['file_name'], "index": task['index']})
+        if progress is None:
+            logger.warning(f"Map task for {task['file_id']} of bulk job {job_id} was already recorded.")
+            return
+        # A cancel can land between the pickup check and here without reaching this task.
+        if r_client.hget(job_id, "status") == "cancelled":
+            finish_cancelled_bulk_job(r_client, job_id, task, "running")
+            return
+        done, total = progress
+        label = {"found": "есть данные", "empty": "нет данных", "error": "ошибка"}[result['status']]
+        store.append_thought(job_id, f"[{done}/{total}] {task['file_name']}: {label}")
+        if done == total:
+            await reduce_bulk_job(job_id, task, r_client)
+    except asyncio.CancelledError:
+        if cancellations.requested_at(job_id) is None:
+            raise
+        logger.info(f"Map task for {task['file_id']} of bulk job {job_id} cancelled; in-flight calls aborted.")
+        finish_cancelled_bulk_job(r_client, job_id, task, "running")
     except Exception as e:
-        logger.error(f"Failed to save model response to history for job {job_id}: {e}", exc_info=True)
+        logger.error(f"An error occurred while running a map task of bulk job {job_id}: {e}", exc_info=True)
     finally:
-        active_job_key = f"active_job_for_convo:{conversation_id}"
-        if r_client.get(active_job_key) == job_id:
-             r_client.delete(active_job_key)
-             logger.info(f"Cleaned up active job key '{active_job_key}' for completed job {job_id}.")
+        cancellations.unregister(job_id, asyncio.current_task())
+
+# A cancelled bulk job never reaches its reduce step, so the first map task that sees the
+# cancel, at pickup or in flight, releases the chat and archives the job in its place.
+def finish_cancelled_bulk_job(r_client: redis.Redis, job_id: str, task: Dict, state: str) -> None:
+    store = BulkJobStore(r_client)
+    if not store.claim_cancelled(job_id):
+        return
+    cancel_requested_at = r_client.hget(job_id, "cancel_requested_at")
+    cancellations.observe(job_id, state, float(cancel_requested_at) if cancel_requested_at else None)
+    release_active_job(r_client, job_id, task['conversation_id'])
+    store.expire(job_id)
+    JOBS_TOTAL.labels(mode="bulk", status="cancelled").inc()
+    finalize_job(r_client, job_id)
+    logger.info(f"Bulk job {job_id} cancelled; remaining map tasks are skipped and the reduce step will not run.")
+
+async def summarize_findings(findings: List[str], request_message: str) -> str:
+    findings_text = "\n".join(findings)
+    prompt = f"Question: <question>{request_message}</question>\n\nFindings from individual documents:\n<findings>\n{findings_text}\n</findings>\n\nMerge these findings into a shorter list. Keep every distinct fact together with the names of the documents it comes from, and answer in the language of the question."
+    model = client_registry.model(BULK_MAP_MODEL)
+    response = await run_with_retry(rate_limited("gemini", BULK_MAP_MODEL, estimate_tokens(prompt), model.generate_content_async), prompt)
+    record_gemini_usage(BULK_MAP_MODEL, response)
+    return response.text.strip()
+
+# Findings that do not fit BULK_REDUCE_TOKEN_BUDGET are merged in batches by the cheap model
+# first, so the final prompt stays bounded however many files matched.
+async def reduce_findings(findings: List[str], request_message: str) -> List[str]:
+    while len(findings) > 1 and estimate_tokens("\n\n".join(findings)) > BULK_REDUCE_TOKEN_BUDGET:
+        batches: List[List[str]] = [[]]
+        for finding in findings:
+            if batches[-1] and estimate_tokens("\n\n".join(batches[-1] + [finding])) > BULK_REDUCE_TOKEN_BUDGET // 2:
+                batches.append([])
+            batches[-1].append(finding)
+        if len(batches) == len(findings):
+            break
+        findings = list(await asyncio.gather(*(summarize_findings(batch, request_message) for batch in batches)))
+    return findings
+
+async def reduce_bulk_job(job_id: str, task: Dict, r_client: redis.Redis) -> None:
+    store = BulkJobStore(r_client)
+    created_at = r_client.hget(job_id, "created_at")
+    try:
+        config = config_service.get()
+        results = store.results(job_id)
+        found = [result for result in results if result['status'] == "found"]
+        failed = [result for result in results if result['status'] == "error"]
+        store.append_thought(job_id, f"[Пакетный анализ] Сведения найдены в {len(found)} из {len(results)} файлов. Формирую итоговый ответ...")
+        if not found:
+            answer = f"Ни в одном из {len(results)} проанализированных файлов не найдено сведений по запросу."
+        else:
+            with observe_seconds(STAGE_LATENCY_SECONDS, stage="bulk_reduce"):
+                findings = await reduce_findings([f"### {result['file_name']}\n{result['answer']}" for result in found], task['message'])
+                findings_text = "\n".join(findings)
+                notes = f"{len(results) - len(found) - len(failed)} documents contained nothing relevant." + (f" {len(failed)} documents could not be analyzed: {', '.join(result['file_name'] for result in failed)}." if failed else "")
+                prompt = f"The user's request was checked against {len(results)} documents of the knowledge base, one by one.\n\n[User Request]: {task['message']}\n\n[Findings per document]:\n{findings_text}\n\n{notes}\n\nWrite the final answer to the user's request from these findings. Name the documents each statement comes from."
+                model = client_registry.model(config.executor.model_name, system_instruction=config.executor.system_prompt)
+                response = await run_with_retry(rate_limited("gemini", config.executor.model_name, estimate_tokens(prompt), model.generate_content_async), prompt)
+            record_gemini_usage(config.executor.model_name, response)
+            answer = response.text
+        if r_client.hget(job_id, "status") == "cancelled":
+            finish_cancelled_bulk_job(r_client, job_id, task, "running")
+            return
+        update_job_status(r_client, job_id, final_answer=answer, status="complete")
+        save_model_message(r_client, job_id, task['conversation_id'], answer)
+    except Exception as e:
+        logger.error(f"Reduce step of bulk job {job_id} failed: {e}", exc_info=True)
+        update_job_status(r_client, job_id, new_thought=f"Критическая ошибка: {e}", status="failed")
+    # Not in a finally: a cancelled reduce is wrapped up by finish_cancelled_bulk_job.
+    store.expire(job_id)
+    if created_at:
+        JOB_DURATION_SECONDS.labels(mode="bulk").observe(time.time() - float(created_at))
+    JOBS_TOTAL.labels(mode="bulk", status=r_client.hget(job_id, "status") or "unknown").inc()
+    finalize_job(r_client, job_id)
 
 
+def finalize_job(r_client: redis.Redis, job_id: str) -> None:
+    try:
+        JobStore(r_client, HISTORY_DIR).finalize(job_id)
+    except Exception as e:
+        logger.error(f"Failed to archive job {job_id}: {e}", exc_info=True)
+
 async def process_ai_task(job_id: str, request_payload: dict, r_client: redis.Redis):
     try:
-        config = load_config()
-        use_agent_mode = request_payload.get('use_agent_mode', False)
+        with start_trace(request_payload.get('trace_id') or new_trace_id(), job_id) as trace:
+            try:
+                await run_ai_task(job_id, request_payload, r_client)
+            finally:
+                trace.finish()
+                try:
+                    r_client.hset(job_id, "trace", dumps(trace.to_dict()))
+                    export_otlp(trace)
+                except Exception as e:
+                    logger.error(f"Failed to store trace for job {job_id}: {e}")
+    finally:
+        finalize_job(r_client, job_id)
 
-        if use_agent_mode:
+async def run_ai_task(job_id: str, request_payload: dict, r_client: redis.Redis):
+    use_agent_mode = request_payload.get('use_agent_mode', False)
+    mode = "bulk" if request_payload.get('mode') == "bulk" else "agent" if use_agent_mode else "simple"
+    start = time.perf_counter()
+    try:
+        config = config_service.get()
+
+        if mode == "bulk":
+            await handle_bulk_job(job_id, request_payload, r_client)
+        elif use_agent_mode:
             update_job_status(r_client, job_id, new_thought="Активирован 'Режим агента'. Запускаю протокол глубокого анализа.")
-            await handle_complex_task(job_id, request_payload, r_client, config)
+            with job_context() as context:
+                await handle_complex_task(job_id, request_payload, r_client, config, context)
         else:
             update_job_status(r_client, job_id, new_thought="Простой режим. Генерирую прямой ответ...")
             await handle_simple_chat(job_id, request_payload, r_client, config)
@@ -397,32 +528,117 @@ async def process_ai_task(job_id: str, request_payload: dict, r_client: redis.Re
     except Exception as e:
         logger.error(f"Critical error during AI task for job {job_id}: {e}", exc_info=True)
         update_job_status(r_client, job_id, new_thought=f"Критическая ошибка: {e}", status="failed")
-
-async def main_worker_loop():
-    logger.info("AI Worker is running and waiting for tasks.")
-    redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "redis"), port=6379, db=0, decode_responses=True)
-
+    finally:
+        job_status = r_client.hget(job_id, "status") or "unknown"
+        # A bulk job that fanned out is still processing; its reduce step records it.
+        if mode != "bulk" or job_status in TERMINAL_STATUSES:
+            JOB_DURATION_SECONDS.labels(mode=mode).observe(time.perf_counter() - start)
+            JOBS_TOTAL.labels(mode=mode, status=job_status).inc()
+
+def keep_kb_fresh() -> None:
+    kb_indexer.warm_up()
+    kb_indexer.start_watching()
     while True:
+        time.sleep(kb_indexer.full_scan_interval_minutes() * 60)
         try:
-            _, job_raw = redis_client.brpop("job_queue", timeout=0)
-            job_data = json.loads(job_raw)
-            job_id = job_data.get("job_id")
-            payload = json.loads(job_data.get("payload", "{}"))
+            kb_indexer.build_index()
+        except Exception as e:
+            logger.error(f"Periodic knowledge base scan failed: {e}", exc_info=True)
 
-            if not job_id:
-                logger.warning("Skipping job with no job_id.")
-                continue
+def worker_readiness(redis_client: redis.Redis) -> Tuple[int, Dict]:
+    kb_status = kb_indexer.get_status()
+    try:
+        redis_client.ping()
+    except redis.RedisError as e:
+        return 503, {"status": "unavailable", "redis": str(e), "knowledge_base": kb_status}
+    return 200, {"status": "ready" if kb_status["state"] == "ready" else "degraded", "knowledge_base": kb_status}
 
-            logger.info(f"Picked up job: {job_id}")
-            update_job_status(redis_client, job_id, new_thought="Задача в работе. Подключаю вычислительные ресурсы...", status="processing")
+async def run_job(redis_client: redis.Redis, job_raw: str) -> None:
+    try:
+        job_data = loads(job_raw)
+        job_id = job_data.get("job_id")
+        payload = job_data.get("payload") or {}
+        # Jobs queued by older backends carry the payload as a JSON string.
+        if isinstance(payload, str):
+            payload = loads(payload)
+        payload.setdefault("trace_id", job_data.get("trace_id"))
+
+        if not job_id:
+            logger.warning("Skipping job with no job_id.")
+            return
 
+        logger.info(f"Picked up job: {job_id}")
+        if job_data.get("enqueued_at"):
+            JOB_QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - float(job_data["enqueued_at"])))
+
+        # Registered before the status check so a cancel published in between is not lost.
+        cancellations.register(job_id, asyncio.current_task())
+        try:
+            status, cancel_requested_at = redis_client.hmget(job_id, "status", "cancel_requested_at")
+            if status == "cancelled":
+                logger.info(f"Job {job_id} was cancelled while queued. Skipping.")
+                cancellations.observe(job_id, "queued", float(cancel_requested_at) if cancel_requested_at else None)
+                release_active_job(redis_client, job_id, payload.get('conversation_id'))
+                finalize_job(redis_client, job_id)
+                return
+
+            update_job_status(redis_client, job_id, new_thought="Задача в работе. Подключаю вычислительные ресурсы...", status="processing")
             await process_ai_task(job_id, payload, redis_client)
+        except asyncio.CancelledError:
+            if cancellations.requested_at(job_id) is None:
+                raise
+            cancellations.observe(job_id, "running")
+            # A cancelled job never reaches save_model_message, which releases the conversation.
+            release_active_job(redis_client, job_id, payload.get('conversation_id'))
+            logger.info(f"Job {job_id} cancelled; in-flight calls aborted and slot released.")
+        finally:
+            cancellations.unregister(job_id, asyncio.current_task())
+
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to decode job from Redis: {e}. Raw data: '{job_raw}'")
+    except Exception as e:
+        logger.error(f"An error occurred while running a job: {e}", exc_info=True)
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to decode job from Redis: {e}. Raw data: '{job_raw}'")
+async def main_worker_loop():
+    logger.info("AI Worker is running and waiting for tasks.")
+    redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "redis"), port=6379, db=0, decode_responses=True)
+    JOB_QUEUE_DEPTH.set_function(lambda: redis_client.llen("job_queue"))
+    BULK_TASK_QUEUE_DEPTH.set_function(lambda: redis_client.llen(BULK_TASK_QUEUE))
+    start_http_server(int(os.getenv("WORKER_METRICS_PORT", "9100")))
+    start_health_server(int(os.getenv("WORKER_HEALTH_PORT", "9101")), lambda: worker_readiness(redis_client))
+    rate_limiter.attach(redis_client)
+    cancellations.listen(redis_client)
+    config_service.listen(redis_client)
+    threading.Thread(target=keep_kb_fresh, name="kb-refresh", daemon=True).start()
+    http_targets = [(f"{CONTROLLER_BASE_URL}/models", PROXY_URL)] if controller_client else []
+    warm_up_task = asyncio.create_task(client_registry.warm_up([config_service.get().executor.model_name, 'gemini-2.5-flash'], http_targets))
+    if os.getenv("SINGLEFLIGHT_REDIS", "false").lower() in ("1", "true", "yes"):
+        singleflight.enable_redis(redis_client)
+
+    # Jobs are only popped while a slot is free, so a busy worker leaves queued jobs to the others.
+    # Chat jobs are served before map tasks of bulk jobs.
+    concurrency = int(os.getenv("WORKER_CONCURRENCY", "4"))
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    logger.info(f"Processing up to {concurrency} jobs concurrently.")
+
+    while True:
+        await slots.acquire()
+        try:
+            popped = await asyncio.to_thread(redis_client.brpop, ["job_queue", BULK_TASK_QUEUE], timeout=5)
         except Exception as e:
+            slots.release()
             logger.error(f"An error occurred in the main worker loop: {e}", exc_info=True)
-            time.sleep(5)
+            await asyncio.sleep(5)
+            continue
+        if not popped:
+            slots.release()
+            continue
+        queue, item = popped
+        task = asyncio.create_task(run_bulk_task(redis_client, item) if queue == BULK_TASK_QUEUE else run_job(redis_client, item))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
 
 if __name__ == "__main__":
     asyncio.run(main_worker_loop())